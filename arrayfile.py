@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+
+
+MAGIC = b"CGPARRAY"
+ALIGNMENT = 64
+
+
+def _align(position):
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_arrays(file_path, arrays, meta=None):
+    # plik: MAGIC, długość nagłówka (uint64), nagłówek JSON, a potem tablice wyrównane do 64 bajtów,
+    # dzięki czemu każdą z nich można później otworzyć przez np.memmap bez kopiowania
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    entries = {}
+    header = b""
+    # długość nagłówka zależy od offsetów, więc liczymy je, aż się ustabilizują
+    for _ in range(4):
+        position = _align(len(MAGIC) + 8 + len(header))
+        entries = {}
+        for name, array in arrays.items():
+            entries[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": position}
+            position = _align(position + array.nbytes)
+        new_header = json.dumps({"meta": meta or {}, "arrays": entries}).encode("utf-8")
+        if len(new_header) == len(header):
+            break
+        header = new_header
+
+    with open(file_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(entries[name]["offset"])
+            f.write(array.tobytes())
+
+
+def read_meta(file_path):
+    with open(file_path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{file_path} is not an array file')
+        header_length = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        return json.loads(f.read(header_length).decode("utf-8"))
+
+
+def load_arrays(file_path, mmap=True):
+    header = read_meta(file_path)
+    arrays = {}
+    for name, entry in header["arrays"].items():
+        dtype = np.dtype(entry["dtype"])
+        shape = tuple(entry["shape"])
+        if mmap and int(np.prod(shape)) > 0:
+            arrays[name] = np.memmap(file_path, dtype=dtype, mode="r", offset=entry["offset"], shape=shape)
+        else:
+            with open(file_path, "rb") as f:
+                f.seek(entry["offset"])
+                count = int(np.prod(shape))
+                arrays[name] = np.fromfile(f, dtype=dtype, count=count).reshape(shape)
+    return header["meta"], arrays
@@ -0,0 +1,62 @@
+import argparse
+import time
+
+import numpy as np
+
+from offscreen import OffscreenRenderer, orbit_camera_path
+from scene_generator import generate_cube_grid, scene_bounds
+import main
+
+
+def frame_time_summary(frame_times):
+    frame_times = np.asarray(frame_times, dtype=np.float64)
+    total = frame_times.sum()
+    return {
+        "frames": len(frame_times),
+        "fps": len(frame_times) / total if total > 0 else float("inf"),
+        "p50_ms": np.percentile(frame_times, 50) * 1000,
+        "p95_ms": np.percentile(frame_times, 95) * 1000,
+        "p99_ms": np.percentile(frame_times, 99) * 1000,
+    }
+
+
+def run_benchmark(grid_sizes, frame_count, modes=("edges", "filled")):
+    results = []
+    for grid_size in grid_sizes:
+        polygons = generate_cube_grid(grid_size, grid_size, grid_size)
+
+        start = time.perf_counter()
+        bsp_tree = main.FlatBSPTree.from_node(main.build_bsp_tree(polygons))
+        build_time = time.perf_counter() - start
+
+        renderer = OffscreenRenderer(polygons, bsp_tree)
+        low, high = scene_bounds(polygons)
+        center = (low + high) / 2
+        radius = max(np.linalg.norm(high - low), 1.0)
+        camera_path = orbit_camera_path(center, radius, frame_count, height=radius / 3)
+
+        for mode in modes:
+            filled = mode != "edges"
+            backend = "zbuffer" if mode == "zbuffer" else "bsp"
+            renderer.render(camera_path[:1], filled, backend)  # rozgrzewka
+            summary = frame_time_summary(renderer.render(camera_path, filled, backend))
+            summary.update(polygons=len(polygons), mode=mode, build_s=build_time)
+            results.append(summary)
+    return results
+
+
+def print_results(results):
+    print(f'{"polygons":>9} {"mode":>7} {"build s":>8} {"fps":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+    for r in results:
+        print(f'{r["polygons"]:>9} {r["mode"]:>7} {r["build_s"]:>8.3f} {r["fps"]:>8.1f} '
+              f'{r["p50_ms"]:>8.2f} {r["p95_ms"]:>8.2f} {r["p99_ms"]:>8.2f}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offscreen frame-time benchmark for main.py render modes")
+    parser.add_argument("--grid", type=int, nargs="+", default=[1, 2, 3, 4], help="cube grid edge lengths")
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--modes", nargs="+", default=["edges", "filled"], choices=["edges", "filled", "zbuffer"])
+    args = parser.parse_args()
+
+    print_results(run_benchmark(args.grid, args.frames, args.modes))
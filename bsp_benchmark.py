@@ -0,0 +1,185 @@
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+
+from bsptree import PLANE_EPSILON, BSPNode, BuildStats, FlatBSPTree, Polygon, build_tree_parallel
+from offscreen import orbit_camera_path
+from scene_generator import SCENE_KINDS, generate_cube_grid, generate_scene, scene_bounds
+
+
+def build_sequential(polygons, **options):
+    root = BSPNode([Polygon(p) for p in polygons])
+    root.build_tree(**options)
+    return root
+
+
+def same_tree(first, second):
+    return all(np.array_equal(getattr(first, name), getattr(second, name)) for name in FlatBSPTree.ARRAYS)
+
+
+def parallel_scaling_report(grid_sizes, worker_counts=(1, 2, 4, 8), threshold=500, strategy="first"):
+    results = []
+    for grid_size in grid_sizes:
+        polygons = generate_cube_grid(grid_size, grid_size, grid_size)
+
+        start = time.perf_counter()
+        reference = FlatBSPTree.from_node(build_sequential(polygons, strategy=strategy))
+        sequential_time = time.perf_counter() - start
+
+        for workers in worker_counts:
+            stats = BuildStats()
+            start = time.perf_counter()
+            root = build_tree_parallel([Polygon(p) for p in polygons], workers=workers, threshold=threshold,
+                                       stats=stats, strategy=strategy)
+            build_time = time.perf_counter() - start
+            results.append({
+                "polygons": len(polygons),
+                "workers": workers,
+                "build_s": build_time,
+                "speedup": sequential_time / build_time if build_time > 0 else float("inf"),
+                "nodes": stats.node_count,
+                "matches_sequential": same_tree(reference, FlatBSPTree.from_node(root)),
+            })
+    return results
+
+
+def print_scaling_report(results):
+    print(f'{"polygons":>9} {"workers":>8} {"build s":>9} {"speedup":>8} {"nodes":>8} {"same":>5}')
+    for r in results:
+        print(f'{r["polygons"]:>9} {r["workers"]:>8} {r["build_s"]:>9.3f} {r["speedup"]:>8.2f} '
+              f'{r["nodes"]:>8} {str(r["matches_sequential"]):>5}')
+
+
+def build_benchmark(kinds, polygon_counts, camera_count=8, strategy="first", seed=0, measure_memory=True,
+                    epsilon=PLANE_EPSILON):
+    # budowa i przechodzenie drzewa dla wygenerowanych scen; szczyt pamięci liczymy w osobnej budowie,
+    # bo tracemalloc wyraźnie ją spowalnia
+    results = []
+    for kind in kinds:
+        for polygon_count in polygon_counts:
+            polygons = generate_scene(kind, polygon_count, seed)
+
+            stats = BuildStats()
+            start = time.perf_counter()
+            root = build_sequential(polygons, strategy=strategy, stats=stats, epsilon=epsilon)
+            build_time = time.perf_counter() - start
+
+            peak_mb = None
+            if measure_memory:
+                tracemalloc.start()
+                build_sequential(polygons, strategy=strategy, epsilon=epsilon)
+                peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                tracemalloc.stop()
+
+            tree = FlatBSPTree.from_node(root)
+            low, high = scene_bounds(polygons)
+            center = (low + high) / 2
+            radius = max(np.linalg.norm(high - low), 1.0)
+            traverse_ms = []
+            node_traverse_ms = []
+            for position, front in orbit_camera_path(center, radius, camera_count, height=radius / 3):
+                start = time.perf_counter()
+                tree.traverse(position)
+                traverse_ms.append((time.perf_counter() - start) * 1000)
+                start = time.perf_counter()
+                root.traverse(position, front)
+                node_traverse_ms.append((time.perf_counter() - start) * 1000)
+
+            results.append({
+                "kind": kind,
+                "polygons": len(polygons),
+                "strategy": strategy,
+                "epsilon": epsilon,
+                "build_s": build_time,
+                "peak_mb": peak_mb,
+                "nodes": stats.node_count,
+                "max_depth": stats.max_depth,
+                "splits": stats.split_count,
+                "created_polygons": stats.created_polygons,
+                "coplanar": stats.coplanar_count,
+                "traverse_ms": traverse_ms,
+                "node_traverse_ms": node_traverse_ms,
+            })
+    return results
+
+
+def print_build_benchmark(results):
+    print(f'{"kind":>6} {"polygons":>9} {"build s":>9} {"peak MB":>8} {"nodes":>8} {"depth":>6} {"splits":>8} '
+          f'{"coplanar":>8} {"flat ms":>8} {"node ms":>8}')
+    for r in results:
+        peak = f'{r["peak_mb"]:>8.1f}' if r["peak_mb"] is not None else f'{"-":>8}'
+        print(f'{r["kind"]:>6} {r["polygons"]:>9} {r["build_s"]:>9.3f} {peak} {r["nodes"]:>8} {r["max_depth"]:>6} '
+              f'{r["splits"]:>8} {r.get("coplanar", 0):>8} {np.mean(r["traverse_ms"]):>8.2f} '
+              f'{np.mean(r["node_traverse_ms"]):>8.2f}')
+
+
+def save_results(results, file_path):
+    # klucze posortowane i jeden wynik na blok, żeby dwa zapisy dało się porównać zwykłym diffem
+    meta = {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S")}
+    with open(file_path, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=1, sort_keys=True)
+
+
+def compare_results(old_results, new_results, tolerance=0.1):
+    # wiersze (kind, polygons, metryka, stara, nowa, stosunek); liczby węzłów i podziałów powinny być równe,
+    # czasy i pamięć oznaczamy jako regresję, gdy wzrosły o więcej niż tolerance
+    old_by_key = {(r["kind"], r["polygons"], r["strategy"], r.get("epsilon")): r for r in old_results}
+    rows = []
+    for new in new_results:
+        old = old_by_key.get((new["kind"], new["polygons"], new["strategy"], new.get("epsilon")))
+        if old is None:
+            continue
+        for metric in ("build_s", "peak_mb", "traverse_ms", "node_traverse_ms", "nodes", "max_depth", "splits"):
+            old_value, new_value = old.get(metric), new.get(metric)
+            if old_value is None or new_value is None:
+                continue
+            if isinstance(old_value, list):
+                old_value, new_value = float(np.mean(old_value)), float(np.mean(new_value))
+            ratio = new_value / old_value if old_value else float("inf") if new_value else 1.0
+            regression = ratio != 1.0 if metric in ("nodes", "max_depth", "splits") else ratio > 1 + tolerance
+            rows.append((new["kind"], new["polygons"], metric, old_value, new_value, ratio, regression))
+    return rows
+
+
+def print_comparison(rows):
+    print(f'{"kind":>6} {"polygons":>9} {"metric":>17} {"old":>10} {"new":>10} {"ratio":>7}')
+    for kind, polygons, metric, old_value, new_value, ratio, regression in rows:
+        print(f'{kind:>6} {polygons:>9} {metric:>17} {old_value:>10.3f} {new_value:>10.3f} {ratio:>7.2f}'
+              + ("  <- regression" if regression else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BSP build benchmarks")
+    parser.add_argument("--grid", type=int, nargs="+", default=[4, 6, 8], help="cube grid edge lengths")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--threshold", type=int, default=500)
+    parser.add_argument("--strategy", default="first")
+    parser.add_argument("--suite", action="store_true",
+                        help="build/traverse benchmark on generated scenes instead of the parallel scaling report")
+    parser.add_argument("--kinds", nargs="+", default=sorted(SCENE_KINDS), choices=sorted(SCENE_KINDS))
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1000, 10000], help="polygon counts")
+    parser.add_argument("--cameras", type=int, default=8, help="camera positions on an orbit for traversal")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc build")
+    parser.add_argument("--epsilon", type=float, default=PLANE_EPSILON,
+                        help="plane thickness for classification, 0 for exact comparisons")
+    parser.add_argument("--output", help="save results as JSON")
+    parser.add_argument("--compare", help="JSON from an earlier run to compare against")
+    args = parser.parse_args()
+
+    if args.suite:
+        results = build_benchmark(args.kinds, args.counts, args.cameras, args.strategy, args.seed,
+                                  measure_memory=not args.no_memory, epsilon=args.epsilon)
+        print_build_benchmark(results)
+        if args.output:
+            save_results(results, args.output)
+        if args.compare:
+            with open(args.compare) as f:
+                print_comparison(compare_results(json.load(f)["results"], results))
+    else:
+        print_scaling_report(parallel_scaling_report(args.grid, args.workers, args.threshold, args.strategy))
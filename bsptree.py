@@ -1,111 +1,284 @@
+import logging
+import math
+import random
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
 import numpy as np
 
+from arrayfile import save_arrays, load_arrays
+from frustum import boxes_outside_frustum
+
+
+logger = logging.getLogger(__name__)
+
+FRONT = 0
+BACK = 1
+SPANNING = 2
+COPLANAR = 3
+
+PLANE_EPSILON = 1e-5    # połowa grubości płaszczyzny podziału: wierzchołki bliżej niż tyle leżą na płaszczyźnie
+
+SPLITTER_STRATEGIES = ("first", "random", "strided")
+
+BSP_FORMAT = "flat-bsp"
+BSP_FORMAT_VERSION = 3
+
+PVS_FORMAT = "bsp-pvs"
+PVS_FORMAT_VERSION = 2
+PVS_CHAIN_BUDGET = 100    # łańcuchy sprawdzane dla jednego portalu, zanim PVS przyjmie jego zgrubną widoczność
+
 
 class Polygon:
-    def __init__(self, vertices):
-        self.vertices = vertices
-        self.normal = self.calculate_normal()
+    # wierzchołki jako jedna tablica (k, 3); płaszczyzna policzona raz: normal jak dotąd (iloczyn wektorowy
+    # dwóch krawędzi), unit_normal i distance - postać n . x = d używana przez płaskie drzewo
+    __slots__ = ("vertices", "normal", "unit_normal", "distance", "source_id")
+
+    def __init__(self, vertices, normal=None):
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float64).reshape(-1, 3)
+        self.normal = self.calculate_normal() if normal is None else normal
+        length = np.linalg.norm(self.normal)
+        self.unit_normal = self.normal / length if length > 0 else self.normal
+        self.distance = np.dot(self.unit_normal, self.vertices[0])
+        self.source_id = None   # identyfikator wielokąta w DynamicBSPTree, dziedziczony przez fragmenty
 
     def calculate_normal(self):
-        v0 = np.array(self.vertices[0])
-        v1 = np.array(self.vertices[1])
-        v2 = np.array(self.vertices[2])
-        return np.cross(v1 - v0, v2 - v0)
+        # to samo co np.cross(v1 - v0, v2 - v0), ale na liczbach Pythona - kilka razy szybciej dla jednego wektora
+        v0, v1, v2 = self.vertices[:3].tolist()
+        ax, ay, az = v1[0] - v0[0], v1[1] - v0[1], v1[2] - v0[2]
+        bx, by, bz = v2[0] - v0[0], v2[1] - v0[1], v2[2] - v0[2]
+        return np.array([ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx])
+
+
+def signed_distances(points, origins, normals):
+    # (p - o) . n rozpisane na składowe, żeby pojedynczy wielokąt i cała paczka dawały identyczne wyniki
+    diff = points - origins
+    return diff[..., 0] * normals[..., 0] + diff[..., 1] * normals[..., 1] + diff[..., 2] * normals[..., 2]
+
+
+def snap_distances(distances, epsilon=PLANE_EPSILON):
+    # odległości od płaszczyzny o jednostkowej normalnej; wierzchołki bliżej niż epsilon dostają 0, więc
+    # prawie współpłaszczyznowe wielokąty nie są dzielone na cienkie paski
+    if epsilon > 0:
+        distances = np.where(np.abs(distances) <= epsilon, 0.0, distances)
+    return distances
+
+
+def classify_distances(distances, offsets):
+    # strony wielokątów (CSR) na podstawie odległości ich wierzchołków od płaszczyzny: FRONT gdy żaden
+    # wierzchołek nie leży za płaszczyzną, BACK gdy żaden nie leży przed nią, COPLANAR gdy wszystkie leżą na niej
+    sides = np.full(len(offsets) - 1, SPANNING, dtype=np.int8)
+    if len(sides) == 0:
+        return sides
+    has_front = np.logical_or.reduceat(distances > 0, offsets[:-1])
+    has_back = np.logical_or.reduceat(distances < 0, offsets[:-1])
+    sides[~has_back] = FRONT
+    sides[has_back & ~has_front] = BACK
+    sides[~has_back & ~has_front] = COPLANAR
+    return sides
+
+
+def split_by_plane(vertices, offsets, distances):
+    # dzieli wielokąty (CSR) płaszczyzną, od której wierzchołki mają podane odległości; wierzchołek leżący
+    # na płaszczyźnie należy do obu części; zwraca (front_vertices, front_offsets, back_vertices, back_offsets)
+    polygon_count = len(offsets) - 1
+    next_vertex = np.arange(1, len(vertices) + 1)
+    if polygon_count > 0:
+        next_vertex[offsets[1:] - 1] = offsets[:-1]
+    next_distances = distances[next_vertex] if len(vertices) else distances
+    crossing = distances * next_distances < 0
+    current = vertices[crossing]
+    t = distances[crossing] / (distances[crossing] - next_distances[crossing])
+    intersections = current + t[:, None] * (vertices[next_vertex[crossing]] - current)
+
+    parts = []
+    for keep in (distances >= 0, distances <= 0):
+        emitted = keep.astype(np.int64) + crossing
+        end = np.cumsum(emitted)
+        start = end - emitted
+        part = np.empty((end[-1] if len(end) else 0, 3), dtype=np.float64)
+        part[start[keep]] = vertices[keep]
+        part[start[crossing] + keep[crossing]] = intersections
+        part_offsets = np.zeros(polygon_count + 1, dtype=np.int64)
+        if polygon_count > 0:
+            part_offsets[1:] = end[offsets[1:] - 1]
+        parts += [part, part_offsets]
+    return tuple(parts)
+
+
+def polygon_normals(vertices, offsets):
+    first = offsets[:-1]
+    return np.cross(vertices[first + 1] - vertices[first], vertices[first + 2] - vertices[first])
+
+
+def unit_normals(normals):
+    # jak Polygon.unit_normal: zerowa normalna (zdegenerowany wielokąt) zostaje zerowa
+    lengths = np.linalg.norm(normals, axis=-1)
+    return normals / np.where(lengths > 0, lengths, 1)[..., None]
+
+
+def concat_ranges(starts, counts):
+    # sklejone przedziały starts[i]:starts[i] + counts[i]
+    ends = np.cumsum(counts)
+    return np.repeat(starts - ends + counts, counts) + np.arange(ends[-1] if len(ends) else 0)
+
+
+class PolygonBatch:
+    # wielokąty jako tablice: wierzchołki wielokąta i to vertices[offsets[i]:offsets[i + 1]], normals jak
+    # Polygon.normal, source_ids z DynamicBSPTree (-1 gdy brak), originals - indeks wielokąta wejściowego
+    # albo -1 dla fragmentu powstałego z podziału
+    def __init__(self, vertices, offsets, normals, source_ids, originals):
+        self.vertices = vertices
+        self.offsets = offsets
+        self.normals = normals
+        self.source_ids = source_ids
+        self.originals = originals
+
+    @classmethod
+    def from_polygons(cls, polygons):
+        counts = np.array([len(polygon.vertices) for polygon in polygons], dtype=np.int64)
+        offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        vertices = (np.concatenate([polygon.vertices for polygon in polygons]) if polygons
+                    else np.zeros((0, 3), dtype=np.float64))
+        normals = np.array([polygon.normal for polygon in polygons], dtype=np.float64).reshape(-1, 3)
+        source_ids = np.array([-1 if polygon.source_id is None else polygon.source_id for polygon in polygons],
+                              dtype=np.int64)
+        return cls(vertices, offsets, normals, source_ids, np.arange(len(polygons)))
+
+    @classmethod
+    def concat(cls, batches):
+        offsets = [np.zeros(1, dtype=np.int64)]
+        total = 0
+        for batch in batches:
+            offsets.append(batch.offsets[1:] + total)
+            total += batch.offsets[-1]
+        return cls(np.concatenate([batch.vertices for batch in batches]), np.concatenate(offsets),
+                   np.concatenate([batch.normals for batch in batches]),
+                   np.concatenate([batch.source_ids for batch in batches]),
+                   np.concatenate([batch.originals for batch in batches]))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def vertex_counts(self):
+        return np.diff(self.offsets)
+
+    def vertex_ids(self, polygon_ids):
+        return concat_ranges(self.offsets[polygon_ids], self.vertex_counts[polygon_ids])
+
+    def take(self, polygon_ids):
+        offsets = np.zeros(len(polygon_ids) + 1, dtype=np.int64)
+        np.cumsum(self.vertex_counts[polygon_ids], out=offsets[1:])
+        return PolygonBatch(self.vertices[self.vertex_ids(polygon_ids)], offsets, self.normals[polygon_ids],
+                            self.source_ids[polygon_ids], self.originals[polygon_ids])
+
+    def polygon(self, i, inputs):
+        # wielokąt wejściowy bez zmian albo nowy obiekt dla fragmentu
+        if self.originals[i] >= 0:
+            return inputs[self.originals[i]]
+        polygon = Polygon(self.vertices[self.offsets[i]:self.offsets[i + 1]].copy(), self.normals[i].copy())
+        if self.source_ids[i] >= 0:
+            polygon.source_id = int(self.source_ids[i])
+        return polygon
+
+
+def plane_polygon(normal, distance):
+    # trójkąt leżący na płaszczyźnie n . x = d, z normalną skierowaną tak jak n
+    normal = np.asarray(normal, dtype=np.float64)
+    origin = normal * distance
+    axis = np.zeros(3)
+    axis[np.argmin(np.abs(normal))] = 1
+    u = np.cross(normal, axis)
+    u /= np.linalg.norm(u)
+    v = np.cross(normal, u)
+    return Polygon(np.array([origin, origin + u, origin + v]))
+
+
+class BuildStats:
+    def __init__(self):
+        self.node_count = 0
+        self.max_depth = 0
+        self.depth_sum = 0
+        self.split_count = 0        # liczba podzielonych wielokątów
+        self.created_polygons = 0   # liczba fragmentów powstałych z podziałów
+        self.coplanar_count = 0     # wielokąty dołączone do węzła o tej samej płaszczyźnie zamiast nowego węzła
+
+    @property
+    def avg_depth(self):
+        if self.node_count == 0:
+            return 0.0
+        return self.depth_sum / self.node_count
+
+    def merge(self, other):
+        self.node_count += other.node_count
+        self.depth_sum += other.depth_sum
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.split_count += other.split_count
+        self.created_polygons += other.created_polygons
+        self.coplanar_count += other.coplanar_count
+
+    def add_node(self, depth):
+        self.node_count += 1
+        self.depth_sum += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def __str__(self):
+        return (f'nodes: {self.node_count}, max depth: {self.max_depth}, avg depth: {self.avg_depth:.2f}, '
+                f'splits: {self.split_count}, polygons created by splitting: {self.created_polygons}, '
+                f'coplanar: {self.coplanar_count}')
 
 
 class BSPNode:
+    # po zbudowaniu węzeł trzyma w polygons wielokąty leżące na jego płaszczyźnie (z dokładnością do
+    # epsilon), pierwszy z nich to partition_plane; lista wszystkich wielokątów poddrzewa jest potrzebna
+    # wyłącznie przed budową
     def __init__(self, polygons):
         self.polygons = polygons
         self.front = None
         self.back = None
         self.partition_plane = None
+        self.removed = False    # wszystkie wielokąty węzła usunięte - płaszczyzna nadal dzieli przestrzeń
 
-    def build_tree(self):
+    def build_tree(self, strategy="first", sample_size=8, split_weight=8.0, balance_weight=1.0, seed=0,
+                   stats=None, depth=0, epsilon=PLANE_EPSILON):
         if len(self.polygons) == 0:
             return
+        build_subtrees([(self, depth)], strategy, sample_size, split_weight, balance_weight, seed, stats,
+                       epsilon=epsilon)
 
-        # wybieramy pierwszy wielokąt jako płaszczyzna podziału
-        self.partition_plane = self.polygons[0]
+    def partition(self, strategy="first", sample_size=8, split_weight=8.0, balance_weight=1.0, seed=0,
+                  stats=None, depth=0, epsilon=PLANE_EPSILON):
+        # wybiera płaszczyznę podziału i tworzy węzły dzieci, jeszcze bez budowania ich poddrzew
+        build_subtrees([(self, depth)], strategy, sample_size, split_weight, balance_weight, seed, stats,
+                       max_levels=1, epsilon=epsilon)
 
-        front_polygons = []
-        back_polygons = []
+    def plane_distances(self, polygon, epsilon=PLANE_EPSILON):
+        plane = self.partition_plane
+        return snap_distances(signed_distances(polygon.vertices, plane.vertices[0], plane.unit_normal), epsilon)
 
-        for polygon in self.polygons[1:]:
-            if self.is_front(polygon):
-                print(f'Polygon {polygon.vertices} is in front of polygon {self.partition_plane.vertices} with normal to {self.partition_plane.normal}')
-                front_polygons.append(polygon)
-            elif self.is_back(polygon):
-                print(
-                    f'Polygon {polygon.vertices} is in behind polygon {self.partition_plane.vertices} with normal to {self.partition_plane.normal}')
-                back_polygons.append(polygon)
-            else:
-                # wielokąt przecina płaszczyznę podziału
-                # dzielimy wielokąt na 2 części
-                print(f'splitting {polygon.vertices}')
-                front_part, back_part = self.split_polygon(polygon)
-                if front_part:
-                    print(f'added front after split {front_part.vertices}')
-                    front_polygons.append(front_part)
-                if back_part:
-                    print(f'added back after split {back_part.vertices}')
-                    back_polygons.append(back_part)
-
-        # rekurencyjnie budujemy drzewo BSP
-        if front_polygons:
-            self.front = BSPNode(front_polygons)
-            self.front.build_tree()
-
-        if back_polygons:
-            self.back = BSPNode(back_polygons)
-            self.back.build_tree()
-
-    def is_front(self, polygon):
-        for vertex in polygon.vertices:
-            if np.dot(np.array(vertex) - np.array(self.partition_plane.vertices[0]), self.partition_plane.normal) < 0:
-                return False
-        return True
-
-    def is_back(self, polygon):
-        for vertex in polygon.vertices:
-            if np.dot(np.array(vertex) - np.array(self.partition_plane.vertices[0]), self.partition_plane.normal) > 0:
-                return False
-        return True
-
-    def split_polygon(self, polygon):
-        front_part = []
-        back_part = []
-
-        for i, vertex in enumerate(polygon.vertices):
-            next_index = (i + 1) % len(polygon.vertices)
-
-            current_vertex = np.array(vertex)
-            next_vertex = np.array(polygon.vertices[next_index])
-
-            # sprawdzenie, czy krawędź przecina płaszczyznę podziału
-            current_dot = np.dot(current_vertex - np.array(self.partition_plane.vertices[0]),
-                                 self.partition_plane.normal)
-            next_dot = np.dot(next_vertex - np.array(self.partition_plane.vertices[0]), self.partition_plane.normal)
-
-            if current_dot >= 0:
-                front_part.append(current_vertex)
-            else:
-                back_part.append(current_vertex)
-
-            # jeśli punkty na obu końcach krawędzi należą do różnych stron płaszczyzny, znajdź punkt przecięcia
-            if current_dot * next_dot < 0:
-                # obliczenie punktu przecięcia z płaszczyzną podziału
-                t = current_dot / (current_dot - next_dot)
-                intersection_point = current_vertex + t * (next_vertex - current_vertex)
+    def is_front(self, polygon, epsilon=PLANE_EPSILON):
+        return not np.any(self.plane_distances(polygon, epsilon) < 0)
 
-                front_part.append(intersection_point)
-                back_part.append(intersection_point)
+    def is_back(self, polygon, epsilon=PLANE_EPSILON):
+        return not np.any(self.plane_distances(polygon, epsilon) > 0)
 
-        if front_part and back_part:
-            return Polygon(front_part), Polygon(back_part)
-        else:
+    def split_polygon(self, polygon, distances=None):
+        if distances is None:
+            distances = self.plane_distances(polygon)
+        front_vertices, _, back_vertices, _ = split_by_plane(polygon.vertices, np.array([0, len(distances)]),
+                                                             distances)
+        if len(front_vertices) < 3 or len(back_vertices) < 3:
             return None, None
+        front_polygon, back_polygon = Polygon(front_vertices), Polygon(back_vertices)
+        front_polygon.source_id = back_polygon.source_id = polygon.source_id
+        return front_polygon, back_polygon
 
     def traverse(self, camera_pos, camera_front):
+        # wielokąty węzła wypisujemy od ostatniego, żeby odwrócony wynik zgadzał się z FlatBSPTree.traverse
+        # i TraversalCache także wewnątrz węzła
         visible_polygons = []
         invisible_polygons = []
 
@@ -117,13 +290,15 @@ class BSPNode:
         if dot > 0:
             if self.front:
                 visible_polygons.extend(self.front.traverse(camera_pos, camera_front))
-            visible_polygons.append(self.partition_plane)
+            if not self.removed:
+                visible_polygons.extend(reversed(self.polygons))
             if self.back:
                 visible_polygons.extend(self.back.traverse(camera_pos, camera_front))
         else:
             if self.back:
                 invisible_polygons.extend(self.back.traverse(camera_pos, camera_front))
-            invisible_polygons.append(self.partition_plane)
+            if not self.removed:
+                invisible_polygons.extend(reversed(self.polygons))
             if self.front:
                 invisible_polygons.extend(self.front.traverse(camera_pos, camera_front))
 
@@ -141,4 +316,1458 @@ class BSPNode:
         if self.back:
             self.back.print_tree(indent + 1)
         else:
-            print(prefix + "    (Empty)")
\ No newline at end of file
+            print(prefix + "    (Empty)")
+
+
+def choose_splitters(batch, node_start, depths, strategy, sample_size, split_weight, balance_weight, seed,
+                     epsilon=PLANE_EPSILON, max_pairs=1 << 21):
+    # płaszczyzny podziału dla wszystkich węzłów poziomu naraz; wielokąty węzła i to node_start[i]:node_start[i + 1];
+    # koszt kandydata to ważona liczba podziałów i różnica liczności stron (wielokąty współpłaszczyznowe nie
+    # trafiają do żadnej), wygrywa pierwszy najtańszy
+    if strategy not in SPLITTER_STRATEGIES:
+        raise ValueError(f'Unknown splitter strategy: {strategy}')
+    counts = np.diff(node_start)
+    chosen = node_start[:-1].copy()
+    if strategy == "first":
+        return chosen
+
+    candidate_nodes = []
+    candidate_local = []
+    small = np.flatnonzero((counts > 2) & (counts <= sample_size))
+    candidate_nodes.append(np.repeat(small, counts[small]))
+    candidate_local.append(concat_ranges(np.zeros(len(small), dtype=np.int64), counts[small]))
+    large = np.flatnonzero((counts > 2) & (counts > sample_size))
+    if strategy == "random":
+        for node in large.tolist():
+            # generator zależy tylko od węzła, więc wynik nie zależy od kolejności budowania poddrzew
+            rng = random.Random(f'{seed}:{depths[node]}:{counts[node]}')
+            candidate_nodes.append(np.full(sample_size, node))
+            candidate_local.append(np.array(rng.sample(range(counts[node]), sample_size)))
+    else:
+        candidate_nodes.append(np.repeat(large, sample_size))
+        candidate_local.append((np.tile(np.arange(sample_size), len(large))
+                                * np.repeat(counts[large] // sample_size, sample_size)))
+    candidate_nodes = np.concatenate(candidate_nodes).astype(np.int64)
+    candidate_local = np.concatenate(candidate_local).astype(np.int64)
+    if len(candidate_nodes) == 0:
+        return chosen
+    order = np.argsort(candidate_nodes, kind="stable")
+    candidate_nodes = candidate_nodes[order]
+    candidate_polygons = node_start[candidate_nodes] + candidate_local[order]
+
+    # każdy kandydat klasyfikuje wszystkie wielokąty swojego węzła; paczkami, żeby ograniczyć pamięć
+    vertex_counts = batch.vertex_counts
+    node_vertices = batch.offsets[node_start[1:]] - batch.offsets[node_start[:-1]]
+    pair_vertices = np.cumsum(node_vertices[candidate_nodes])
+    scores = np.empty(len(candidate_nodes), dtype=np.float64)
+    first = 0
+    while first < len(candidate_nodes):
+        last = max(int(np.searchsorted(pair_vertices, pair_vertices[first] - node_vertices[candidate_nodes[first]]
+                                       + max_pairs, side="right")), first + 1)
+        nodes = candidate_nodes[first:last]
+        planes = candidate_polygons[first:last]
+        pair_polygons = concat_ranges(node_start[nodes], counts[nodes])
+        pair_candidates = np.repeat(np.arange(last - first), counts[nodes])
+        pair_counts = vertex_counts[pair_polygons]
+        pair_offsets = np.zeros(len(pair_polygons) + 1, dtype=np.int64)
+        np.cumsum(pair_counts, out=pair_offsets[1:])
+        vertex_candidates = np.repeat(pair_candidates, pair_counts)
+        distances = snap_distances(signed_distances(batch.vertices[batch.vertex_ids(pair_polygons)],
+                                                    batch.vertices[batch.offsets[planes]][vertex_candidates],
+                                                    unit_normals(batch.normals[planes])[vertex_candidates]), epsilon)
+        sides = classify_distances(distances, pair_offsets)
+        other = pair_polygons != planes[pair_candidates]
+        side_counts = [np.bincount(pair_candidates[other & (sides == side)], minlength=last - first)
+                       for side in (FRONT, BACK, SPANNING)]
+        scores[first:last] = (split_weight * side_counts[SPANNING]
+                              + balance_weight * np.abs(side_counts[FRONT] - side_counts[BACK]))
+        first = last
+
+    node_starts = np.flatnonzero(np.r_[True, candidate_nodes[1:] != candidate_nodes[:-1]])
+    best_scores = np.minimum.reduceat(scores, node_starts)
+    is_best = scores == np.repeat(best_scores, np.diff(np.r_[node_starts, len(scores)]))
+    best = np.flatnonzero(is_best)
+    _, first_best = np.unique(candidate_nodes[best], return_index=True)
+    best = best[first_best]
+    chosen[candidate_nodes[best]] = candidate_polygons[best]
+    return chosen
+
+
+def build_subtrees(roots, strategy="first", sample_size=8, split_weight=8.0, balance_weight=1.0, seed=0,
+                   stats=None, max_levels=None, epsilon=PLANE_EPSILON):
+    # buduje poddrzewa wszystkich węzłów z roots = [(węzeł, głębokość)] poziom po poziomie: wielokąty całego
+    # poziomu są w jednej paczce tablic, więc klasyfikacja i podziały to kilka operacji NumPy na poziom,
+    # a nie pętla po wierzchołkach w każdym węźle; wynik jest taki sam jak przy budowie węzeł po węźle.
+    # Płaszczyzny mają grubość 2 * epsilon: wielokąty leżące na płaszczyźnie węzła zostają w nim, zamiast
+    # tworzyć kolejne węzły z tą samą płaszczyzną
+    inputs = [polygon for node, _ in roots for polygon in node.polygons]
+    batch = PolygonBatch.from_polygons(inputs)
+    nodes = [node for node, _ in roots]
+    depths = np.array([depth for _, depth in roots], dtype=np.int64)
+    polygon_nodes = np.repeat(np.arange(len(nodes)), [len(node.polygons) for node in nodes])
+
+    level = 0
+    while nodes and (max_levels is None or level < max_levels):
+        node_start = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(polygon_nodes, minlength=len(nodes)), out=node_start[1:])
+        chosen = choose_splitters(batch, node_start, depths, strategy, sample_size, split_weight, balance_weight,
+                                  seed, epsilon)
+        for node, polygon_id, depth in zip(nodes, chosen.tolist(), depths.tolist()):
+            node.partition_plane = batch.polygon(polygon_id, inputs)
+            node.polygons = [node.partition_plane]
+            if stats is not None:
+                stats.add_node(depth)
+
+        # odległości wszystkich wierzchołków od płaszczyzny ich węzła
+        vertex_nodes = np.repeat(polygon_nodes, batch.vertex_counts)
+        distances = snap_distances(signed_distances(batch.vertices, batch.vertices[batch.offsets[chosen]][vertex_nodes],
+                                                    unit_normals(batch.normals[chosen])[vertex_nodes]), epsilon)
+        sides = classify_distances(distances, batch.offsets)
+        sides[chosen] = -1
+        kept = np.flatnonzero((sides == FRONT) | (sides == BACK))
+        spanning = np.flatnonzero(sides == SPANNING)
+        coplanar = np.flatnonzero(sides == COPLANAR)
+        for polygon_id, node_id in zip(coplanar.tolist(), polygon_nodes[coplanar].tolist()):
+            nodes[node_id].polygons.append(batch.polygon(polygon_id, inputs))
+        if stats is not None:
+            stats.split_count += len(spanning)
+            stats.created_polygons += 2 * len(spanning)
+            stats.coplanar_count += len(coplanar)
+        if logger.isEnabledFor(logging.DEBUG):
+            for polygon_id in spanning.tolist():
+                logger.debug('splitting %s', batch.vertices[batch.offsets[polygon_id]:batch.offsets[polygon_id + 1]])
+
+        # fragmenty podzielonych wielokątów
+        spanning_batch = batch.take(spanning)
+        front_vertices, front_offsets, back_vertices, back_offsets = split_by_plane(
+            spanning_batch.vertices, spanning_batch.offsets, distances[batch.vertex_ids(spanning)])
+        no_originals = np.full(len(spanning), -1, dtype=np.int64)
+        fragments = [PolygonBatch(vertices, offsets, polygon_normals(vertices, offsets), spanning_batch.source_ids,
+                                  no_originals)
+                     for vertices, offsets in ((front_vertices, front_offsets), (back_vertices, back_offsets))]
+
+        # następny poziom: dziecko 2 * węzeł (front) albo 2 * węzeł + 1 (back); w dziecku kolejność jak w rodzicu,
+        # fragmenty na miejscu wielokąta, z którego powstały
+        polygon_count = len(batch)
+        entries = np.concatenate([kept, polygon_count + np.arange(len(spanning)),
+                                  polygon_count + len(spanning) + np.arange(len(spanning))])
+        entry_children = np.concatenate([2 * polygon_nodes[kept] + (sides[kept] == BACK),
+                                         2 * polygon_nodes[spanning], 2 * polygon_nodes[spanning] + 1])
+        entry_positions = np.concatenate([kept, spanning, spanning])
+        order = np.lexsort((entry_positions, entry_children))
+        batch = PolygonBatch.concat([batch] + fragments).take(entries[order])
+        children, polygon_nodes = np.unique(entry_children[order], return_inverse=True)
+
+        next_nodes = []
+        for child in children.tolist():
+            node = BSPNode([])
+            if child & 1:
+                nodes[child >> 1].back = node
+            else:
+                nodes[child >> 1].front = node
+            next_nodes.append(node)
+        nodes = next_nodes
+        depths = depths[children >> 1] + 1
+        level += 1
+
+    # przerwane po max_levels: dzieci dostają swoje wielokąty do dalszej budowy
+    node_start = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(polygon_nodes, minlength=len(nodes)), out=node_start[1:])
+    for node, start, end in zip(nodes, node_start[:-1].tolist(), node_start[1:].tolist()):
+        node.polygons = [batch.polygon(polygon_id, inputs) for polygon_id in range(start, end)]
+
+
+class FlatBSPTree:
+    # drzewo BSP w postaci płaskich tablic NumPy: węzeł i ma płaszczyznę (normals[i], distances[i]),
+    # dzieci front[i] / back[i] (-1 gdy brak) i wielokąty first_polygon[i]:first_polygon[i + 1];
+    # węzły są ponumerowane w kolejności preorder, więc poddrzewo węzła i to węzły i:subtree_end[i],
+    # a bounds_min[i] / bounds_max[i] to prostopadłościan otaczający wszystkie wielokąty tego poddrzewa
+    def __init__(self, normals, distances, front, back, first_polygon, vertices, vertex_offsets,
+                 bounds_min, bounds_max, subtree_end):
+        self.normals = normals
+        self.distances = distances
+        self.front = front
+        self.back = back
+        self.first_polygon = first_polygon
+        self.vertices = vertices
+        self.vertex_offsets = vertex_offsets
+        self.bounds_min = bounds_min
+        self.bounds_max = bounds_max
+        self.subtree_end = subtree_end
+
+        # statystyki odrzucania z ostatniego przejścia
+        self.culled_nodes = 0
+        self.culled_polygons = 0
+
+    @classmethod
+    def from_node(cls, root):
+        nodes = []
+        if root is not None and root.partition_plane is not None:
+            # numeracja węzłów w kolejności preorder, bez rekurencji
+            stack = [root]
+            while stack:
+                node = stack.pop()
+                nodes.append(node)
+                if node.back is not None and node.back.partition_plane is not None:
+                    stack.append(node.back)
+                if node.front is not None and node.front.partition_plane is not None:
+                    stack.append(node.front)
+        index = {id(node): i for i, node in enumerate(nodes)}
+
+        node_count = len(nodes)
+        normals = np.zeros((node_count, 3), dtype=np.float64)
+        distances = np.zeros(node_count, dtype=np.float64)
+        front = np.full(node_count, -1, dtype=np.int32)
+        back = np.full(node_count, -1, dtype=np.int32)
+        # wielokąty węzła to jego płaszczyzna i wielokąty współpłaszczyznowe; węzeł z usuniętymi wielokątami
+        # (DynamicBSPTree) zachowuje płaszczyznę, ale nie ma wielokątów
+        buckets = [[] if node.removed else node.polygons for node in nodes]
+        first_polygon = np.zeros(node_count + 1, dtype=np.int32)
+        np.cumsum(np.array([len(bucket) for bucket in buckets], dtype=np.int64), out=first_polygon[1:])
+
+        for i, node in enumerate(nodes):
+            plane = node.partition_plane
+            normals[i] = plane.unit_normal
+            distances[i] = plane.distance
+            if node.front is not None:
+                front[i] = index.get(id(node.front), -1)
+            if node.back is not None:
+                back[i] = index.get(id(node.back), -1)
+
+        polygons = [polygon for bucket in buckets for polygon in bucket]
+        vertex_offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+        np.cumsum(np.array([len(polygon.vertices) for polygon in polygons], dtype=np.int64), out=vertex_offsets[1:])
+        vertices = (np.concatenate([polygon.vertices for polygon in polygons]) if polygons
+                    else np.zeros((0, 3), dtype=np.float64))
+
+        bounds_min, bounds_max, subtree_end = cls.subtree_bounds(front, back, first_polygon, vertices, vertex_offsets)
+        return cls(normals, distances, front, back, first_polygon, vertices, vertex_offsets,
+                   bounds_min, bounds_max, subtree_end)
+
+    @staticmethod
+    def subtree_bounds(front, back, first_polygon, vertices, vertex_offsets):
+        node_count = len(front)
+        bounds_min = np.full((node_count, 3), np.inf)
+        bounds_max = np.full((node_count, 3), -np.inf)
+        subtree_end = np.arange(1, node_count + 1, dtype=np.int32)
+        if node_count == 0 or len(vertex_offsets) < 2:
+            return bounds_min, bounds_max, subtree_end
+
+        # prostopadłościany pojedynczych wielokątów, a potem węzłów
+        polygon_min = np.minimum.reduceat(vertices, vertex_offsets[:-1], axis=0)
+        polygon_max = np.maximum.reduceat(vertices, vertex_offsets[:-1], axis=0)
+        node_has_polygons = first_polygon[1:] > first_polygon[:-1]
+        nodes_with_polygons = np.flatnonzero(node_has_polygons)
+        bounds_min[nodes_with_polygons] = np.minimum.reduceat(polygon_min, first_polygon[:-1][node_has_polygons], axis=0)
+        bounds_max[nodes_with_polygons] = np.maximum.reduceat(polygon_max, first_polygon[:-1][node_has_polygons], axis=0)
+
+        # w preorder dzieci mają większe indeksy niż rodzic - wystarczy jedno przejście od końca
+        for i in range(node_count - 1, -1, -1):
+            for child in (front[i], back[i]):
+                if child >= 0:
+                    np.minimum(bounds_min[i], bounds_min[child], out=bounds_min[i])
+                    np.maximum(bounds_max[i], bounds_max[child], out=bounds_max[i])
+                    subtree_end[i] = max(subtree_end[i], subtree_end[child])
+        return bounds_min, bounds_max, subtree_end
+
+    ARRAYS = ("normals", "distances", "front", "back", "first_polygon", "vertices", "vertex_offsets",
+              "bounds_min", "bounds_max", "subtree_end")
+
+    def to_node(self):
+        # odtwarza drzewo obiektów BSPNode (np. żeby doczepić poddrzewo zbudowane w innym procesie)
+        if self.node_count == 0:
+            return BSPNode([])
+        front = self.front.tolist()
+        back = self.back.tolist()
+        first_polygon = self.first_polygon.tolist()
+        nodes = []
+        for i in range(self.node_count):
+            polygons = [Polygon(self.polygon_vertices(polygon_id).copy())
+                        for polygon_id in range(first_polygon[i], first_polygon[i + 1])]
+            node = BSPNode(polygons)
+            if polygons:
+                node.partition_plane = polygons[0]
+            else:
+                # węzeł bez wielokątów - odtwarzamy płaszczyznę trójkątem leżącym na niej
+                node.partition_plane = plane_polygon(self.normals[i], self.distances[i])
+                node.removed = True
+            nodes.append(node)
+        for i, node in enumerate(nodes):
+            if front[i] >= 0:
+                node.front = nodes[front[i]]
+            if back[i] >= 0:
+                node.back = nodes[back[i]]
+        return nodes[0]
+
+    def save(self, file_path, scene_hash=None):
+        meta = {"format": BSP_FORMAT, "version": BSP_FORMAT_VERSION, "scene_hash": scene_hash}
+        save_arrays(file_path, {name: getattr(self, name) for name in self.ARRAYS}, meta)
+
+    @classmethod
+    def load(cls, file_path, scene_hash=None, mmap=True):
+        # tablice są mapowane z pliku - strony są czytane dopiero przy pierwszym dostępie
+        meta, arrays = load_arrays(file_path, mmap=mmap)
+        if meta.get("format") != BSP_FORMAT or meta.get("version") != BSP_FORMAT_VERSION:
+            raise ValueError(f'{file_path}: unsupported BSP file version {meta.get("version")}')
+        if scene_hash is not None and meta.get("scene_hash") != scene_hash:
+            raise ValueError(f'{file_path}: BSP tree was built for a different scene')
+        missing = [name for name in cls.ARRAYS if name not in arrays]
+        if missing:
+            raise ValueError(f'{file_path}: missing arrays {missing}')
+        return cls(*(arrays[name] for name in cls.ARRAYS))
+
+    @property
+    def node_count(self):
+        return len(self.normals)
+
+    @property
+    def polygon_count(self):
+        return len(self.vertex_offsets) - 1
+
+    def polygon_vertices(self, polygon_id):
+        return self.vertices[self.vertex_offsets[polygon_id]:self.vertex_offsets[polygon_id + 1]]
+
+    def outside_frustum(self, frustum):
+        # węzły, których prostopadłościan leży w całości poza ostrosłupem widzenia
+        return boxes_outside_frustum(frustum, self.bounds_min, self.bounds_max)
+
+    def hidden_subtrees(self, visible_polygons):
+        # węzły, w których poddrzewie (numeracja preorder) nie ma żadnego wielokąta z maski visible_polygons
+        visible_count = np.zeros(self.polygon_count + 1, dtype=np.int64)
+        np.cumsum(visible_polygons, out=visible_count[1:])
+        return visible_count[self.first_polygon[self.subtree_end]] == visible_count[self.first_polygon[:-1]]
+
+    def traverse(self, camera_pos, out=None, frustum=None, visible_polygons=None):
+        # zwraca indeksy wielokątów od najdalszego do najbliższego, czyli odwróconą kolejność BSPNode.traverse;
+        # zamiast rekurencji używamy jawnego stosu: i >= 0 - odwiedź węzeł, ~i - wypisz wielokąty węzła;
+        # visible_polygons (maska z PVS) pomija niewidoczne wielokąty i poddrzewa bez widocznych wielokątów
+        polygon_count = self.polygon_count
+        if out is None:
+            out = np.empty(polygon_count, dtype=np.int32)
+        self.culled_nodes = 0
+        self.culled_polygons = 0
+        if self.node_count == 0:
+            return out[:0]
+
+        camera_pos = np.asarray(camera_pos, dtype=np.float64)
+        in_front = (self.normals @ camera_pos - self.distances > 0).tolist()
+        front = self.front.tolist()
+        back = self.back.tolist()
+        first_polygon = self.first_polygon.tolist()
+        culled = self.outside_frustum(frustum) if frustum is not None else None
+        if visible_polygons is not None:
+            subtree_hidden = self.hidden_subtrees(visible_polygons)
+            culled = subtree_hidden if culled is None else culled | subtree_hidden
+            visible_polygons = np.asarray(visible_polygons).tolist()
+        if culled is not None:
+            culled = culled.tolist()
+        subtree_end = self.subtree_end
+
+        position = polygon_count
+        stack = [0]
+        while stack:
+            i = stack.pop()
+            if i < 0:
+                i = ~i
+                # out jest wypełniane od końca, więc wielokąty węzła przeglądamy od ostatniego
+                for polygon_id in range(first_polygon[i + 1] - 1, first_polygon[i] - 1, -1):
+                    if visible_polygons is not None and not visible_polygons[polygon_id]:
+                        self.culled_polygons += 1
+                        continue
+                    position -= 1
+                    out[position] = polygon_id
+                continue
+            if culled is not None and culled[i]:
+                # całe poddrzewo poza ostrosłupem widzenia albo bez wielokątów widocznych z komórki kamery
+                end = int(subtree_end[i])
+                self.culled_nodes += end - i
+                self.culled_polygons += first_polygon[end] - first_polygon[i]
+                continue
+            if in_front[i]:
+                near_child, far_child = front[i], back[i]
+            else:
+                near_child, far_child = back[i], front[i]
+            if far_child >= 0:
+                stack.append(far_child)
+            stack.append(~i)
+            if near_child >= 0:
+                stack.append(near_child)
+
+        return out[position:]
+
+    def locate_cells(self, points):
+        # schodzi po drzewie dla wszystkich punktów naraz; komórka to puste miejsce na dziecko:
+        # 2 * i dla brakującego front[i], 2 * i + 1 dla brakującego back[i]
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        cells = np.full(len(points), -1, dtype=np.int64)
+        if self.node_count == 0:
+            return cells
+        current = np.zeros(len(points), dtype=np.int64)
+        active = np.arange(len(points))
+        while len(active) > 0:
+            nodes = current[active]
+            in_front = np.einsum("ij,ij->i", self.normals[nodes], points[active]) - self.distances[nodes] > 0
+            child = np.where(in_front, self.front[nodes], self.back[nodes])
+            leaf = child < 0
+            cells[active[leaf]] = 2 * nodes[leaf] + (~in_front[leaf])
+            current[active[~leaf]] = child[~leaf]
+            active = active[~leaf]
+        return cells
+
+
+class TraversalCache:
+    # kolejność od najdalszego do najbliższego zmienia się tylko wtedy, gdy kamera przejdzie przez którąś
+    # z płaszczyzn podziału; pamiętamy pełną kolejność, stronę kamery dla każdej płaszczyzny i początek fragmentu
+    # kolejności należącego do każdego poddrzewa. W kolejnych klatkach sprawdzamy tylko płaszczyzny bliższe niż
+    # droga przebyta przez kamerę od ostatniego pełnego sprawdzenia, a dla płaszczyzny, która zmieniła stronę,
+    # zamieniamy miejscami fragmenty jej dwóch poddrzew
+    def __init__(self, tree, refresh_fraction=0.25):
+        self.tree = tree
+        self.refresh_fraction = refresh_fraction
+        node_count = tree.node_count
+        first_polygon = np.asarray(tree.first_polygon, dtype=np.int64)
+        self.own_count = first_polygon[1:] - first_polygon[:-1]
+        self.subtree_count = first_polygon[np.asarray(tree.subtree_end)] - first_polygon[:-1]
+        self.node_of_polygon = np.repeat(np.arange(node_count), self.own_count)
+        self.order = np.empty(tree.polygon_count, dtype=np.int32)
+        self.segment_start = np.zeros(node_count, dtype=np.int64)
+        self.in_front = np.zeros(node_count, dtype=bool)
+        self.anchor = None
+        self.off_anchor = set()     # płaszczyzny, po których kamera jest teraz po innej stronie niż w punkcie odniesienia
+        self.retested = 0   # płaszczyzny sprawdzone w ostatniej klatce
+        self.flipped = 0    # płaszczyzny, które zmieniły stronę w ostatniej klatce
+
+    def rebuild(self, camera_pos):
+        # pełne przeliczenie: strony wszystkich płaszczyzn i kolejność w jednym przejściu preorder
+        tree = self.tree
+        self.refresh(camera_pos)
+        self.in_front = self.anchor_distances > 0
+        in_front = self.in_front.tolist()
+        front = tree.front.tolist()
+        back = tree.back.tolist()
+        first_polygon = tree.first_polygon.tolist()
+        subtree_count = self.subtree_count.tolist()
+        own_count = self.own_count.tolist()
+        segment_start = [0] * tree.node_count
+        for i in range(tree.node_count):
+            if in_front[i]:
+                near_child, far_child = front[i], back[i]
+            else:
+                near_child, far_child = back[i], front[i]
+            position = segment_start[i]
+            if far_child >= 0:
+                segment_start[far_child] = position
+                position += subtree_count[far_child]
+            self.order[position:position + own_count[i]] = range(first_polygon[i], first_polygon[i + 1])
+            if near_child >= 0:
+                segment_start[near_child] = position + own_count[i]
+        self.segment_start[:] = segment_start
+        self.retested = self.flipped = tree.node_count
+
+    def refresh(self, camera_pos):
+        # nowy punkt odniesienia: odległości kamery od wszystkich płaszczyzn, posortowane
+        self.anchor = camera_pos
+        self.off_anchor = set()
+        self.anchor_distances = self.tree.normals @ camera_pos - self.tree.distances
+        self.by_distance = np.argsort(np.abs(self.anchor_distances))
+        self.sorted_distances = np.abs(self.anchor_distances)[self.by_distance]
+
+    def update(self, camera_pos):
+        camera_pos = np.array(camera_pos, dtype=np.float64)
+        if self.tree.node_count == 0:
+            self.retested = self.flipped = 0
+            return self.order
+        if self.anchor is None:
+            self.rebuild(camera_pos)
+            return self.order
+
+        # normalne płaszczyzn są jednostkowe, więc odległość od płaszczyzny mogła się zmienić najwyżej
+        # o drogę kamery od punktu odniesienia; dalsze płaszczyzny mają stronę taką jak w punkcie odniesienia
+        moved = np.linalg.norm(camera_pos - self.anchor)
+        near_count = np.searchsorted(self.sorted_distances, moved, side="right")
+        if near_count > self.refresh_fraction * self.tree.node_count:
+            self.refresh(camera_pos)
+            candidates = np.arange(self.tree.node_count)
+            side = self.anchor_distances > 0
+        else:
+            candidates = self.by_distance[:near_count]
+            if self.off_anchor:
+                candidates = np.union1d(candidates, np.fromiter(self.off_anchor, dtype=np.int64))
+            side = self.tree.normals[candidates] @ camera_pos - self.tree.distances[candidates] > 0
+        self.retested = len(candidates)
+        flipped = candidates[side != self.in_front[candidates]]
+        self.flipped = len(flipped)
+        for i in flipped.tolist():
+            self.flip(i)
+        if self.anchor is not camera_pos:
+            self.off_anchor ^= set(flipped.tolist())
+        return self.order
+
+    def flip(self, i):
+        # [dalsze poddrzewo][wielokąty węzła][bliższe poddrzewo] -> [bliższe][wielokąty węzła][dalsze]
+        tree = self.tree
+        if self.in_front[i]:
+            near_child, far_child = tree.front[i], tree.back[i]
+        else:
+            near_child, far_child = tree.back[i], tree.front[i]
+        self.in_front[i] = not self.in_front[i]
+
+        start = self.segment_start[i]
+        far_count = self.subtree_count[far_child] if far_child >= 0 else 0
+        near_count = self.subtree_count[near_child] if near_child >= 0 else 0
+        own_count = self.own_count[i]
+        end = start + far_count + own_count + near_count
+        segment = self.order[start:end]
+        self.order[start:end] = np.concatenate([segment[far_count + own_count:],
+                                                segment[far_count:far_count + own_count],
+                                                segment[:far_count]])
+        if near_child >= 0:
+            self.segment_start[near_child:tree.subtree_end[near_child]] -= far_count + own_count
+        if far_child >= 0:
+            self.segment_start[far_child:tree.subtree_end[far_child]] += near_count + own_count
+
+    def traverse(self, camera_pos, frustum=None, visible_polygons=None):
+        # to samo co FlatBSPTree.traverse, ale z kolejności zapamiętanej w poprzednich klatkach
+        tree = self.tree
+        order = self.update(camera_pos)
+        tree.culled_nodes = 0
+        tree.culled_polygons = 0
+        if frustum is None and visible_polygons is None:
+            return order.copy()
+
+        keep = np.ones(tree.polygon_count, dtype=bool)
+        # poddrzewa pomijane przez FlatBSPTree.traverse: poza ostrosłupem widzenia albo bez widocznych wielokątów
+        culled = np.zeros(tree.node_count, dtype=bool)
+        if frustum is not None:
+            culled |= tree.outside_frustum(frustum)
+        if visible_polygons is not None:
+            visible_polygons = np.asarray(visible_polygons, dtype=bool)
+            culled |= tree.hidden_subtrees(visible_polygons)
+            keep &= visible_polygons
+        culled = np.flatnonzero(culled)
+        # węzeł jest odrzucony, gdy odrzucony jest on sam albo któryś z jego przodków
+        depth = (np.bincount(culled, minlength=tree.node_count + 1)
+                 - np.bincount(np.asarray(tree.subtree_end)[culled], minlength=tree.node_count + 1))
+        hidden_nodes = np.cumsum(depth[:-1]) > 0
+        tree.culled_nodes = int(np.count_nonzero(hidden_nodes))
+        keep &= ~hidden_nodes[self.node_of_polygon]
+        tree.culled_polygons = tree.polygon_count - int(np.count_nonzero(keep))
+        return order[keep[order]]
+
+
+class PotentiallyVisibleSet:
+    # dla każdej komórki drzewa (pustego miejsca na dziecko) zbiór komórek, które mogą być z niej widoczne,
+    # zapisany jako spakowane bity, oraz wielokąty dotykające każdej komórki (CSR); wielokąt jest widoczny,
+    # gdy widoczna jest któraś z jego komórek. Widoczność jest liczona z portali, więc jest zachowawcza:
+    # odrzucone komórki nie są widoczne z żadnego punktu komórki kamery
+    def __init__(self, cell_rows, bits, cell_offsets, cell_polygons, bounds_min, bounds_max, polygon_count):
+        self.cell_rows = cell_rows
+        self.bits = bits
+        self.cell_offsets = cell_offsets
+        self.cell_polygons = cell_polygons
+        self.bounds_min = bounds_min
+        self.bounds_max = bounds_max
+        self.polygon_count = polygon_count
+        self.last_row = None    # maska ostatniej komórki kamery - kamera zwykle zostaje w niej przez wiele klatek
+        self.last_mask = None
+
+    @classmethod
+    def compute(cls, tree, margin=1.0, epsilon=PLANE_EPSILON, chain_budget=PVS_CHAIN_BUDGET):
+        polygon_count = tree.polygon_count
+        children = np.stack([tree.front, tree.back], axis=1).ravel()
+        cell_rows = np.full(len(children), -1, dtype=np.int32)
+        if tree.node_count == 0:
+            return cls(cell_rows, np.zeros((0, 0), dtype=np.uint8), np.zeros(1, dtype=np.int64),
+                       np.zeros(0, dtype=np.int32), np.zeros(3), np.zeros(3), 0)
+
+        cell_slots = np.flatnonzero(children < 0)
+        cell_rows[cell_slots] = np.arange(len(cell_slots))
+        bounds_min = np.asarray(tree.bounds_min[0]) - margin
+        bounds_max = np.asarray(tree.bounds_max[0]) + margin
+
+        portals = PortalGraph(tree, bounds_min, bounds_max, epsilon)
+        visible = portals.cell_visibility(chain_budget)
+
+        # komórki każdego wielokąta: po obu stronach jego płaszczyzny, razem z tymi, których sięga tylko
+        # w granicach epsilon
+        vertices = np.asarray(tree.vertices)
+        offsets = np.asarray(tree.vertex_offsets)
+        _, _, slots, polygons = filter_fragments(tree, vertices, offsets, np.full(polygon_count, -1), None, epsilon)
+        pairs = np.unique(cell_rows[slots].astype(np.int64) * max(polygon_count, 1) + polygons)
+        rows, cell_polygons = np.divmod(pairs, max(polygon_count, 1))
+        cell_offsets = np.searchsorted(rows, np.arange(len(cell_slots) + 1))
+
+        bits = np.packbits(visible, axis=1).reshape(len(cell_slots), (len(cell_slots) + 7) // 8)
+        return cls(cell_rows, bits, cell_offsets, cell_polygons.astype(np.int32), bounds_min, bounds_max,
+                   polygon_count)
+
+    def visible_polygons(self, tree, camera_pos):
+        # maska wielokątów widocznych z komórki kamery albo None, gdy PVS nic nie wie o tym miejscu
+        camera_pos = np.asarray(camera_pos, dtype=np.float64)
+        if np.any(camera_pos < self.bounds_min) or np.any(camera_pos > self.bounds_max):
+            return None
+        cell = tree.locate_cells(camera_pos)[0]
+        if cell < 0 or self.cell_rows[cell] < 0:
+            return None
+        row = int(self.cell_rows[cell])
+        if row != self.last_row:
+            cells = np.flatnonzero(np.unpackbits(self.bits[row], count=len(self.cell_offsets) - 1))
+            mask = np.zeros(self.polygon_count, dtype=bool)
+            mask[self.cell_polygons[concat_ranges(self.cell_offsets[cells],
+                                                  self.cell_offsets[cells + 1] - self.cell_offsets[cells])]] = True
+            self.last_row, self.last_mask = row, mask
+        return self.last_mask
+
+    ARRAYS = ("cell_rows", "bits", "cell_offsets", "cell_polygons", "bounds_min", "bounds_max")
+
+    def save(self, file_path, scene_hash=None):
+        meta = {"format": PVS_FORMAT, "version": PVS_FORMAT_VERSION, "scene_hash": scene_hash,
+                "polygon_count": self.polygon_count}
+        save_arrays(file_path, {name: getattr(self, name) for name in self.ARRAYS}, meta)
+
+    @classmethod
+    def load(cls, file_path, scene_hash=None, mmap=True):
+        meta, arrays = load_arrays(file_path, mmap=mmap)
+        if meta.get("format") != PVS_FORMAT or meta.get("version") != PVS_FORMAT_VERSION:
+            raise ValueError(f'{file_path}: unsupported PVS file version {meta.get("version")}')
+        if scene_hash is not None and meta.get("scene_hash") != scene_hash:
+            raise ValueError(f'{file_path}: PVS was computed for a different scene')
+        return cls(*(arrays[name] for name in cls.ARRAYS), meta["polygon_count"])
+
+
+def take_fragments(vertices, offsets, ids):
+    # wybrane wielokąty (CSR) jako nowe tablice (vertices, offsets)
+    counts = offsets[ids + 1] - offsets[ids]
+    new_offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum(counts, out=new_offsets[1:])
+    return vertices[concat_ranges(offsets[ids], counts)], new_offsets
+
+
+def concat_fragments(parts):
+    # sklejone listy wielokątów (CSR) [(vertices, offsets), ...]
+    offsets = [np.zeros(1, dtype=np.int64)]
+    total = 0
+    for _, part_offsets in parts:
+        offsets.append(part_offsets[1:] + total)
+        total += part_offsets[-1]
+    vertices = [part_vertices for part_vertices, _ in parts]
+    return (np.concatenate(vertices) if vertices else np.zeros((0, 3))), np.concatenate(offsets)
+
+
+def clip_fragments(vertices, offsets, normals, distances, epsilon=PLANE_EPSILON):
+    # części wielokątów (CSR) leżące przed płaszczyznami n . x = d (po jednej na wielokąt), bez tych, z których
+    # została najwyżej krawędź; zwraca (vertices, offsets, kept) - kept to numery zachowanych wielokątów
+    counts = np.diff(offsets)
+    vertex_distances = snap_distances(np.einsum("ij,ij->i", vertices, np.repeat(normals, counts, axis=0))
+                                      - np.repeat(distances, counts), epsilon)
+    front_vertices, front_offsets, _, _ = split_by_plane(vertices, offsets, vertex_distances)
+    kept = np.flatnonzero(np.diff(front_offsets) >= 3)
+    return (*take_fragments(front_vertices, front_offsets, kept), kept)
+
+
+def pad_fragments(vertices, offsets, width=None):
+    # wielokąty (CSR) jako tablica (N, width, 3) i liczby wierzchołków; krótsze wielokąty są dopełnione
+    # powtórzeniem ostatniego wierzchołka, co nie zmienia ani ich krawędzi, ani odległości od płaszczyzn
+    counts = np.diff(offsets)
+    if width is None:
+        width = int(counts.max()) if len(counts) else 0
+    columns = np.minimum(np.arange(width), np.maximum(counts[:, None] - 1, 0))
+    return vertices[offsets[:-1, None] + columns], counts
+
+
+def fit_width(polygons, width):
+    # dopełnione wielokąty (N, W, 3) przycięte lub dopełnione (powtórzeniem ostatniej kolumny) do width wierzchołków
+    if polygons.shape[1] >= width:
+        return polygons[:, :width]
+    return np.concatenate([polygons, np.repeat(polygons[:, -1:], width - polygons.shape[1], axis=1)], axis=1)
+
+
+def clip_padded(polygons, counts, normals, distances, epsilon=PLANE_EPSILON):
+    # jak clip_fragments dla dopełnionych wielokątów (N, W, 3): części przed płaszczyznami, po jednej na wielokąt.
+    # Zwraca (polygons, counts, alive) dla wszystkich wielokątów - alive, gdy któryś wierzchołek leży wyraźnie
+    # przed płaszczyzną i zostały co najmniej 3 wierzchołki, więc wielokąt leżący na płaszczyźnie odpada
+    polygon_count, width = polygons.shape[:2]
+    columns = np.arange(width)
+    valid = columns < counts[:, None]
+    vertex_distances = snap_distances(np.einsum("nwk,nk->nw", polygons, normals) - distances[:, None], epsilon)
+    following = np.where(columns + 1 < counts[:, None], columns + 1, 0)
+    next_distances = np.take_along_axis(vertex_distances, following, axis=1)
+    next_vertices = np.take_along_axis(polygons, following[:, :, None], axis=1)
+    # krawędź i daje wierzchołek i (gdy nie leży za płaszczyzną) i punkt przecięcia (gdy płaszczyzna ją przecina)
+    keep = valid & (vertex_distances >= 0)
+    crossing = valid & (vertex_distances * next_distances < 0)
+    t = vertex_distances / np.where(crossing, vertex_distances - next_distances, 1.0)
+    intersections = polygons + t[:, :, None] * (next_vertices - polygons)
+    candidates = np.stack([polygons, intersections], axis=2).reshape(polygon_count, 2 * width, 3)
+    emitted = np.stack([keep, crossing], axis=2).reshape(polygon_count, 2 * width)
+    clipped_counts = emitted.sum(axis=1)
+    clipped_width = max(int(clipped_counts.max()) if polygon_count else 0, 1)
+    order = np.argsort(~emitted, axis=1, kind="stable")
+    picked = np.minimum(np.arange(clipped_width), np.maximum(clipped_counts[:, None] - 1, 0))
+    clipped = np.take_along_axis(candidates, np.take_along_axis(order, picked, axis=1)[:, :, None], axis=1)
+    alive = (clipped_counts >= 3) & np.any(valid & (vertex_distances > 0), axis=1)
+    return clipped, clipped_counts, alive
+
+
+def plane_ranges(normals, distances, polygons):
+    # najmniejsza i największa odległość wierzchołków dopełnionych wielokątów (N, W, 3) od płaszczyzn (N, M);
+    # pętla po kolumnach jest znacznie szybsza niż redukcja wzdłuż krótkiej osi
+    nx, ny, nz = normals[:, :, 0], normals[:, :, 1], normals[:, :, 2]
+    low = high = None
+    for column in range(polygons.shape[1]):
+        point = polygons[:, column, :]
+        column_distances = (nx * point[:, None, 0] + ny * point[:, None, 1] + nz * point[:, None, 2]) - distances
+        if low is None:
+            low, high = column_distances, column_distances
+        else:
+            low, high = np.minimum(low, column_distances), np.maximum(high, column_distances)
+    return low, high
+
+
+def bound_fragments(polygons, counts, groups, hulls, hull_counts, normals, epsilon=PLANE_EPSILON, directions=8):
+    # wielokąt obejmujący wszystkie wielokąty danej grupy (dopełnione, leżące na płaszczyźnie o normalnej
+    # normals[g] w obrębie wielokąta hulls[g]): hulls[g] przycięty do ośmiokąta opisanego na wielokątach grupy.
+    # Zwraca (polygons, counts) po jednym na grupę
+    axes = np.eye(3)[np.argmin(np.abs(normals), axis=1)]
+    u = unit_normals(row_cross(normals, axes))
+    v = row_cross(normals, u)
+    angles = 2 * np.pi * np.arange(directions) / directions
+    planes = np.cos(angles)[None, :, None] * u[:, None, :] + np.sin(angles)[None, :, None] * v[:, None, :]
+    _, extents = plane_ranges(planes[groups], np.zeros((len(groups), directions)), polygons)
+    group_extents = np.full((len(hulls), directions), -np.inf)
+    np.maximum.at(group_extents, groups, extents)
+    for direction in range(directions):
+        hulls, hull_counts, _ = clip_padded(hulls, hull_counts, -planes[:, direction],
+                                            -group_extents[:, direction] - epsilon, epsilon)
+    return hulls, hull_counts
+
+
+def clip_to_separators(source, passage, target, flip, epsilon=PLANE_EPSILON):
+    # przycina wielokąty target płaszczyznami rozdzielającymi source i passage (wszystkie dopełnione, jak
+    # (polygons, counts), po jednym wielokącie na łańcuch): płaszczyzna przez krawędź source i wierzchołek
+    # passage, z source po jednej stronie i passage po drugiej. Prosta przechodząca przez oba portale i target
+    # leży po stronie passage każdej takiej płaszczyzny; flip - płaszczyzny z krawędzi passage, target po
+    # stronie source. Zwraca (polygons, counts, kept) - kept to łańcuchy, z których target coś zostało
+    source_polygons, source_counts = source
+    passage_polygons, passage_counts = passage
+    target_polygons, target_counts = target
+    chain_count, source_width = source_polygons.shape[:2]
+    passage_width = passage_polygons.shape[1]
+    columns = np.arange(source_width)
+    following = np.where(columns + 1 < source_counts[:, None], columns + 1, 0)
+    edges = np.take_along_axis(source_polygons, following[:, :, None], axis=1) - source_polygons
+    to_points = passage_polygons[:, None, :, :] - source_polygons[:, :, None, :]
+    shape = (chain_count, source_width * passage_width)
+    normals = row_cross(np.broadcast_to(edges[:, :, None, :], to_points.shape).reshape(-1, 3),
+                        to_points.reshape(-1, 3)).reshape(*shape, 3)
+    lengths = np.sqrt((normals * normals).sum(axis=2))
+    usable = lengths > epsilon
+    normals /= np.where(usable, lengths, 1.0)[:, :, None]
+    anchors = np.broadcast_to(passage_polygons[:, None, :, :], to_points.shape).reshape(*shape, 3)
+    distances = (normals * anchors).sum(axis=2)
+
+    # source ma leżeć za płaszczyzną - cały leży po jednej jej stronie, bo płaszczyzna zawiera jego krawędź
+    low, high = plane_ranges(normals, distances, source_polygons)
+    farthest = np.where(np.abs(high) >= np.abs(low), high, low)
+    sign = np.where(farthest > 0, -1.0, 1.0)
+    normals *= sign[:, :, None]
+    distances *= sign
+    low, high = plane_ranges(normals, distances, passage_polygons)
+    separating = usable & (np.abs(farthest) > epsilon) & (low >= -epsilon) & (high > epsilon)
+    if flip:
+        normals, distances = -normals, -distances
+
+    # target w całości za którąkolwiek płaszczyzną - łańcuch się kończy; przecinające go płaszczyzny
+    # przycinają po kolei, po jednej na łańcuch w każdej rundzie
+    low, high = plane_ranges(normals, distances, target_polygons)
+    alive = ~np.any(separating & (high <= epsilon), axis=1)
+    cutting = separating & (low < -epsilon) & alive[:, None]
+    cut_counts = cutting.sum(axis=1)
+    order = np.argsort(~cutting, axis=1, kind="stable")
+    for rank in range(int(cut_counts.max()) if chain_count else 0):
+        chains = np.flatnonzero((cut_counts > rank) & alive)
+        planes = order[chains, rank]
+        clipped, clipped_counts, clipped_alive = clip_padded(target_polygons[chains], target_counts[chains],
+                                                             normals[chains, planes], distances[chains, planes],
+                                                             epsilon)
+        width = max(target_polygons.shape[1], clipped.shape[1])
+        target_polygons = fit_width(target_polygons, width)
+        target_polygons[chains] = fit_width(clipped, width)
+        target_counts = target_counts.copy()
+        target_counts[chains] = clipped_counts
+        alive[chains[~clipped_alive]] = False
+    kept = np.flatnonzero(alive)
+    return target_polygons[kept], target_counts[kept], kept
+
+
+def fragment_widths(vertices, offsets):
+    # szerokość wielokątów (CSR) liczona jako 2 * pole / obwód - dla pasków to mniej więcej ich szerokość
+    if len(offsets) < 2:
+        return np.zeros(0)
+    next_vertex = np.arange(1, len(vertices) + 1)
+    next_vertex[offsets[1:] - 1] = offsets[:-1]
+    area = 0.5 * np.linalg.norm(np.add.reduceat(row_cross(vertices, vertices[next_vertex]), offsets[:-1], axis=0),
+                                axis=1)
+    perimeter = np.add.reduceat(np.linalg.norm(vertices[next_vertex] - vertices, axis=1), offsets[:-1])
+    return 2 * area / np.maximum(perimeter, 1e-300)
+
+
+def row_cross(a, b):
+    # iloczyn wektorowy wierszy (N, 3) - np.cross ma duży narzut na ogólną obsługę osi
+    ax, ay, az = a[:, 0], a[:, 1], a[:, 2]
+    bx, by, bz = b[:, 0], b[:, 1], b[:, 2]
+    return np.stack([ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx], axis=1)
+
+
+def filter_fragments(tree, vertices, offsets, slots, directions=None, epsilon=PLANE_EPSILON):
+    # spuszcza wielokąty (CSR) po drzewie aż do komórek (pustych miejsc na dziecko 2 * i / 2 * i + 1, jak
+    # w locate_cells); wielokąt i zaczyna w miejscu slots[i], -1 oznacza korzeń. Z directions wielokąty
+    # przecinające płaszczyznę są dzielone, a leżące na niej idą na stronę, w którą wskazuje directions[i];
+    # bez directions cały wielokąt idzie na każdą stronę, której sięga choć jeden wierzchołek (z tolerancją
+    # epsilon) - dostaje wtedy nadzbiór komórek, których dotyka.
+    # Zwraca (vertices, offsets, cells, sources) - sources to indeks wielokąta wejściowego
+    children = np.stack([tree.front, tree.back], axis=1).ravel().astype(np.int64)
+    normals = np.asarray(tree.normals)
+    plane_distances = np.asarray(tree.distances)
+    slots = np.asarray(slots, dtype=np.int64)
+    sources = np.arange(len(slots))
+    done = []
+    while len(sources):
+        nodes = np.where(slots < 0, 0, children[np.maximum(slots, 0)])
+        leaf = nodes < 0
+        if leaf.any():
+            done.append((*take_fragments(vertices, offsets, np.flatnonzero(leaf)), slots[leaf], sources[leaf]))
+            rest = np.flatnonzero(~leaf)
+            vertices, offsets = take_fragments(vertices, offsets, rest)
+            nodes, sources = nodes[rest], sources[rest]
+            if directions is not None:
+                directions = directions[rest]
+            if len(sources) == 0:
+                break
+
+        vertex_nodes = np.repeat(nodes, np.diff(offsets))
+        distances = snap_distances(np.einsum("ij,ij->i", vertices, normals[vertex_nodes])
+                                   - plane_distances[vertex_nodes], epsilon)
+        has_front = np.logical_or.reduceat(distances > 0, offsets[:-1])
+        has_back = np.logical_or.reduceat(distances < 0, offsets[:-1])
+        if directions is None:
+            whole = [(~has_back | has_front, 0), (has_back | ~has_front, 1)]
+            spanning = np.zeros(len(nodes), dtype=bool)
+        else:
+            coplanar = ~has_front & ~has_back
+            toward = np.einsum("ij,ij->i", normals[nodes], directions) > 0
+            whole = [((has_front & ~has_back) | (coplanar & toward), 0),
+                     ((has_back & ~has_front) | (coplanar & ~toward), 1)]
+            spanning = has_front & has_back
+
+        parts, new_slots, new_sources, new_directions = [], [], [], []
+        for mask, side in whole:
+            ids = np.flatnonzero(mask)
+            parts.append(take_fragments(vertices, offsets, ids))
+            new_slots.append(2 * nodes[ids] + side)
+            new_sources.append(sources[ids])
+            if directions is not None:
+                new_directions.append(directions[ids])
+        if spanning.any():
+            ids = np.flatnonzero(spanning)
+            span_vertices, span_offsets = take_fragments(vertices, offsets, ids)
+            span_distances = distances[concat_ranges(offsets[ids], offsets[ids + 1] - offsets[ids])]
+            front_vertices, front_offsets, back_vertices, back_offsets = split_by_plane(span_vertices, span_offsets,
+                                                                                        span_distances)
+            for side, part in ((0, (front_vertices, front_offsets)), (1, (back_vertices, back_offsets))):
+                parts.append(part)
+                new_slots.append(2 * nodes[ids] + side)
+                new_sources.append(sources[ids])
+                new_directions.append(directions[ids])
+        vertices, offsets = concat_fragments(parts)
+        slots = np.concatenate(new_slots)
+        sources = np.concatenate(new_sources)
+        if directions is not None:
+            directions = np.concatenate(new_directions)
+
+    if not done:
+        return np.zeros((0, 3)), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    vertices, offsets = concat_fragments([(part_vertices, part_offsets) for part_vertices, part_offsets, _, _ in done])
+    return (vertices, offsets, np.concatenate([cells for _, _, cells, _ in done]),
+            np.concatenate([part_sources for _, _, _, part_sources in done]))
+
+
+class PortalGraph:
+    # portale między komórkami drzewa: przekrój prostopadłościanu sceny płaszczyzną każdego węzła, przycięty
+    # płaszczyznami jego przodków i podzielony poddrzewami przed i za nim na kawałki łączące jedną komórkę
+    # przed płaszczyzną z jedną za nią. Z kawałków są wycinane wielokąty węzła, a paski węższe niż epsilon
+    # odrzucane - zostają otwarte przejścia. Każdy kawałek to dwa portale skierowane, z normalną płaszczyzny
+    # wskazującą komórkę, do której prowadzą
+    def __init__(self, tree, bounds_min, bounds_max, epsilon=PLANE_EPSILON):
+        self.epsilon = epsilon
+        children = np.stack([tree.front, tree.back], axis=1).ravel()
+        self.cell_slots = np.flatnonzero(children < 0)
+        cell_rows = np.full(len(children), -1, dtype=np.int64)
+        cell_rows[self.cell_slots] = np.arange(len(self.cell_slots))
+
+        vertices, offsets, nodes = self.node_windows(tree, bounds_min, bounds_max, epsilon)
+        node_normals = np.asarray(tree.normals)[nodes]
+        vertices, offsets, front_slots, sources = filter_fragments(tree, vertices, offsets, 2 * nodes,
+                                                                   node_normals, epsilon)
+        nodes = nodes[sources]
+        vertices, offsets, back_slots, sources = filter_fragments(tree, vertices, offsets, 2 * nodes + 1,
+                                                                  -np.asarray(tree.normals)[nodes], epsilon)
+        nodes, front_slots = nodes[sources], front_slots[sources]
+        vertices, offsets, sources = self.cut_polygons(tree, vertices, offsets, nodes, epsilon)
+        nodes, front_slots, back_slots = nodes[sources], front_slots[sources], back_slots[sources]
+        open_pieces = np.flatnonzero(fragment_widths(vertices, offsets) > epsilon)
+        vertices, offsets = take_fragments(vertices, offsets, open_pieces)
+        nodes = nodes[open_pieces]
+        front_cells = cell_rows[front_slots[open_pieces]]
+        back_cells = cell_rows[back_slots[open_pieces]]
+
+        # portal 2 * k prowadzi z komórki za kawałkiem k do komórki przed nim, 2 * k + 1 odwrotnie
+        piece_count = len(nodes)
+        self.vertices = vertices
+        self.offsets = offsets
+        self.piece_normals = np.asarray(tree.normals)[nodes]
+        self.piece_distances = np.asarray(tree.distances)[nodes]
+        self.normals = np.repeat(self.piece_normals, 2, axis=0) * np.tile([1.0, -1.0], piece_count)[:, None]
+        self.distances = np.repeat(self.piece_distances, 2) * np.tile([1.0, -1.0], piece_count)
+        self.leaves = np.stack([front_cells, back_cells], axis=1).ravel()
+        self.sources = np.stack([back_cells, front_cells], axis=1).ravel()
+        self.windings, self.winding_counts = pad_fragments(vertices, offsets)
+        # portale wychodzące z komórki c to by_source[first[c]:first[c + 1]]
+        self.by_source = np.argsort(self.sources, kind="stable")
+        self.first = np.searchsorted(self.sources[self.by_source], np.arange(len(self.cell_slots) + 1))
+
+    @staticmethod
+    def node_windows(tree, bounds_min, bounds_max, epsilon):
+        # wielokąt na płaszczyźnie każdego węzła obejmujący cały jego obszar: kwadrat większy niż scena,
+        # przycięty ścianami prostopadłościanu sceny i płaszczyznami przodków (po stronie, w której leży węzeł)
+        node_count = tree.node_count
+        normals = np.asarray(tree.normals)
+        distances = np.asarray(tree.distances)
+        center = 0.5 * (bounds_min + bounds_max)
+        half = float(np.linalg.norm(bounds_max - bounds_min)) + 1.0
+        origins = center - (normals @ center - distances)[:, None] * normals
+        axes = np.zeros((node_count, 3))
+        axes[np.arange(node_count), np.argmin(np.abs(normals), axis=1)] = 1
+        u = unit_normals(row_cross(normals, axes))
+        v = row_cross(normals, u)
+        corners = [origins + half * (su * u + sv * v) for su, sv in ((-1, -1), (1, -1), (1, 1), (-1, 1))]
+        vertices = np.stack(corners, axis=1).reshape(-1, 3)
+        offsets = np.arange(0, 4 * node_count + 1, 4, dtype=np.int64)
+        nodes = np.arange(node_count)
+
+        for axis in range(3):
+            for sign, bound in ((1.0, bounds_min[axis]), (-1.0, -bounds_max[axis])):
+                plane = np.zeros(3)
+                plane[axis] = sign
+                vertices, offsets, kept = clip_fragments(vertices, offsets, np.tile(plane, (len(nodes), 1)),
+                                                         np.full(len(nodes), bound), epsilon)
+                nodes = nodes[kept]
+
+        parent = np.full(node_count, -1, dtype=np.int64)
+        side = np.ones(node_count)
+        for children, child_side in ((np.asarray(tree.front), 1.0), (np.asarray(tree.back), -1.0)):
+            has_child = children >= 0
+            parent[children[has_child]] = np.flatnonzero(has_child)
+            side[children[has_child]] = child_side
+        # w każdej rundzie okno wchodzi o jeden poziom wyżej: current to węzeł, którego rodzicem jest teraz przycinane
+        current = nodes.copy()
+        finished = []
+        while len(nodes):
+            ancestors = parent[current]
+            top = ancestors < 0
+            if top.any():
+                finished.append((*take_fragments(vertices, offsets, np.flatnonzero(top)), nodes[top]))
+                rest = np.flatnonzero(~top)
+                vertices, offsets = take_fragments(vertices, offsets, rest)
+                nodes, current, ancestors = nodes[rest], current[rest], ancestors[rest]
+                if len(nodes) == 0:
+                    break
+            vertices, offsets, kept = clip_fragments(vertices, offsets, normals[ancestors] * side[current, None],
+                                                     distances[ancestors] * side[current], epsilon)
+            nodes, current = nodes[kept], ancestors[kept]
+        vertices, offsets = concat_fragments([(part_vertices, part_offsets) for part_vertices, part_offsets, _ in finished])
+        return vertices, offsets, np.concatenate([part_nodes for _, _, part_nodes in finished] or [np.zeros(0, dtype=np.int64)])
+
+    @staticmethod
+    def cut_polygons(tree, vertices, offsets, nodes, epsilon):
+        # wycina z kawałków (CSR) wielokąty ich węzłów; wielokąt jest wypukły, więc kawałek minus wielokąt
+        # to części kawałka na zewnątrz kolejnych krawędzi. Zwraca (vertices, offsets, sources)
+        first_polygon = np.asarray(tree.first_polygon, dtype=np.int64)
+        polygon_offsets = np.asarray(tree.vertex_offsets)
+        polygon_vertices = np.asarray(tree.vertices)
+        own_count = first_polygon[1:] - first_polygon[:-1]
+        sources = np.arange(len(nodes))
+        if tree.polygon_count == 0 or len(nodes) == 0:
+            return vertices, offsets, sources
+
+        # płaszczyzny krawędzi: normalna w płaszczyźnie węzła, skierowana do wnętrza wielokąta
+        polygon_nodes = np.repeat(np.arange(tree.node_count), own_count)
+        counts = np.diff(polygon_offsets)
+        vertex_polygons = np.repeat(np.arange(tree.polygon_count), counts)
+        next_vertex = np.arange(1, len(polygon_vertices) + 1)
+        next_vertex[polygon_offsets[1:] - 1] = polygon_offsets[:-1]
+        node_normals = np.asarray(tree.normals)[polygon_nodes[vertex_polygons]]
+        edge_normals = unit_normals(row_cross(node_normals, polygon_vertices[next_vertex] - polygon_vertices))
+        orientation = np.sign(np.einsum("ij,ij->i", np.add.reduceat(
+            row_cross(polygon_vertices, polygon_vertices[next_vertex]), polygon_offsets[:-1], axis=0),
+            np.asarray(tree.normals)[polygon_nodes]))
+        edge_normals *= orientation[vertex_polygons, None]
+        edge_distances = np.einsum("ij,ij->i", edge_normals, polygon_vertices)
+        covers = orientation != 0   # zdegenerowany wielokąt niczego nie zasłania
+        polygon_min = np.minimum.reduceat(polygon_vertices, polygon_offsets[:-1], axis=0) - epsilon
+        polygon_max = np.maximum.reduceat(polygon_vertices, polygon_offsets[:-1], axis=0) + epsilon
+
+        piece_nodes = nodes
+        for k in range(int(own_count[nodes].max())):
+            nodes = piece_nodes[sources]
+            candidates = np.flatnonzero(own_count[nodes] > k)
+            polygons = first_polygon[nodes[candidates]] + k
+            piece_min = np.minimum.reduceat(vertices, offsets[:-1], axis=0)[candidates]
+            piece_max = np.maximum.reduceat(vertices, offsets[:-1], axis=0)[candidates]
+            overlap = covers[polygons] & np.all((piece_min <= polygon_max[polygons])
+                                                & (piece_max >= polygon_min[polygons]), axis=1)
+            cut, polygons = candidates[overlap], polygons[overlap]
+            if len(cut) == 0:
+                continue
+            kept = np.setdiff1d(np.arange(len(sources)), cut)
+            parts = [take_fragments(vertices, offsets, kept)]
+            part_sources = [sources[kept]]
+            inside_vertices, inside_offsets = take_fragments(vertices, offsets, cut)
+            inside_sources = sources[cut]
+            for edge in range(int(counts[polygons].max())):
+                # kawałki, których wielokąt nie ma już krawędzi, leżą w całości w nim i odpadają
+                active = np.flatnonzero(counts[polygons] > edge)
+                inside_vertices, inside_offsets = take_fragments(inside_vertices, inside_offsets, active)
+                polygons, inside_sources = polygons[active], inside_sources[active]
+                vertex_edges = np.repeat(polygon_offsets[polygons] + edge, np.diff(inside_offsets))
+                distances = snap_distances(np.einsum("ij,ij->i", inside_vertices, edge_normals[vertex_edges])
+                                           - edge_distances[vertex_edges], epsilon)
+                in_vertices, in_offsets, out_vertices, out_offsets = split_by_plane(inside_vertices, inside_offsets,
+                                                                                    distances)
+                outside = np.flatnonzero(np.diff(out_offsets) >= 3)
+                parts.append(take_fragments(out_vertices, out_offsets, outside))
+                part_sources.append(inside_sources[outside])
+                inside = np.flatnonzero(np.diff(in_offsets) >= 3)
+                inside_vertices, inside_offsets = take_fragments(in_vertices, in_offsets, inside)
+                polygons, inside_sources = polygons[inside], inside_sources[inside]
+            vertices, offsets = concat_fragments(parts)
+            sources = np.concatenate(part_sources)
+            if len(sources) == 0:
+                break
+        return vertices, offsets, sources
+
+    def base_visibility(self):
+        # zgrubna widoczność (jak BasePortalVis w narzędziu vis z Quake): portal q może być widoczny przez
+        # portal p, gdy choć część q leży przed płaszczyzną p, a choć część p za płaszczyzną q; zwraca
+        # (portale, komórki) - komórki osiągalne od p tylko przez takie portale, wszystkie p naraz
+        epsilon = self.epsilon
+        windings = self.windings
+        cell_count = len(self.cell_slots)
+        reached = np.zeros((len(self.leaves), cell_count), dtype=bool)
+        pair_portals = np.arange(len(self.leaves))
+        pair_cells = self.leaves.copy()
+        reached[pair_portals, pair_cells] = True
+        while len(pair_portals):
+            counts = self.first[pair_cells + 1] - self.first[pair_cells]
+            pair_portals = np.repeat(pair_portals, counts)
+            next_portals = self.by_source[concat_ranges(self.first[pair_cells], counts)]
+            ahead = np.einsum("nwk,nk->nw", windings[next_portals >> 1], self.normals[pair_portals]).max(axis=1)
+            behind = np.einsum("nwk,nk->nw", windings[pair_portals >> 1], self.normals[next_portals]).min(axis=1)
+            seen = ((ahead - self.distances[pair_portals] > epsilon)
+                    & (behind - self.distances[next_portals] < -epsilon))
+            pair_portals, pair_cells = pair_portals[seen], self.leaves[next_portals[seen]]
+            new = ~reached[pair_portals, pair_cells]
+            pair_portals, pair_cells = np.divmod(np.unique(pair_portals[new] * cell_count + pair_cells[new]),
+                                                 cell_count)
+            reached[pair_portals, pair_cells] = True
+        return reached
+
+    def portal_flow(self, heads, mightsee, visible, done, spent, chain_budget, max_chains=1 << 13):
+        # komórki widoczne przez portale heads (jak PortalFlow w vis z Quake), dopisywane do visible: łańcuch
+        # idzie od komórki za portalem przez kolejne portale, a każdy następny jest przycinany płaszczyznami
+        # rozdzielającymi pierwszy portal (source) i poprzedni (passage) - zostaje tylko część, przez którą może
+        # przejść prosta z pierwszego portalu. Łańcuch kończy się, gdy nic nie zostaje albo nie może już pokazać
+        # komórek, których jeszcze nie widać; maski komórek są spakowanymi bitami, wszystkie łańcuchy idą naraz.
+        # Portal, którego łańcuchy przekroczą chain_budget (licznik w spent), dostaje całą zgrubną widoczność -
+        # to wciąż zachowawcze, a w otwartych scenach i tak niewiele gorsze
+        epsilon = self.epsilon
+        normals, distances = self.normals, self.distances
+        windings, winding_counts = self.windings, self.winding_counts
+        stack = [(heads, heads, mightsee[heads], (windings[heads >> 1], winding_counts[heads >> 1]), None)]
+        while stack:
+            chain_heads, lasts, might, source, passage = stack.pop()
+            cells = self.leaves[lasts]
+            np.bitwise_or.at(visible, (chain_heads, cells >> 3), (1 << (cells & 7)).astype(np.uint8))
+
+            counts = self.first[cells + 1] - self.first[cells]
+            chains = np.repeat(np.arange(len(cells)), counts)
+            next_portals = self.by_source[concat_ranges(self.first[cells], counts)]
+            leaves = self.leaves[next_portals]
+            keep = ((might[chains, leaves >> 3] >> (leaves & 7)) & 1).astype(bool)
+            # portal z powrotem przez ten sam kawałek
+            keep &= (next_portals ^ 1) != lasts[chains]
+            chains, next_portals = chains[keep], next_portals[keep]
+            spent += np.bincount(chain_heads[chains], minlength=len(spent))
+            over = chain_heads[spent[chain_heads] > chain_budget]
+            visible[over] = mightsee[over]
+            # przez gotowe portale widać dokładnie ich wynik, przez pozostałe najwyżej zgrubną widoczność
+            next_might = might[chains] & np.where(done[next_portals, None], visible[next_portals],
+                                                  mightsee[next_portals])
+            keep = np.any(next_might & ~visible[chain_heads[chains]], axis=1)
+            chains, next_portals, next_might = chains[keep], next_portals[keep], next_might[keep]
+            if len(chains) == 0:
+                continue
+
+            pieces = next_portals >> 1
+            pair_heads = chain_heads[chains]
+            *next_passage, alive = clip_padded(windings[pieces], winding_counts[pieces], normals[pair_heads],
+                                               distances[pair_heads], epsilon)
+            *next_source, source_alive = clip_padded(source[0][chains], source[1][chains], -normals[next_portals],
+                                                     -distances[next_portals], epsilon)
+            kept = np.flatnonzero(alive & source_alive)
+            chains, next_portals, next_might = chains[kept], next_portals[kept], next_might[kept]
+            next_source = (next_source[0][kept], next_source[1][kept])
+            next_passage = (next_passage[0][kept], next_passage[1][kept])
+            if passage is not None:
+                previous = (passage[0][chains], passage[1][chains])
+                *next_passage, kept = clip_to_separators(next_source, previous, next_passage, False, epsilon)
+                chains, next_portals, next_might = chains[kept], next_portals[kept], next_might[kept]
+                next_source = (next_source[0][kept], next_source[1][kept])
+                previous = (previous[0][kept], previous[1][kept])
+                *next_passage, kept = clip_to_separators(previous, next_source, next_passage, True, epsilon)
+                chains, next_portals, next_might = chains[kept], next_portals[kept], next_might[kept]
+                next_source = (next_source[0][kept], next_source[1][kept])
+
+            # łańcuchy jednego portalu do tego samego portalu idą dalej jako jeden, z wielokątami obejmującymi
+            # ich wszystkie - widać przez nie co najmniej tyle, co przez każdy z osobna
+            pair_heads = chain_heads[chains]
+            keys, groups = np.unique(pair_heads * len(normals) + next_portals, return_inverse=True)
+            if len(keys) < len(chains):
+                merged_heads, next_portals = np.divmod(keys, len(normals))
+                merged_might = np.zeros((len(keys), might.shape[1]), dtype=np.uint8)
+                np.bitwise_or.at(merged_might, groups, next_might)
+                head_pieces, pieces = merged_heads >> 1, next_portals >> 1
+                next_source = bound_fragments(*next_source, groups, windings[head_pieces],
+                                              winding_counts[head_pieces], self.piece_normals[head_pieces], epsilon)
+                next_passage = bound_fragments(*next_passage, groups, windings[pieces], winding_counts[pieces],
+                                               self.piece_normals[pieces], epsilon)
+                next_might, pair_heads = merged_might, merged_heads
+
+            for start in range(0, len(next_portals), max_chains):
+                part = slice(start, start + max_chains)
+                stack.append((pair_heads[part], next_portals[part], next_might[part],
+                              (next_source[0][part], next_source[1][part]),
+                              (next_passage[0][part], next_passage[1][part])))
+
+    def cell_visibility(self, chain_budget=PVS_CHAIN_BUDGET, batch_size=256):
+        # (C, C) - komórki widoczne z każdej komórki: ona sama i wszystko, co widać przez jej portale. Portale
+        # idą paczkami od najmniejszej zgrubnej widoczności, żeby łańcuchy dalszych paczek mogły kończyć się
+        # na gotowych już wynikach
+        cell_count = len(self.cell_slots)
+        mightsee = np.packbits(self.base_visibility(), axis=1, bitorder="little")
+        visible = np.zeros_like(mightsee)
+        done = np.zeros(len(mightsee), dtype=bool)
+        spent = np.zeros(len(mightsee), dtype=np.int64)
+        order = np.argsort(np.unpackbits(mightsee, axis=1).sum(axis=1), kind="stable")
+        for start in range(0, len(order), batch_size):
+            heads = order[start:start + batch_size]
+            self.portal_flow(heads, mightsee, visible, done, spent, chain_budget)
+            done[heads] = True
+
+        cells = np.arange(cell_count)
+        cell_bits = np.zeros((cell_count, mightsee.shape[1]), dtype=np.uint8)
+        cell_bits[cells, cells >> 3] = 1 << (cells & 7)
+        np.bitwise_or.at(cell_bits, self.sources, visible)
+        return np.unpackbits(cell_bits, axis=1, count=cell_count, bitorder="little").astype(bool)
+
+
+def _build_subtree_worker(vertices_name, offsets_name, vertex_total, polygon_total, first, last, depth, options):
+    # proces roboczy: wielokąty czyta z pamięci współdzielonej, zwraca poddrzewo jako płaskie tablice
+    vertices_memory = shared_memory.SharedMemory(name=vertices_name)
+    offsets_memory = shared_memory.SharedMemory(name=offsets_name)
+    try:
+        vertices = np.ndarray((vertex_total, 3), dtype=np.float64, buffer=vertices_memory.buf)
+        offsets = np.ndarray(polygon_total + 1, dtype=np.int64, buffer=offsets_memory.buf)
+        polygons = [Polygon(vertices[offsets[i]:offsets[i + 1]].copy()) for i in range(first, last)]
+    finally:
+        del vertices, offsets
+        vertices_memory.close()
+        offsets_memory.close()
+
+    stats = BuildStats()
+    root = BSPNode(polygons)
+    root.build_tree(stats=stats, depth=depth, **options)
+    tree = FlatBSPTree.from_node(root)
+    return {name: getattr(tree, name) for name in FlatBSPTree.ARRAYS}, stats
+
+
+def build_tree_parallel(polygons, workers=4, threshold=1000, stats=None, **options):
+    # górne poziomy drzewa dzielimy w bieżącym procesie, aż powstanie co najmniej `workers` poddrzew
+    # z >= threshold wielokątów; te budują procesy robocze, mniejsze budujemy na miejscu;
+    # wybór płaszczyzny zależy tylko od węzła, więc wynik jest taki sam jak przy build_tree
+    if stats is None:
+        stats = BuildStats()
+    root = BSPNode(polygons)
+    if len(polygons) == 0:
+        return root
+
+    frontier = [(root, 0)]
+    while True:
+        large = [item for item in frontier if len(item[0].polygons) >= threshold]
+        if workers <= 1 or not large or len(large) >= workers:
+            break
+        node, depth = max(large, key=lambda item: len(item[0].polygons))
+        frontier.remove((node, depth))
+        node.partition(stats=stats, depth=depth, **options)
+        frontier.extend((child, depth + 1) for child in (node.front, node.back) if child is not None)
+
+    remote = [item for item in frontier if workers > 1 and len(item[0].polygons) >= threshold]
+    local = [item for item in frontier if not (workers > 1 and len(item[0].polygons) >= threshold)]
+
+    if not remote:
+        build_subtrees(local, stats=stats, **options)
+        return root
+
+    # wierzchołki wszystkich zleconych poddrzew w jednym buforze współdzielonym
+    remote_polygons = [polygon for node, _ in remote for polygon in node.polygons]
+    counts = np.array([len(polygon.vertices) for polygon in remote_polygons], dtype=np.int64)
+    offsets = np.zeros(len(remote_polygons) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    vertices_memory = shared_memory.SharedMemory(create=True, size=max(int(offsets[-1]) * 3 * 8, 1))
+    offsets_memory = shared_memory.SharedMemory(create=True, size=offsets.nbytes)
+    try:
+        vertices = np.ndarray((offsets[-1], 3), dtype=np.float64, buffer=vertices_memory.buf)
+        for polygon, start, end in zip(remote_polygons, offsets[:-1], offsets[1:]):
+            vertices[start:end] = polygon.vertices
+        np.ndarray(offsets.shape, dtype=np.int64, buffer=offsets_memory.buf)[:] = offsets
+        del vertices
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            first = 0
+            for node, depth in remote:
+                last = first + len(node.polygons)
+                futures.append(executor.submit(_build_subtree_worker, vertices_memory.name, offsets_memory.name,
+                                               int(offsets[-1]), len(remote_polygons), first, last, depth, options))
+                first = last
+
+            # w międzyczasie budujemy małe poddrzewa lokalnie
+            build_subtrees(local, stats=stats, **options)
+
+            for (node, _), future in zip(remote, futures):
+                arrays, subtree_stats = future.result()
+                subtree = FlatBSPTree(*(arrays[name] for name in FlatBSPTree.ARRAYS)).to_node()
+                node.polygons = subtree.polygons
+                node.partition_plane = subtree.partition_plane
+                node.removed = subtree.removed
+                node.front = subtree.front
+                node.back = subtree.back
+                stats.merge(subtree_stats)
+    finally:
+        vertices_memory.close()
+        vertices_memory.unlink()
+        offsets_memory.close()
+        offsets_memory.unlink()
+
+    return root
+
+
+class DynamicBSPTree:
+    # drzewo BSP, które można zmieniać w trakcie działania programu (drzwi, przedmioty): nowy wielokąt jest
+    # przepychany w dół istniejącego drzewa i dzielony tylko przez płaszczyzny na swojej ścieżce (albo
+    # dołączany do węzła, na którego płaszczyźnie leży), a usunięcie zabiera jego fragmenty z węzłów;
+    # koszt edycji zależy od głębokości drzewa, nie od rozmiaru sceny.
+    # Gdy drzewo zrobi się za głębokie albo ma za dużo pustych węzłów, jest budowane od nowa w wątku w tle
+    def __init__(self, polygons=(), depth_factor=3.0, min_rebalance_depth=16, max_removed_fraction=0.25,
+                 background=True, **options):
+        self.options = options
+        self.epsilon = options.get("epsilon", PLANE_EPSILON)
+        self.depth_factor = depth_factor
+        self.min_rebalance_depth = min_rebalance_depth
+        self.max_removed_fraction = max_removed_fraction
+        self.background = background
+
+        self.polygons = {}      # id -> wielokąt w postaci, w jakiej został dodany
+        self.fragments = {}     # id -> węzły z fragmentami tego wielokąta
+        self.root = None
+        self.node_count = 0
+        self.removed_count = 0
+        self.max_depth = 0
+        self.rebuild_count = 0
+        self.version = 0
+        self._next_id = 0
+        self._flat = None
+        self._flat_version = -1
+        self._lock = threading.RLock()
+        self._rebuild_thread = None
+        self._rebalancing = False
+
+        for polygon in polygons:
+            polygon_id = self._next_id
+            self._next_id += 1
+            self.polygons[polygon_id] = self._tagged(polygon, polygon_id)
+        self._install(*self._build(self.polygons))
+
+    @staticmethod
+    def _tagged(polygon, polygon_id):
+        if not isinstance(polygon, Polygon):
+            polygon = Polygon(np.asarray(polygon, dtype=np.float64))
+        polygon.source_id = polygon_id
+        return polygon
+
+    def _build(self, polygons):
+        stats = BuildStats()
+        root = BSPNode(list(polygons.values()))
+        root.build_tree(stats=stats, **self.options)
+        fragments = {}
+        stack = [root] if root.partition_plane is not None else []
+        while stack:
+            node = stack.pop()
+            for polygon in node.polygons:
+                fragments.setdefault(polygon.source_id, []).append(node)
+            stack.extend(child for child in (node.front, node.back) if child is not None)
+        return root, fragments, stats
+
+    def _install(self, root, fragments, stats):
+        self.root = root if root.partition_plane is not None else None
+        self.fragments = fragments
+        self.node_count = stats.node_count
+        self.removed_count = 0
+        self.max_depth = stats.max_depth
+        self.version += 1
+
+    def insert(self, polygon):
+        # zwraca identyfikator, którym można później usunąć wielokąt razem z fragmentami
+        with self._lock:
+            polygon_id = self._next_id
+            self._next_id += 1
+            polygon = self._tagged(polygon, polygon_id)
+            self.polygons[polygon_id] = polygon
+            self._insert(polygon)
+            self.version += 1
+        self.maybe_rebalance()
+        return polygon_id
+
+    def _insert(self, polygon):
+        fragments = self.fragments.setdefault(polygon.source_id, [])
+        if self.root is None:
+            self.root = self._leaf(polygon)
+            fragments.append(self.root)
+            return
+
+        stack = [(self.root, polygon, 0)]
+        while stack:
+            node, polygon, depth = stack.pop()
+            distances = node.plane_distances(polygon, self.epsilon)
+            if not np.any(distances):
+                # leży na płaszczyźnie węzła
+                if node.removed:
+                    node.removed = False
+                    self.removed_count -= 1
+                node.polygons.append(polygon)
+                fragments.append(node)
+                continue
+            if not np.any(distances < 0):
+                parts = ((polygon, "front"),)
+            elif not np.any(distances > 0):
+                parts = ((polygon, "back"),)
+            else:
+                front_part, back_part = node.split_polygon(polygon, distances)
+                parts = ((front_part, "front"), (back_part, "back"))
+            for part, side in parts:
+                if part is None:
+                    continue
+                child = getattr(node, side)
+                if child is None:
+                    child = self._leaf(part)
+                    setattr(node, side, child)
+                    fragments.append(child)
+                    self.max_depth = max(self.max_depth, depth + 1)
+                else:
+                    stack.append((child, part, depth + 1))
+
+    def _leaf(self, polygon):
+        node = BSPNode([polygon])
+        node.partition_plane = polygon
+        self.node_count += 1
+        return node
+
+    def remove(self, polygon_id):
+        # płaszczyzny usuniętych fragmentów dalej dzielą przestrzeń, więc kolejność pozostałych się nie zmienia
+        with self._lock:
+            del self.polygons[polygon_id]
+            self._remove_fragments(polygon_id)
+            self.version += 1
+        self.maybe_rebalance()
+
+    def _remove_fragments(self, polygon_id):
+        # węzeł, w którym nie został żaden wielokąt, jest oznaczany jako pusty
+        for node in self.fragments.pop(polygon_id, ()):
+            node.polygons = [polygon for polygon in node.polygons if polygon.source_id != polygon_id]
+            if not node.polygons and not node.removed:
+                node.removed = True
+                self.removed_count += 1
+
+    def needs_rebalance(self):
+        live_nodes = self.node_count - self.removed_count
+        depth_limit = max(self.min_rebalance_depth, self.depth_factor * math.log2(live_nodes + 1))
+        return (self.max_depth > depth_limit
+                or self.removed_count > self.max_removed_fraction * max(self.node_count, 1))
+
+    def maybe_rebalance(self):
+        # sprawdzenie i zajęcie przebudowy pod blokadą - dwie edycje naraz nie uruchomią dwóch przebudów
+        with self._lock:
+            if not self.needs_rebalance() or self._rebalancing:
+                return
+            self._rebalancing = True
+            if self.background:
+                self._rebuild_thread = threading.Thread(target=self.rebalance, daemon=True)
+                self._rebuild_thread.start()
+                return
+        self.rebalance()
+
+    @property
+    def rebalancing(self):
+        return self._rebalancing
+
+    def wait(self):
+        # czeka na zakończenie przebudowy w tle
+        thread = self._rebuild_thread
+        if thread is not None:
+            thread.join()
+
+    def rebalance(self):
+        # buduje drzewo od nowa z oryginalnych wielokątów; zmiany wprowadzone w trakcie budowy
+        # są nanoszone na nowe drzewo przed podmianą. Jeśli po nich drzewo znów wymaga przebudowy
+        # (np. wszystko zostało w tym czasie usunięte), budowa jest powtarzana
+        while True:
+            with self._lock:
+                snapshot = dict(self.polygons)
+            try:
+                root, fragments, stats = self._build(snapshot)
+            except BaseException:
+                with self._lock:
+                    self._rebalancing = False
+                raise
+            logger.debug('rebalanced dynamic BSP: %s', stats)
+
+            with self._lock:
+                self._install(root, fragments, stats)
+                removed = [polygon_id for polygon_id in fragments if polygon_id not in self.polygons]
+                for polygon_id in removed:
+                    self._remove_fragments(polygon_id)
+                added = [polygon for polygon_id, polygon in self.polygons.items() if polygon_id not in snapshot]
+                for polygon in added:
+                    self._insert(polygon)
+                self.rebuild_count += 1
+                if not (removed or added) or not self.needs_rebalance():
+                    self._rebalancing = False
+                    return
+
+    def flat(self):
+        # płaskie drzewo do rysowania, przeliczane tylko po zmianach
+        with self._lock:
+            if self._flat_version != self.version:
+                self._flat = FlatBSPTree.from_node(self.root)
+                self._flat_version = self.version
+            return self._flat
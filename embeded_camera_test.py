@@ -4,11 +4,11 @@ import numpy as np
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
-# Inicjalizacja Pygame
-pygame.init()
+from frustum import frustum_planes
+from octree import PointOctree, look_at_matrix, perspective_matrix
+from point_buffer import PointBuffer, draw_points_immediate
+
 width, height = 1000, 800
-screen = pygame.display.set_mode((width, height), DOUBLEBUF | OPENGL)
-clock = pygame.time.Clock()
 
 current_tick = 0
 
@@ -21,20 +21,31 @@ camera_pos = np.array([0, 0, 5], dtype=np.float64)
 camera_front = np.array([0, 0, -1], dtype=np.float64)
 camera_up = np.array([0, 1, 0], dtype=np.float64)
 
-# Inicjalizacja OpenGL
 col = 0.0
-glClearColor(col, col, col, 1.0)
-glEnable(GL_DEPTH_TEST)
 
 # Przykładowe punkty w 3D
-points = np.random.uniform(-2, 2, (100, 3))
+point_count = 100
+points = np.random.uniform(-2, 2, (point_count, 3))
+
+use_vbo = True          # punkty w buforze wierzchołków na karcie; False - stara ścieżka glBegin / glVertex3fv
+use_octree = True       # tylko węzły w polu widzenia, dalekie z próbek LOD (wymaga use_vbo)
+lod_pixels = 64         # węzeł mniejszy na ekranie niż tyle pikseli rysujemy z próbki LOD
+point_buffer = None     # PointBuffer tworzony po utworzeniu kontekstu OpenGL
+octree = None
+lod_buffer = None
 
 # Funkcja do rysowania punktów
 def draw_points():
-    glBegin(GL_POINTS)
-    for point in points:
-        glVertex3fv(point)
-    glEnd()
+    if octree is not None:
+        frustum = frustum_planes(perspective_matrix(fov, aspect, near, far)
+                                 @ look_at_matrix(camera_pos, camera_front, camera_up))
+        firsts, counts, lod_firsts, lod_counts = octree.select(camera_pos, frustum, fov, height, lod_pixels)
+        point_buffer.draw_ranges(firsts, counts)
+        lod_buffer.draw_ranges(lod_firsts, lod_counts)
+    elif point_buffer is not None:
+        point_buffer.draw()
+    else:
+        draw_points_immediate(points)
 
 # Funkcja do rysowania osi
 def draw_axes():
@@ -75,104 +86,127 @@ def get_lookat_matrix():
 
     return lookat_matrix
 
-# Główna pętla programu
-running = True
-keys_pressed = set()
-while running:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        elif event.type == pygame.KEYDOWN:
-            keys_pressed.add(event.key)
-        elif event.type == pygame.KEYUP:
-            keys_pressed.discard(event.key)
-
-    camera_speed = 0.08
-    if pygame.K_w in keys_pressed:
-        camera_pos += (camera_speed * camera_front)
-    if pygame.K_s in keys_pressed:
-        camera_pos -= (camera_speed * camera_front)
-    if pygame.K_a in keys_pressed:
-        camera_pos -= (np.cross(camera_front, camera_up) * camera_speed)
-    if pygame.K_d in keys_pressed:
-        camera_pos += (np.cross(camera_front, camera_up) * camera_speed)
-
-    # Podnoszenie i opuszczanie kamery
-    if pygame.K_SPACE in keys_pressed:
-        camera_pos[1] += camera_speed
-    if pygame.K_LSHIFT in keys_pressed:
-        camera_pos[1] -= camera_speed
-
-    cam_speed_2 = 0.03
-    # pitch - góra dół -> obrót wokół osi X
-    if pygame.K_UP in keys_pressed:
-        camera_front[1] += cam_speed_2
-    if pygame.K_DOWN in keys_pressed:
-        camera_front[1] -= cam_speed_2
-
-    # yaw - prawo lewo -> obrót wokół osi Y
-    if pygame.K_LEFT in keys_pressed:
-        camera_front[0] -= cam_speed_2
-    if pygame.K_RIGHT in keys_pressed:
-        camera_front[0] += cam_speed_2
-
-    # roll - pochylenie -> obrót wokół osi Z
-    if pygame.K_KP_PLUS in keys_pressed:
-        camera_front[2] += cam_speed_2
-    if pygame.K_KP_MINUS in keys_pressed:
-        camera_front[2] -= cam_speed_2
-
-    if pygame.K_m in keys_pressed:
-        fov -= 1
-    if pygame.K_n in keys_pressed:
-        fov += 1
-
-    if pygame.K_o in keys_pressed:
-        camera_front[0] = -0.8
-        camera_front[1] = -0.5
-        camera_front[2] = -1
-
-        camera_pos[0] = 1
-        camera_pos[1] = 0.7
-        camera_pos[2] = 1.5
-
-    if pygame.K_p in keys_pressed:
-        camera_front[0] = 1
-        camera_front[1] = 1
-        camera_front[2] = 1
-
-        camera_pos[0] = 0
-        camera_pos[1] = 0
-        camera_pos[2] = -5
-
-    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-    update_camera()
-    draw_axes()
-    draw_points()
-
-    # current_tick = current_tick + 1
-    # if current_tick % 40 == 0:
-    #     current_tick = 0
-    #     print(f"camera_pos: {camera_pos}, camera_front: {camera_front}")
-    #     print(get_lookat_matrix())
-
-    # print("LookAt matrix:")
-    # print(get_lookat_matrix())
-
-    # print(f'camera_pos: {camera_pos}    camera_front: {camera_front}     camera_up: {camera_up}')
-
-    pitch = np.arcsin(-camera_front[1])
-    yaw = np.arctan2(camera_front[0], camera_front[2])
-    roll = np.arctan2(camera_up[0], camera_up[1])
-
-    pitch_deg = np.degrees(pitch)
-    yaw_deg = np.degrees(yaw)
-    roll_deg = np.degrees(roll)
-
-    # print(f'pitch: {pitch_deg}, yaw: {yaw_deg}, roll: {roll_deg}')
-    # print(f'pitch: {pitch}, yaw: {yaw}, roll: {roll}')
-
-    pygame.display.flip()
-    clock.tick(60)
-
-pygame.quit()
+if __name__ == "__main__":
+    # Inicjalizacja Pygame
+    pygame.init()
+    screen = pygame.display.set_mode((width, height), DOUBLEBUF | OPENGL)
+    clock = pygame.time.Clock()
+
+    # Inicjalizacja OpenGL
+    glClearColor(col, col, col, 1.0)
+    glEnable(GL_DEPTH_TEST)
+    if use_vbo and use_octree:
+        octree = PointOctree(points)
+        point_buffer = PointBuffer(octree.points)
+        lod_buffer = PointBuffer(octree.lod_points)
+    elif use_vbo:
+        point_buffer = PointBuffer(points)
+
+    # Główna pętla programu
+    running = True
+    keys_pressed = set()
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                keys_pressed.add(event.key)
+            elif event.type == pygame.KEYUP:
+                keys_pressed.discard(event.key)
+
+        camera_speed = 0.08
+        if pygame.K_w in keys_pressed:
+            camera_pos += (camera_speed * camera_front)
+        if pygame.K_s in keys_pressed:
+            camera_pos -= (camera_speed * camera_front)
+        if pygame.K_a in keys_pressed:
+            camera_pos -= (np.cross(camera_front, camera_up) * camera_speed)
+        if pygame.K_d in keys_pressed:
+            camera_pos += (np.cross(camera_front, camera_up) * camera_speed)
+
+        # Podnoszenie i opuszczanie kamery
+        if pygame.K_SPACE in keys_pressed:
+            camera_pos[1] += camera_speed
+        if pygame.K_LSHIFT in keys_pressed:
+            camera_pos[1] -= camera_speed
+
+        cam_speed_2 = 0.03
+        # pitch - góra dół -> obrót wokół osi X
+        if pygame.K_UP in keys_pressed:
+            camera_front[1] += cam_speed_2
+        if pygame.K_DOWN in keys_pressed:
+            camera_front[1] -= cam_speed_2
+
+        # yaw - prawo lewo -> obrót wokół osi Y
+        if pygame.K_LEFT in keys_pressed:
+            camera_front[0] -= cam_speed_2
+        if pygame.K_RIGHT in keys_pressed:
+            camera_front[0] += cam_speed_2
+
+        # roll - pochylenie -> obrót wokół osi Z
+        if pygame.K_KP_PLUS in keys_pressed:
+            camera_front[2] += cam_speed_2
+        if pygame.K_KP_MINUS in keys_pressed:
+            camera_front[2] -= cam_speed_2
+
+        if pygame.K_m in keys_pressed:
+            fov -= 1
+            if fov < 1:
+                fov = 1
+        if pygame.K_n in keys_pressed:
+            fov += 1
+            if fov >= 179:
+                fov = 179
+
+        if pygame.K_o in keys_pressed:
+            camera_front[0] = -0.8
+            camera_front[1] = -0.5
+            camera_front[2] = -1
+
+            camera_pos[0] = 1
+            camera_pos[1] = 0.7
+            camera_pos[2] = 1.5
+
+        if pygame.K_p in keys_pressed:
+            camera_front[0] = 1
+            camera_front[1] = 1
+            camera_front[2] = 1
+
+            camera_pos[0] = 0
+            camera_pos[1] = 0
+            camera_pos[2] = -5
+
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        update_camera()
+        draw_axes()
+        draw_points()
+
+        # current_tick = current_tick + 1
+        # if current_tick % 40 == 0:
+        #     current_tick = 0
+        #     print(f"camera_pos: {camera_pos}, camera_front: {camera_front}")
+        #     print(get_lookat_matrix())
+
+        # print("LookAt matrix:")
+        # print(get_lookat_matrix())
+
+        # print(f'camera_pos: {camera_pos}    camera_front: {camera_front}     camera_up: {camera_up}')
+
+        pitch = np.arcsin(-camera_front[1])
+        yaw = np.arctan2(camera_front[0], camera_front[2])
+        roll = np.arctan2(camera_up[0], camera_up[1])
+
+        pitch_deg = np.degrees(pitch)
+        yaw_deg = np.degrees(yaw)
+        roll_deg = np.degrees(roll)
+
+        # print(f'pitch: {pitch_deg}, yaw: {yaw_deg}, roll: {roll_deg}')
+        # print(f'pitch: {pitch}, yaw: {yaw}, roll: {roll}')
+
+        pygame.display.flip()
+        clock.tick(60)
+
+    for buffer in (point_buffer, lod_buffer):
+        if buffer is not None:
+            buffer.delete()
+    pygame.quit()
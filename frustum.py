@@ -0,0 +1,25 @@
+import numpy as np
+
+
+def frustum_planes(transformation_matrix):
+    # sześć płaszczyzn ostrosłupa widzenia (lewa, prawa, dolna, górna, bliska, daleka) wyciągniętych z macierzy
+    # rzutowania i widoku; normalne skierowane do środka: a * x + b * y + c * z + d >= 0 dla punktów widocznych
+    rows = transformation_matrix
+    planes = np.array([
+        rows[3] + rows[0],
+        rows[3] - rows[0],
+        rows[3] + rows[1],
+        rows[3] - rows[1],
+        rows[3] + rows[2],
+        rows[3] - rows[2],
+    ])
+    return planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+
+def boxes_outside_frustum(frustum, bounds_min, bounds_max):
+    # frustum: (6, 4) płaszczyzn (a, b, c, d) skierowanych do środka; prostopadłościan (N, 3) odpada, gdy leży
+    # w całości po zewnętrznej stronie którejkolwiek z nich - sprawdzamy jego wierzchołek najdalej w głąb płaszczyzny
+    frustum = np.asarray(frustum, dtype=np.float64)
+    normals = frustum[:, :3]
+    farthest = bounds_max @ np.maximum(normals, 0).T + bounds_min @ np.minimum(normals, 0).T
+    return np.any(farthest + frustum[:, 3] < 0, axis=1)
@@ -0,0 +1,121 @@
+import numpy as np
+
+
+class LightSet:
+    # światła punktowe jako tablice: pozycje (L, 3), kolory (L, 3) i współczynniki tłumienia f_att (L,)
+    def __init__(self, positions, colors, attenuations):
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        self.colors = np.broadcast_to(np.asarray(colors, dtype=np.float64), self.positions.shape).copy()
+        self.attenuations = np.broadcast_to(np.asarray(attenuations, dtype=np.float64),
+                                            len(self.positions)).copy()
+
+    def __len__(self):
+        return len(self.positions)
+
+    @classmethod
+    def single(cls, position, color, attenuation):
+        return cls([position], [color], [attenuation])
+
+    def concat(self, other):
+        return LightSet(np.concatenate([self.positions, other.positions]),
+                        np.concatenate([self.colors, other.colors]),
+                        np.concatenate([self.attenuations, other.attenuations]))
+
+    def key(self):
+        # do kluczy cache obrazów; zaokrąglenie jak przy tłumieniu zmienianym o += / -= 0.1
+        return (tuple(self.positions.ravel().tolist()), tuple(self.colors.ravel().tolist()),
+                tuple(np.round(self.attenuations, 6).tolist()))
+
+
+class MaterialSet:
+    # parametry modelu Phonga dla M materiałów; próbka wskazuje swój materiał indeksem (material_ids)
+    def __init__(self, ka, kd, ks, shininess, ambient_colors, names=None):
+        self.ka = np.atleast_1d(np.asarray(ka, dtype=np.float64))
+        self.kd = np.atleast_1d(np.asarray(kd, dtype=np.float64))
+        self.ks = np.atleast_1d(np.asarray(ks, dtype=np.float64))
+        self.shininess = np.atleast_1d(np.asarray(shininess, dtype=np.float64))
+        self.ambient_colors = np.asarray(ambient_colors, dtype=np.float64).reshape(-1, 3)
+        self.names = names
+
+    def __len__(self):
+        return len(self.ka)
+
+    def take(self, ids):
+        ids = np.atleast_1d(ids)
+        names = None if self.names is None else [self.names[i] for i in ids.tolist()]
+        return MaterialSet(self.ka[ids], self.kd[ids], self.ks[ids], self.shininess[ids],
+                           self.ambient_colors[ids], names)
+
+    def key(self):
+        return tuple(np.concatenate([self.ka, self.kd, self.ks, self.shininess,
+                                     self.ambient_colors.ravel()]).tolist())
+
+
+# materiały kulki z main_sphere (klawisz t)
+MATERIALS = MaterialSet(ka=[0.19225, 0.1, 0.05, 0.2],
+                        kd=[0.50754, 0.6, 0.6, 0.7],
+                        ks=[0.508273, 0.5, 0.2, 0.3],
+                        shininess=[51.2, 64, 32, 128],
+                        ambient_colors=[(112, 112, 112), (235, 20, 20), (139, 69, 19), (10, 165, 180)],
+                        names=["metalową (srebro)", "pomalowaną farbą", "drewnianą", "plastikową"])
+
+max_chunk_bytes = 1 << 20   # górna granica pamięci tablic pośrednich (próbki x światła) jednej porcji
+pair_bytes = 8 * 8          # ok. 8 liczb float64 na parę próbka-światło
+
+
+def shade(points, normals, lights, materials, material_ids=None, view_dir=(0, 0, 1), chunk_bytes=None):
+    # kolory (N, 3) wszystkich próbek oświetlonych wszystkimi światłami naraz - składowa otoczenia,
+    # rozproszona i zwierciadlana z modelu Phonga (normals muszą być jednostkowe); próbki są liczone
+    # porcjami, żeby tablice (porcja, L) nie przekroczyły chunk_bytes
+    points = np.asarray(points, dtype=np.float64)
+    normals = np.asarray(normals, dtype=np.float64)
+    view_dir = np.asarray(view_dir, dtype=np.float64)
+    view_length = np.sqrt(view_dir @ view_dir)
+    result = np.empty((len(points), 3), dtype=np.float64)
+    if len(points) == 0:
+        return result
+
+    if material_ids is None:
+        if len(materials) != 1:
+            raise ValueError("material_ids are required for more than one material")
+        material_ids = np.zeros(len(points), dtype=np.int64)
+    material_ids = np.asarray(material_ids)
+    ambient = materials.ka[:, None] * materials.ambient_colors
+
+    # iloczyny skalarne z wektorem do światła l = pozycja - punkt rozpisujemy na iloczyny z pozycjami świateł
+    # (mnożenie macierzy) i z punktem (jedna liczba na próbkę) - nie powstają tablice (porcja, L, 3)
+    positions = lights.positions
+    positions_t = np.ascontiguousarray(positions.T)
+    positions_sq = np.einsum("ij,ij->i", positions, positions)
+    positions_view = positions @ view_dir
+
+    if chunk_bytes is None:
+        chunk_bytes = max_chunk_bytes
+    chunk = max(1, chunk_bytes // (pair_bytes * max(len(lights), 1)))
+    for start in range(0, len(points), chunk):
+        end = min(start + chunk, len(points))
+        ids = material_ids[start:end]
+        result[start:end] = ambient[ids]
+        if len(lights) == 0:
+            continue
+        point = points[start:end]
+        normal = normals[start:end]
+
+        distance_sq = np.einsum("ij,ij->i", point, point)[:, None] - 2 * (point @ positions_t) + positions_sq
+        inverse_distance = 1 / np.sqrt(distance_sq)
+        normal_dot_light = normal @ positions_t
+        normal_dot_light -= np.einsum("ij,ij->i", normal, point)[:, None]
+        normal_dot_light *= inverse_distance
+        view_dot_light = (positions_view - (point @ view_dir)[:, None]) * inverse_distance
+
+        # odbity kierunek r = 2 (n.l) n - l jest jednostkowy, więc cos(alfa) = (2 (n.l) (n.v) - l.v) / |v|
+        cos_alpha = (2 * (normal @ view_dir))[:, None] * normal_dot_light
+        cos_alpha -= view_dot_light
+        cos_alpha /= view_length
+        np.clip(cos_alpha, 0, 1, out=cos_alpha)
+
+        intensity = (materials.kd[ids, None] * np.maximum(normal_dot_light, 0)
+                     + materials.ks[ids, None] * cos_alpha ** materials.shininess[ids, None])
+        intensity *= lights.attenuations
+        result[start:end] += intensity @ lights.colors
+    return result
@@ -1,14 +1,19 @@
+import argparse
+import logging
 import pygame
 import math
 import numpy as np
-from bsptree import Polygon, BSPNode
+from bsptree import Polygon, BSPNode, FlatBSPTree, BuildStats, PotentiallyVisibleSet, TraversalCache, PLANE_EPSILON
+from frustum import frustum_planes
+from rasterizer import ZBufferRasterizer
+from scene_loader import load_scene, split_polygons, scene_hash
+from profiling import FrameProfiler
+from scheduler import FrameScheduler
+from world import WorldPager
 import random
 
 
-pygame.init()
 width, height = 1000, 800
-pygame.display.set_mode((width, height))
-clock = pygame.time.Clock()
 
 fov = 90.0
 aspect = width / height
@@ -20,43 +25,48 @@ camera_front = np.array([0, 0, -1], dtype=np.float64)
 pitch, yaw, roll = 0, 180, 0
 
 polygons_mode = False
+fill_backend = "bsp"        # "bsp" - algorytm malarza po drzewie BSP, "zbuffer" - rasteryzator z buforem głębokości
+zbuffer_rasterizers = {}    # rasteryzatory dla kolejnych rozdzielczości (poziomy szczegółów)
+use_pvs = False             # odrzucanie wielokątów niewidocznych z komórki kamery; PVS jest tylko wczytywane z pliku
+                            # policzonego wcześniej: python main.py --compute-pvs
+use_traversal_cache = True  # kolejność z poprzedniej klatki, poprawiana tylko o płaszczyzny, przez które przeszła kamera
+traversal_cache = None
+bsp_splitter = "first"      # "first" - pierwszy wielokąt (najmniej węzłów), "random" / "strided" - najtańsza płaszczyzna
+                            # z próbki (płytsze drzewo, ale więcej węzłów)
+bsp_epsilon = PLANE_EPSILON  # wierzchołki bliżej płaszczyzny podziału niż tyle leżą na niej (0 - dokładne porównania)
 current_tick = 0
+log_level = logging.WARNING     # logging.DEBUG - stan kamery co 40 klatek i komunikaty z budowy drzewa BSP
+show_hud = False                # nakładka z czasami etapów i licznikami ostatniej klatki (klawisz h)
+profile_export = None           # np. "profile.csv" / "profile.json" - próbki klatek zapisywane przy wyjściu
+profiler = FrameProfiler()
+target_frame_ms = 25            # tryb adaptacyjny: poziom szczegółów spada, gdy klatka trwa dłużej (None - wyłączony)
+max_detail_level = 2            # 1 - krawędzie bez wygładzania / z-bufor w połowie rozdzielczości, 2 - bez krawędzi
+world_dir = None                # katalog świata podzielonego na kolumny (python world.py scena katalog); None - cała
+world_load_radius = 64.0        # scena naraz; kolumny bliżej kamery niż world_load_radius są wczytywane w tle,
+world_memory_budget = 256 << 20  # dalsze zwalniane, gdy zajmują więcej niż world_memory_budget bajtów
+world_traversal_caches = {}     # TraversalCache dla każdej wczytanej kolumny
+world_polygons_cache = None     # (klucze widocznych kolumn, ich wielokąty) dla trybu krawędzi i z-bufora
+logger = logging.getLogger(__name__)
 
 
 def load_polygons(file_path):
-    polygons = []
-    with open(file_path, "r") as f:
-        for line in f:
-            if line[0] != "#":
-                line = line.split("#")[0]
-                points = []
-                for point_str in line.split("), ("):
-                    point_str = point_str.replace("(", "").replace(")", "")
-                    x, y, z = map(float, point_str.split(","))
-                    points.append((x, y, z))
-                if len(points) > 0:
-                    polygons.append(points)
-    return polygons
+    vertices, offsets = load_scene(file_path)
+    return [[tuple(point) for point in points] for points in split_polygons(vertices.tolist(), offsets)]
 
 
 def draw_axes(screen):
     length = 0.8
-    start = project_point(np.array([0, 0, 0]))
-    end_x = project_point(np.array([length, 0, 0]))
-    end_y = project_point(np.array([0, length, 0]))
-    end_z = project_point(np.array([0, 0, length]))
+    axes = np.array([[0, 0, 0], [length, 0, 0], [0, length, 0], [0, 0, length]], dtype=np.float64)
+    screen_points, in_front = project_points(axes)
 
-    # print(f'start {start}   end_z {end_z}')
-
-    if start is None:
+    if not in_front[0]:
         return
 
-    if end_x is not None:
-        pygame.draw.line(screen, (255, 0, 0), start, end_x, 2)  # Oś X - czerwona
-    if end_y is not None:
-        pygame.draw.line(screen, (0, 255, 0), start, end_y, 2)  # Oś Y - zielona
-    if end_z is not None:
-        pygame.draw.line(screen, (0, 0, 255), start, end_z, 2)  # Oś Z - niebieska
+    start = screen_points[0].tolist()
+    colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]  # Oś X - czerwona, Y - zielona, Z - niebieska
+    for i, color in enumerate(colors, start=1):
+        if in_front[i]:
+            pygame.draw.line(screen, color, start, screen_points[i].tolist(), 2)
 
 
 def magnitude(v):
@@ -101,26 +111,69 @@ def build_projection_matrix():
     return projection_matrix
 
 
-def project_point(point):
-    if not is_point_in_front_of_camera(point):
-        return None
+def build_transformation_matrix():
+    # macierz widoku i rzutowania liczona raz na klatkę
+    return np.dot(build_projection_matrix(), build_view_matrix())
+
+
+def build_frustum_planes(transformation_matrix=None):
+    # płaszczyzny ostrosłupa widzenia bieżącej kamery
+    if transformation_matrix is None:
+        transformation_matrix = build_transformation_matrix()
+    return frustum_planes(transformation_matrix)
+
+
+def flatten_polygons(polygons):
+    # wierzchołki wszystkich wielokątów w jednej tablicy (N, 3) + tablica offsetów (P + 1)
+    counts = np.array([len(points) for points in polygons], dtype=np.int64)
+    offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    if len(polygons) == 0:
+        return np.zeros((0, 3), dtype=np.float64), offsets
+    vertices = np.concatenate([np.asarray(points, dtype=np.float64).reshape(-1, 3) for points in polygons])
+    return vertices, offsets
 
-    point = np.array([point[0], point[1], point[2], 1])
 
-    view_matrix = build_view_matrix()
-    projection_matrix = build_projection_matrix()
-    transformation_matrix = np.dot(projection_matrix, view_matrix)
+def project_points(points, transformation_matrix=None):
+    # rzutowanie wszystkich punktów naraz: (N, 4) @ (4, 4)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if transformation_matrix is None:
+        transformation_matrix = build_transformation_matrix()
 
-    transformed_point = np.dot(transformation_matrix, point)
+    in_front = np.dot(points - camera_pos, camera_front) > 0
 
-    if transformed_point[3] == 0:
-        transformed_point[3] = 0.001
-    normalized_point = transformed_point / transformed_point[3]
+    homogeneous = np.empty((len(points), 4), dtype=np.float64)
+    homogeneous[:, :3] = points
+    homogeneous[:, 3] = 1
+    transformed_points = homogeneous @ transformation_matrix.T
 
-    x_screen = int((normalized_point[0] + 1) * 0.5 * width)
-    y_screen = int((1 - normalized_point[1]) * 0.5 * height)
+    w = transformed_points[:, 3]
+    w[w == 0] = 0.001
+    normalized_x = transformed_points[:, 0] / w
+    normalized_y = transformed_points[:, 1] / w
 
-    return x_screen, y_screen
+    screen_points = np.empty((len(points), 2), dtype=np.int64)
+    screen_points[:, 0] = ((normalized_x + 1) * 0.5 * width).astype(np.int64)
+    screen_points[:, 1] = ((1 - normalized_y) * 0.5 * height).astype(np.int64)
+
+    return screen_points, in_front
+
+
+def project_polygons(vertices, offsets, transformation_matrix=None):
+    # wielokąt jest widoczny tylko, gdy wszystkie jego wierzchołki są przed kamerą
+    screen_points, in_front = project_points(vertices, transformation_matrix)
+    polygon_visible = np.zeros(len(offsets) - 1, dtype=bool)
+    non_empty = offsets[1:] > offsets[:-1]
+    if len(in_front) > 0 and np.any(non_empty):
+        polygon_visible[non_empty] = np.logical_and.reduceat(in_front, offsets[:-1][non_empty])
+    return screen_points, polygon_visible
+
+
+def project_point(point):
+    screen_points, in_front = project_points(point)
+    if not in_front[0]:
+        return None
+    return int(screen_points[0, 0]), int(screen_points[0, 1])
 
 
 # def calculate_camera_parameters_from_euler_angles():
@@ -145,47 +198,191 @@ def project_point(point):
 #     camera_up = np.dot(camera_up, roll_rotation_matrix)
 #     camera_up = normalize(camera_up)
 
-def draw_polygons_edges(screen, polygons):
-    for points in polygons:
-        projected_points = []
-        for point in points:
-            projected_point = project_point(point)
-            if projected_point is None:
-                projected_points = []
-                break
-            projected_points.append(projected_point)
-        if len(projected_points) > 0:
-            pygame.draw.aalines(screen, (180, 180, 180), True, projected_points)
+def draw_polygons_edges(screen, polygons, detail=0):
+    vertices, offsets = polygons
+    with profiler.timer("project"):
+        screen_points, polygon_visible = project_polygons(vertices, offsets)
+    visible = np.flatnonzero(polygon_visible)
+    draw_lines = pygame.draw.aalines if detail == 0 else pygame.draw.lines
+    with profiler.timer("draw"):
+        for i in visible:
+            draw_lines(screen, (180, 180, 180), True, screen_points[offsets[i]:offsets[i + 1]].tolist())
+    profiler.count("polygons_drawn", len(visible))
 
 
-def build_bsp_tree(polygons):
+def build_bsp_tree(polygons, strategy=None, stats=None):
     root = BSPNode([Polygon(p) for p in polygons])
-    root.build_tree()
+    root.build_tree(strategy=strategy or bsp_splitter, stats=stats, epsilon=bsp_epsilon)
     return root
 
 
-def sort_polygons(bsp_tree):
-    sorted_polygons = bsp_tree.traverse(camera_pos, camera_front)
-    # if current_tick % 40 == 0:
-    #     print(f'Sorted list:')
-    #     for i, polygon in enumerate(sorted_polygons):
-    #         print(f'Sorted polygon at {i} is {polygon.vertices}')
-    return sorted_polygons[::-1]
-
-
-def draw_polygons(screen, bsp_tree):
-    sorted_polygons = sort_polygons(bsp_tree)
-    for poly in sorted_polygons:
-        points = []
-        for point in poly.vertices:
-            projected_point = project_point(point)
-            if projected_point is None:
-                points = []
-                break
-            points.append(projected_point)
-        if len(points) > 0:
+def load_or_build_bsp_tree(scene_file, scene_polygons=None, stats=None):
+    # gotowe drzewo jest zapisywane obok sceny i wczytywane ponownie, dopóki scena się nie zmieni;
+    # scena (o ile nie została już wczytana) jest czytana tylko wtedy, gdy drzewo trzeba zbudować od nowa
+    tree_file = scene_file + ".bsp"
+    expected_hash = scene_hash(scene_file, salt=f'{bsp_splitter}:{bsp_epsilon}')
+    try:
+        return FlatBSPTree.load(tree_file, expected_hash)
+    except (OSError, ValueError):
+        pass
+
+    if scene_polygons is None:
+        with profiler.stage("load"):
+            scene_polygons = load_scene(scene_file)
+    bsp_tree = FlatBSPTree.from_node(build_bsp_tree(split_polygons(*scene_polygons), stats=stats))
+    try:
+        bsp_tree.save(tree_file, expected_hash)
+    except OSError:
+        pass
+    return bsp_tree
+
+
+def load_pvs(scene_file):
+    # None, gdy nie ma aktualnego pliku - liczenie PVS trwa zbyt długo, żeby robić je przy starcie
+    try:
+        expected_hash = scene_hash(scene_file, salt=f'{bsp_splitter}:{bsp_epsilon}')
+        return PotentiallyVisibleSet.load(scene_file + ".pvs", expected_hash)
+    except (OSError, ValueError):
+        return None
+
+
+def compute_pvs(scene_file, bsp_tree):
+    pvs = PotentiallyVisibleSet.compute(bsp_tree)
+    pvs.save(scene_file + ".pvs", scene_hash(scene_file, salt=f'{bsp_splitter}:{bsp_epsilon}'))
+    return pvs
+
+
+def traversal_cache_for(bsp_tree, chunk_key=None):
+    # jedna pamięć kolejności dla całej sceny albo osobna dla każdej kolumny świata
+    global traversal_cache
+    cache = traversal_cache if chunk_key is None else world_traversal_caches.get(chunk_key)
+    if cache is None or cache.tree is not bsp_tree:
+        cache = TraversalCache(bsp_tree)
+        if chunk_key is None:
+            traversal_cache = cache
+        else:
+            world_traversal_caches[chunk_key] = cache
+    return cache
+
+
+def sort_polygons(bsp_tree, transformation_matrix=None, pvs=None, chunk_key=None):
+    # indeksy wielokątów płaskiego drzewa od najdalszego do najbliższego, bez poddrzew spoza ostrosłupa widzenia
+    # i bez wielokątów niewidocznych z komórki, w której jest kamera
+    with profiler.timer("traverse"):
+        visible_polygons = pvs.visible_polygons(bsp_tree, camera_pos) if pvs is not None else None
+        frustum = build_frustum_planes(transformation_matrix)
+        if use_traversal_cache:
+            cache = traversal_cache_for(bsp_tree, chunk_key)
+            sorted_polygons = cache.traverse(camera_pos, frustum=frustum, visible_polygons=visible_polygons)
+            profiler.count("flipped_planes", cache.flipped)
+        else:
+            sorted_polygons = bsp_tree.traverse(camera_pos, frustum=frustum, visible_polygons=visible_polygons)
+    profiler.count("culled_nodes", bsp_tree.culled_nodes)
+    profiler.count("culled_polygons", bsp_tree.culled_polygons)
+    return sorted_polygons
+
+
+def gather_polygons(vertices, offsets, polygon_ids):
+    # wierzchołki wybranych wielokątów w podanej kolejności + nowe offsety
+    starts = offsets[polygon_ids]
+    counts = offsets[polygon_ids + 1] - starts
+    gathered_offsets = np.zeros(len(polygon_ids) + 1, dtype=np.int64)
+    np.cumsum(counts, out=gathered_offsets[1:])
+    vertex_ids = np.repeat(starts - gathered_offsets[:-1], counts) + np.arange(gathered_offsets[-1])
+    return vertices[vertex_ids], gathered_offsets
+
+
+def draw_polygons(screen, bsp_tree, pvs=None, detail=0, chunk_key=None):
+    transformation_matrix = build_transformation_matrix()
+    sorted_polygons = sort_polygons(bsp_tree, transformation_matrix, pvs, chunk_key)
+    # rzutujemy tylko wierzchołki wielokątów, które przeszły przez odrzucanie
+    with profiler.timer("project"):
+        vertices, offsets = gather_polygons(bsp_tree.vertices, bsp_tree.vertex_offsets, sorted_polygons)
+        screen_points, polygon_visible = project_polygons(vertices, offsets, transformation_matrix)
+    visible = np.flatnonzero(polygon_visible)
+    with profiler.timer("draw"):
+        for i in visible:
+            points = screen_points[offsets[i]:offsets[i + 1]].tolist()
             pygame.draw.polygon(screen, (50, 50, 50), points)
-            pygame.draw.aalines(screen, (255, 255, 255), True, points)
+            if detail == 0:
+                pygame.draw.aalines(screen, (255, 255, 255), True, points)
+            elif detail == 1:
+                pygame.draw.lines(screen, (255, 255, 255), True, points)
+    profiler.count("polygons_drawn", len(visible))
+
+
+def draw_polygons_zbuffer(screen, scene_polygons, detail=0):
+    # na niższych poziomach szczegółów rasteryzujemy w mniejszej rozdzielczości i skalujemy obraz
+    size = (screen.get_width() >> min(detail, 1), screen.get_height() >> min(detail, 1))
+    zbuffer_rasterizer = zbuffer_rasterizers.get(size)
+    if zbuffer_rasterizer is None:
+        zbuffer_rasterizer = zbuffer_rasterizers[size] = ZBufferRasterizer(*size)
+
+    vertices, offsets = scene_polygons
+    in_front = np.dot(vertices - camera_pos, camera_front) > 0
+    with profiler.timer("draw"):
+        if size == screen.get_size():
+            zbuffer_rasterizer.draw(screen, vertices, offsets, build_transformation_matrix(), in_front)
+        else:
+            target = pygame.Surface(size)
+            zbuffer_rasterizer.draw(target, vertices, offsets, build_transformation_matrix(), in_front)
+            target.set_colorkey((0, 0, 0))
+            screen.blit(pygame.transform.scale(target, screen.get_size()), (0, 0))
+    profiler.count("polygons_drawn", len(offsets) - 1)
+
+
+def draw_world(screen, pager, detail=0):
+    # kolumny od najdalszej do najbliższej, w każdej wielokąty w kolejności jej drzewa BSP
+    chunks = pager.visible_chunks(camera_pos)
+    for key in [key for key in world_traversal_caches if key not in pager.loaded]:
+        del world_traversal_caches[key]
+    for key, tree in chunks:
+        draw_polygons(screen, tree, detail=detail, chunk_key=key)
+    profiler.count("world_chunks", len(chunks))
+
+
+def world_polygons(pager):
+    # wielokąty wszystkich wczytanych kolumn jako jedna scena (vertices, offsets), sklejane po każdej zmianie
+    # kluczem są same widoczne kolumny - pager.wanted zmienia się bez podbicia pager.version
+    global world_polygons_cache
+    chunks = pager.visible_chunks(camera_pos)
+    chunk_keys = (pager.version, tuple(key for key, _ in chunks))
+    if world_polygons_cache is None or world_polygons_cache[0] != chunk_keys:
+        trees = [tree for _, tree in chunks]
+        vertices = np.concatenate([tree.vertices for tree in trees]) if trees else np.zeros((0, 3))
+        offsets = np.zeros(1, dtype=np.int64)
+        for tree in trees:
+            offsets = np.concatenate([offsets, offsets[-1] + tree.vertex_offsets[1:]])
+        world_polygons_cache = (chunk_keys, (vertices, offsets))
+    return world_polygons_cache[1]
+
+
+def render_frame(screen, scene_polygons, bsp_tree, filled=None, backend=None, pvs=None, detail=0, world=None):
+    if filled is None:
+        filled = polygons_mode
+    if backend is None:
+        backend = fill_backend
+
+    screen.fill((0, 0, 0))
+    draw_axes(screen)
+    if world is not None:
+        if filled and backend != "zbuffer":
+            draw_world(screen, world, detail)
+            return
+        scene_polygons = world_polygons(world)
+    if filled and backend == "zbuffer":
+        draw_polygons_zbuffer(screen, scene_polygons, detail)
+    elif filled:
+        draw_polygons(screen, bsp_tree, pvs, detail)
+    else:
+        draw_polygons_edges(screen, scene_polygons, detail)
+
+
+def set_camera(position, front, up=(0, 1, 0)):
+    global camera_pos, camera_front, camera_up
+    camera_pos = np.array(position, dtype=np.float64)
+    camera_front = normalize(np.array(front, dtype=np.float64))
+    camera_up = normalize(np.array(up, dtype=np.float64))
 
 
 def rotate_vector_around_axis(vector, axis, angle):
@@ -205,23 +402,67 @@ def rotate_vector_around_axis(vector, axis, angle):
 
 
 if __name__ == "__main__":
-    # polygons = load_polygons("polygons_single.txt")
-    # polygons = load_polygons("polygons_duo.txt")
-    polygons = load_polygons("polygons.txt")
-    bsp_tree = build_bsp_tree(polygons)
-    bsp_tree.print_tree()
+    parser = argparse.ArgumentParser(description="BSP scene viewer")
+    parser.add_argument("--compute-pvs", action="store_true",
+                        help="compute the potentially visible set of the scene, save it next to it and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=log_level, format="%(name)s: %(message)s")
+
+    # scene_file = "polygons_single.txt"
+    # scene_file = "polygons_duo.txt"
+    scene_file = "polygons.txt"
+    if args.compute_pvs:
+        bsp_tree = load_or_build_bsp_tree(scene_file)
+        with profiler.stage("pvs"):
+            compute_pvs(scene_file, bsp_tree)
+        print(f'PVS: {scene_file}.pvs, {profiler.stages["pvs_ms"] / 1000:.1f} s')
+        raise SystemExit
+
+    pygame.init()
+    pygame.display.set_mode((width, height))
+    scheduler = FrameScheduler(target_frame_ms=target_frame_ms, max_detail_level=max_detail_level)
+    hud_font = pygame.font.SysFont(None, 20)
+    world = None
+    if world_dir is not None:
+        # świat wczytywany kolumnami w tle - nic nie jest czytane z góry
+        world = WorldPager(world_dir, world_load_radius, world_memory_budget)
+        scene_polygons = bsp_tree = scene_pvs = None
+        print(f'Świat: {len(world.chunks)} kolumn {world.chunk_size:g} x {world.chunk_size:g}')
+    else:
+        # krawędzie i z-bufor rysują wielokąty sceny, bez podziałów z drzewa; wczytanie sceny z pamięci
+        # podręcznej load_scene jest tanie
+        with profiler.stage("load"):
+            scene_polygons = load_scene(scene_file)
+        build_stats = BuildStats()
+        with profiler.stage("bsp_build"):
+            bsp_tree = load_or_build_bsp_tree(scene_file, scene_polygons, stats=build_stats)
+        if build_stats.node_count > 0:
+            profiler.stages["bsp_splits"] = build_stats.split_count
+            print(f'BSP ({bsp_splitter}): {build_stats}')
+        else:
+            print(f'BSP wczytane z pliku: {bsp_tree.node_count} węzłów')
+        with profiler.stage("pvs"):
+            scene_pvs = load_pvs(scene_file) if use_pvs else None
+        if use_pvs and scene_pvs is None:
+            print(f'Brak aktualnego {scene_file}.pvs - python main.py --compute-pvs')
+        print(", ".join(f'{name}: {value:.1f}' for name, value in profiler.stages.items()))
 
-    for i, points in enumerate(polygons):
-        print(f'Polygon {i + 1}: {points}')
+        for i, points in enumerate(split_polygons(*scene_polygons)):
+            logger.debug('Polygon %d: %s', i + 1, points.tolist())
 
     running = True
     while running:
-        for event in pygame.event.get():
+        for event in scheduler.events():
             if event.type == pygame.QUIT:
                 running = False
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_t:
                     polygons_mode = not polygons_mode
+                if event.key == pygame.K_z:
+                    fill_backend = "zbuffer" if fill_backend == "bsp" else "bsp"
+                    print(f'Tryb wypełniania: {fill_backend}')
+                if event.key == pygame.K_h:
+                    show_hud = not show_hud
 
         keys_pressed = pygame.key.get_pressed()
 
@@ -280,14 +521,23 @@ if __name__ == "__main__":
 
         # print(f'camera_pos: {camera_pos}    camera_front: {camera_front}     camera_up: {camera_up}')
 
-        screen = pygame.display.get_surface()
-        screen.fill((0, 0, 0))
-
-        draw_axes(screen)
-        if polygons_mode:
-            draw_polygons(screen, bsp_tree)
-        else:
-            draw_polygons_edges(screen, polygons)
+        if world is not None:
+            # tylko zleca wczytanie brakujących kolumn - nie czeka na dysk
+            world.update(camera_pos)
+
+        # klatkę rysujemy tylko po zmianie czegokolwiek, co wpływa na obraz
+        state = (camera_pos.tobytes(), camera_front.tobytes(), camera_up.tobytes(), fov, polygons_mode, fill_backend,
+                 show_hud, world.version if world is not None else 0)
+        if scheduler.needs_redraw(state):
+            profiler.start_frame()
+            with scheduler.frame():
+                render_frame(pygame.display.get_surface(), scene_polygons, bsp_tree, pvs=scene_pvs,
+                             detail=scheduler.detail_level, world=world)
+                if show_hud:
+                    profiler.draw_hud(pygame.display.get_surface(), hud_font)
+                pygame.display.flip()
+            profiler.count("detail_level", scheduler.detail_level)
+            profiler.end_frame()
 
         current_tick = current_tick + 1
         if current_tick % 40 == 0:
@@ -295,9 +545,16 @@ if __name__ == "__main__":
             pitch = np.degrees(np.arcsin(-camera_front[1]))
             yaw = np.degrees(np.arctan2(camera_front[0], camera_front[2]))
             roll = np.degrees(np.arctan2(camera_up[0], camera_up[1]))
-            print(f"camera_pos: {camera_pos}, camera_front: {camera_front}, camera_up: {camera_up}, pitch: {pitch}, yaw: {yaw}, roll: {roll}, fov: {fov}")
-
-        pygame.display.flip()
-        clock.tick(60)
-
+            logger.debug("camera_pos: %s, camera_front: %s, camera_up: %s, pitch: %s, yaw: %s, roll: %s, fov: %s",
+                         camera_pos, camera_front, camera_up, pitch, yaw, roll, fov)
+
+        if world is not None and world.pending:
+            # kolumny jeszcze się wczytują - nie zasypiamy, żeby narysować je zaraz po wczytaniu
+            scheduler.wake()
+        scheduler.tick()
+
+    if world is not None:
+        world.close()
+    if profile_export:
+        profiler.export(profile_export)
     pygame.quit()
@@ -1,13 +1,16 @@
-import math
+import colorsys
+import functools
+import time
+from collections import OrderedDict
 
 import pygame
 import numpy as np
 
-pygame.init()
+from lighting import LightSet, MaterialSet, MATERIALS, shade
+from scheduler import FrameScheduler
+
 width, height = 1000, 800
 centerX, centerY = width // 2, height // 2
-screen = pygame.display.set_mode((width, height))
-clock = pygame.time.Clock()
 
 # specular_strength = 0.5     # siła składowej zwierciadlanej
 light_pos = np.array([300, 200, 100], dtype=np.float64)  # Dodaliśmy trzecią współrzędną dla światła
@@ -20,43 +23,60 @@ ks = 0.25                   # współczynnik odbicia światła kierunkowego
 kd = 0.75                   # współczynnik odbicia światła rozproszonego
 shininess = 50              # współczynnik n potęgi cos(alfa)
 
-ball_radius = 75
-ball_scale_factor = 2
+ball_radius = 150
+ball_scale_factor = 1
 
 current_material = 0
 
+extra_light_count = 0       # kolorowe światła wokół kulki (klawisz l: 0 / 8 / 16)
+extra_light_strength = 0.6  # łączne tłumienie dodatkowych świateł, dzielone po równo
+
+ball_cache_size = 32        # ile gotowych obrazów kulki trzymamy w pamięci
+ball_cache = OrderedDict()
+
+progressive = True          # kulka liczona najpierw z rzadkich próbek, potem zagęszczana w kolejnych klatkach
+refine_budget_ms = 12       # czas liczenia próbek na jedną klatkę
+max_coarse_step = 16        # największy krok próbkowania w ruchu
+target_frame_ms = 30        # bez progressive: przy wolnych klatkach kulka jest liczona z rzadszych próbek
+max_detail_level = 2        # każdy poziom to dwa razy większy krok próbkowania
+
 
 def setup_material():
     global ks, kd, ka, shininess, ambient_color
     print('Aktualnie wybrano kulkę:')
-    if current_material == 0:
-        ka = 0.19225
-        ks = 0.508273
-        kd = 0.50754
-        shininess = 51.2
-        ambient_color = (112, 112, 112)
-        print('metalową (srebro)')
-    if current_material == 1:
-        ka = 0.1
-        ks = 0.5
-        kd = 0.6
-        shininess = 64
-        ambient_color = (235, 20, 20)
-        print('pomalowaną farbą')
-    if current_material == 2:
-        ka = 0.05
-        ks = 0.2
-        kd = 0.6
-        shininess = 32
-        ambient_color = (139, 69, 19)
-        print('drewnianą')
-    if current_material == 3:
-        ka = 0.2
-        ks = 0.3
-        kd = 0.7
-        shininess = 128
-        ambient_color = (10, 165, 180)
-        print('plastikową')
+    material = MATERIALS.take(current_material)
+    ka = float(material.ka[0])
+    ks = float(material.ks[0])
+    kd = float(material.kd[0])
+    shininess = float(material.shininess[0])
+    ambient_color = tuple(int(c) for c in material.ambient_colors[0])
+    print(material.names[0])
+
+
+def current_material_set():
+    return MaterialSet(ka, kd, ks, shininess, ambient_color)
+
+
+def scene_lights(light=None, center=None, radius=None):
+    # główne światło (light_pos albo podane light) i extra_light_count kolorowych świateł na okręgu wokół kulki
+    lights = LightSet.single(light_pos if light is None else light, light_color, distance_attenuation)
+    if extra_light_count == 0:
+        return lights
+    center_x, center_y = (centerX, centerY) if center is None else center
+    if radius is None:
+        radius = ball_radius * ball_scale_factor
+    angles = 2 * np.pi * np.arange(extra_light_count) / extra_light_count
+    positions = np.stack([center_x + 1.5 * radius * np.cos(angles), center_y + 1.5 * radius * np.sin(angles),
+                          np.full(extra_light_count, float(radius))], axis=-1)
+    colors = [[255 * c for c in colorsys.hsv_to_rgb(i / extra_light_count, 0.7, 1)]
+              for i in range(extra_light_count)]
+    return lights.concat(LightSet(positions, colors, extra_light_strength / extra_light_count))
+
+
+def next_extra_lights():
+    global extra_light_count
+    extra_light_count = {0: 8, 8: 16}.get(extra_light_count, 0)
+    print(f'Dodatkowe światła: {extra_light_count}')
 
 
 def toggle_ball_quality():
@@ -72,45 +92,194 @@ def toggle_ball_quality():
 
 
 def phong_model(normal, view_dir, light_dir):
-    ambient = ka * np.array(ambient_color)
-    diffuse = distance_attenuation * max(np.dot(normal, light_dir), 0) * kd * light_color
-
-    reflect_dir = 2 * np.dot(normal, light_dir) * normal - light_dir
-
-    # krótszy sposób
-    specular = max(np.dot(view_dir, reflect_dir), 0) ** shininess * ks * light_color #* specular_strength
-
-    # sposób z wykorzystaniem cos(alfa)
-    # obliczamy kąt między wektorem odbitego światła (reflect_dir) a wektorem widoku (view_dir)
-    cos_alpha = np.dot(view_dir, reflect_dir) / (np.linalg.norm(view_dir) * np.linalg.norm(reflect_dir))
-    alpha = math.acos(max(cos_alpha, 0))  # Uwzględnienie ograniczenia, aby wartość była między 0 a π
-    specular = distance_attenuation * light_color * ks * math.cos(alpha) ** shininess
-
-    return ambient + diffuse + specular
-
-
-def draw_ball(screen):
-    real_radius = ball_radius * ball_scale_factor
-    for y in range(centerY - real_radius, centerY + real_radius, ball_scale_factor):
-        for x in range(centerX - real_radius, centerX + real_radius, ball_scale_factor):
-            distance_sq = (x - centerX) ** 2 + (y - centerY) ** 2
-            if distance_sq <= real_radius ** 2:
-                z = np.sqrt(real_radius ** 2 - distance_sq)
-
-                # normalizacja współrzędnych punktu na sferze do wektora normalnego
-                normal = np.array([x - centerX, y - centerY, z], dtype=np.float64)
-                normal /= np.linalg.norm(normal)
-
-                view_dir = np.array([0, 0, 1], dtype=np.float64)  # kierunek widoku (patrzymy na kulę z przodu)
-
-                light_dir = light_pos - np.array([x, y, 0], dtype=np.float64)  # kierunek światła
-                light_dir /= np.linalg.norm(light_dir)
-
-                color = phong_model(normal, view_dir, light_dir)
-                color = tuple(int(max(min(c, 255), 0)) for c in color)
-
-                # screen.set_at((x, y), color)
-                pygame.draw.circle(screen, color, (x, y), ball_scale_factor)
+    # model Phonga dla jednego światła (light_color, distance_attenuation) i bieżącego materiału, do podglądów
+    # offline: normal i light_dir (jednostkowe) mogą mieć kształt (..., 3), view_dir to jeden wektor. Liczy
+    # lighting.shade - próbki leżą w -light_dir, a światło w początku układu, więc kierunek do światła to light_dir
+    normal, light_dir = np.broadcast_arrays(np.asarray(normal, dtype=np.float64),
+                                            np.asarray(light_dir, dtype=np.float64))
+    lights = LightSet.single((0, 0, 0), light_color, distance_attenuation)
+    colors = shade(-light_dir.reshape(-1, 3), normal.reshape(-1, 3), lights, current_material_set(),
+                   view_dir=view_dir)
+    return colors.reshape(normal.shape)
+
+
+def sphere_samples(x, y, real_radius, center=None):
+    # maska próbek (x, y) leżących w obrysie kulki oraz punkty i wektory normalne tych próbek;
+    # bez center kulka jest na środku okna
+    center_x, center_y = (centerX, centerY) if center is None else center
+    distance_sq = (x - center_x) ** 2 + (y - center_y) ** 2
+    mask = distance_sq <= real_radius ** 2
+    x, y = x[mask], y[mask]
+    z = np.sqrt(real_radius ** 2 - distance_sq[mask])
+
+    # normalizacja współrzędnych punktu na sferze do wektora normalnego
+    normal = np.stack([x - center_x, y - center_y, z], axis=-1)
+    normal /= np.sqrt(np.einsum("ij,ij->i", normal, normal))[:, None]
+
+    points = np.stack([x, y, np.zeros_like(x)], axis=-1)
+    return mask, points, normal
+
+
+@functools.lru_cache(maxsize=8)
+def ball_geometry(radius, scale_factor):
+    # część niezależna od światła i materiału: maska kulki, punkty próbek i wektory normalne
+    real_radius = radius * scale_factor
+    xs = np.arange(centerX - real_radius, centerX + real_radius, scale_factor, dtype=np.float64)
+    ys = np.arange(centerY - real_radius, centerY + real_radius, scale_factor, dtype=np.float64)
+    x, y = np.meshgrid(xs, ys, indexing="ij")
+
+    mask, points, normal = sphere_samples(x, y, real_radius)
+    for array in (mask, points, normal):
+        array.flags.writeable = False
+    return mask, points, normal
+
+
+def shade_samples(points, normal, lights=None, materials=None):
+    # wszystkie światła sceny naraz; kierunek widoku (0, 0, 1) - patrzymy na kulę z przodu
+    if lights is None:
+        lights = scene_lights()
+    if materials is None:
+        materials = current_material_set()
+    return np.clip(shade(points, normal, lights, materials), 0, 255).astype(np.uint8)
+
+
+def shade_ball(radius, scale_factor):
+    # zwraca obraz kulki w rozdzielczości próbek (kolumny x, wiersze y jak w surfarray) i maskę kulki
+    mask, points, normal = ball_geometry(radius, scale_factor)
+    image = np.zeros(mask.shape + (3,), dtype=np.uint8)
+    image[mask] = shade_samples(points, normal)
+    return image, mask
+
+
+def material_key():
+    return ka, kd, ks, shininess, tuple(ambient_color)
+
+
+def ball_cache_key(radius, scale_factor):
+    # tłumienie świateł zaokrągla LightSet.key (lighting.py), więc powrót do tej samej wartości po += / -= 0.1
+    # trafia w cache
+    return material_key(), scene_lights().key(), radius, scale_factor
+
+
+def ball_surface(radius, scale_factor):
+    key = ball_cache_key(radius, scale_factor)
+    surface = ball_cache.get(key)
+    if surface is not None:
+        ball_cache.move_to_end(key)
+        return surface
+
+    image, mask = shade_ball(radius, scale_factor)
+    if scale_factor > 1:
+        # każda próbka zajmuje kwadrat scale_factor x scale_factor pikseli
+        image = image.repeat(scale_factor, axis=0).repeat(scale_factor, axis=1)
+    surface = pygame.surfarray.make_surface(image)
+    surface.set_colorkey((0, 0, 0))
+    store_ball_surface(key, surface)
+    return surface
+
+
+def store_ball_surface(key, surface):
+    ball_cache[key] = surface
+    if len(ball_cache) > ball_cache_size:
+        ball_cache.popitem(last=False)
+
+
+def draw_ball(screen, detail=0):
+    radius = ball_radius >> detail
+    scale_factor = ball_scale_factor << detail
+    real_radius = radius * scale_factor
+    screen.blit(ball_surface(radius, scale_factor), (centerX - real_radius, centerY - real_radius))
+
+
+class ProgressiveBall:
+    # kulka liczona coraz gęściej: najpierw co `step` pikseli (każda próbka zajmuje kwadrat step x step),
+    # potem krok jest połowiony aż do ball_scale_factor; siatki kolejnych kroków zawierają się w sobie, więc
+    # policzone próbki zostają, a każda klatka liczy tylko tyle kolumn nowych próbek, ile zmieści się w budżecie
+    def __init__(self, budget_ms=12.0, max_step=16, samples_per_ms=1000.0):
+        self.budget_ms = budget_ms
+        self.max_step = max_step
+        self.samples_per_ms = samples_per_ms    # szacowana wydajność liczenia, poprawiana po każdej porcji
+        self.key = None
+        self.done = False
+        self.surface = None
+
+    def reset(self, radius, scale_factor):
+        self.key = ball_cache_key(radius, scale_factor)
+        self.real_radius = radius * scale_factor
+        self.size = 2 * self.real_radius
+        self.final_step = scale_factor
+        self.surface = ball_cache.get(self.key)
+        self.done = self.surface is not None
+        if self.done:
+            ball_cache.move_to_end(self.key)
+            return
+
+        # najmniejszy krok, przy którym cała pierwsza siatka mieści się w budżecie
+        self.step = self.final_step
+        while self.step * 2 <= self.max_step and (self.size / self.step) ** 2 > self.budget_ms * self.samples_per_ms:
+            self.step *= 2
+        self.shown_step = None      # krok ostatniej pełnej siatki
+        self.next_column = 0        # pierwsza niepoliczona kolumna bieżącej siatki
+        self.image = np.zeros((self.size, self.size, 3), dtype=np.uint8)
+        self.shade_columns()
+
+    def refine(self):
+        if not self.done:
+            self.shade_columns(self.budget_ms * self.samples_per_ms)
+
+    def shade_columns(self, budget_samples=None):
+        # bez budżetu liczy całą bieżącą siatkę
+        step = self.step
+        rows = np.arange(0, self.size, step)
+        columns = np.arange(self.next_column, self.size, step)
+        count = len(columns)
+        if budget_samples is not None:
+            count = min(count, max(1, int(budget_samples // len(rows))))
+        i, j = np.meshgrid(columns[:count], rows, indexing="ij")
+        if self.shown_step is not None:
+            # próbki z rzadszej siatki już są policzone
+            new = (i % self.shown_step != 0) | (j % self.shown_step != 0)
+            i, j = i[new], j[new]
+
+        start = time.perf_counter()
+        mask, points, normal = sphere_samples((centerX - self.real_radius + i).astype(np.float64),
+                                              (centerY - self.real_radius + j).astype(np.float64), self.real_radius)
+        self.image[i[mask], j[mask]] = shade_samples(points, normal)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms > 0 and i.size > 0:
+            self.samples_per_ms += 0.3 * (i.size / elapsed_ms - self.samples_per_ms)
+
+        self.next_column = int(columns[count - 1]) + step
+        if self.next_column >= self.size:
+            self.shown_step = step
+            self.next_column = 0
+            if step > self.final_step:
+                self.step //= 2
+            else:
+                self.done = True
+                self.surface = self.grid_surface(step, self.size)
+                store_ball_surface(self.key, self.surface)
+
+    def grid_surface(self, step, columns_end):
+        # próbki siatki o kroku step z kolumn 0:columns_end, każda jako kwadrat step x step pikseli
+        samples = self.image[:columns_end:step, ::step]
+        surface = pygame.surfarray.make_surface(samples)
+        if step > 1:
+            surface = pygame.transform.scale(surface, (samples.shape[0] * step, samples.shape[1] * step))
+        surface.set_colorkey((0, 0, 0))
+        return surface
+
+    def draw(self, screen):
+        position = (centerX - self.real_radius, centerY - self.real_radius)
+        if self.done:
+            screen.blit(self.surface, position)
+            return
+        # cała kulka z ostatniej pełnej siatki, na to już policzone kolumny bieżącej siatki
+        screen.blit(self.grid_surface(self.shown_step, self.size), position, pygame.Rect(0, 0, self.size, self.size))
+        if self.next_column > 0:
+            refined = pygame.Rect(0, 0, self.next_column, self.size)
+            screen.fill((0, 0, 0), refined.move(position))
+            screen.blit(self.grid_surface(self.step, self.next_column), position, refined)
 
 
 def next_material():
@@ -122,11 +291,18 @@ def next_material():
 
 
 if __name__ == "__main__":
+    pygame.init()
+    screen = pygame.display.set_mode((width, height))
     setup_material()
+    if progressive:
+        scheduler = FrameScheduler()
+        ball = ProgressiveBall(refine_budget_ms, max_coarse_step)
+    else:
+        scheduler = FrameScheduler(target_frame_ms=target_frame_ms, max_detail_level=max_detail_level)
 
     running = True
     while running:
-        for event in pygame.event.get():
+        for event in scheduler.events():
             if event.type == pygame.QUIT:
                 running = False
             elif event.type == pygame.KEYDOWN:
@@ -134,6 +310,8 @@ if __name__ == "__main__":
                     next_material()
                 if event.key == pygame.K_o:
                     toggle_ball_quality()
+                if event.key == pygame.K_l:
+                    next_extra_lights()
 
         keys_pressed = pygame.key.get_pressed()
         speed = 30
@@ -154,11 +332,26 @@ if __name__ == "__main__":
             if distance_attenuation > 0.9:
                 distance_attenuation = 0.9
 
-        screen.fill((0, 0, 0))
-
-        draw_ball(screen)
-
-        pygame.display.flip()
-        clock.tick(60)
+        # kulkę rysujemy ponownie tylko po zmianie światła, materiału albo jakości
+        state = (tuple(light_pos.tolist()), distance_attenuation, current_material, extra_light_count, ball_radius,
+                 ball_scale_factor)
+        if scheduler.needs_redraw(state):
+            with scheduler.frame():
+                screen.fill((0, 0, 0))
+
+                if progressive:
+                    # w ruchu tylko rzadka siatka, po zatrzymaniu kolejne klatki ją zagęszczają
+                    if ball.key != ball_cache_key(ball_radius, ball_scale_factor):
+                        ball.reset(ball_radius, ball_scale_factor)
+                    else:
+                        ball.refine()
+                    ball.draw(screen)
+                    if not ball.done:
+                        scheduler.mark_dirty()
+                else:
+                    draw_ball(screen, scheduler.detail_level)
+
+                pygame.display.flip()
+        scheduler.tick()
 
     pygame.quit()
@@ -0,0 +1,178 @@
+import math
+
+import numpy as np
+
+from bsptree import concat_ranges
+from frustum import boxes_outside_frustum
+
+
+def part1by2(values):
+    # rozsuwa 21 najmłodszych bitów tak, że między każdymi dwoma zostają dwa zera (x -> x--x--x...)
+    values = values.astype(np.uint64) & np.uint64(0x1fffff)
+    for shift, mask in ((32, 0x1f00000000ffff), (16, 0x1f0000ff0000ff), (8, 0x100f00f00f00f00f),
+                        (4, 0x10c30c30c30c30c3), (2, 0x1249249249249249)):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def morton_codes(cells):
+    # kod Mortona komórek (N, 3): kolejne trójki bitów wskazują dziecko na kolejnych poziomach drzewa
+    return part1by2(cells[:, 0]) | (part1by2(cells[:, 1]) << np.uint64(1)) | (part1by2(cells[:, 2]) << np.uint64(2))
+
+
+def perspective_matrix(fov, aspect, near, far):
+    # jak gluPerspective: fov w stopniach, w pionie
+    f = 1 / math.tan(math.radians(fov) / 2)
+    return np.array([
+        [f / aspect, 0, 0, 0],
+        [0, f, 0, 0],
+        [0, 0, (far + near) / (near - far), 2 * far * near / (near - far)],
+        [0, 0, -1, 0]
+    ])
+
+
+def look_at_matrix(camera_pos, camera_front, camera_up):
+    # jak gluLookAt(camera_pos, camera_pos + camera_front, camera_up)
+    forward = np.asarray(camera_front, dtype=np.float64)
+    forward = forward / np.linalg.norm(forward)
+    side = np.cross(forward, camera_up)
+    side /= np.linalg.norm(side)
+    up = np.cross(side, forward)
+    rotation = np.eye(4)
+    rotation[0, :3] = side
+    rotation[1, :3] = up
+    rotation[2, :3] = -forward
+    translation = np.eye(4)
+    translation[:3, 3] = -np.asarray(camera_pos, dtype=np.float64)
+    return rotation @ translation
+
+
+class PointOctree:
+    # drzewo ósemkowe nad chmurą punktów: punkty są posortowane kodem Mortona, więc każdy węzeł to ciągły zakres
+    # points[starts[i]:starts[i] + counts[i]], a dzieci węzła to child_count kolejnych węzłów od first_child.
+    # Węzeł z więcej niż lod_size punktami ma też próbkę LOD - lod_size punktów rozłożonych równo po jego
+    # zakresie - zapisaną jako ciągły zakres tablicy lod_points; oba zakresy rysuje jedno glMultiDrawArrays
+    def __init__(self, points, leaf_size=4096, max_depth=10, lod_size=256):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.leaf_size = leaf_size
+        self.max_depth = min(max_depth, 21)
+        self.lod_size = lod_size
+
+        if len(points) == 0:
+            low, size = np.zeros(3), 1.0
+        else:
+            low = points.min(axis=0)
+            size = max(float((points.max(axis=0) - low).max()), 1e-9) * (1 + 1e-9)
+        resolution = 1 << self.max_depth
+        cells = np.clip(np.floor((points - low) * (resolution / size)), 0, resolution - 1).astype(np.int64)
+        codes = morton_codes(cells)
+        self.order = np.argsort(codes, kind="stable")    # indeks punktu w tablicy wejściowej
+        codes = codes[self.order]
+        cells = cells[self.order]
+        self.points = np.ascontiguousarray(points[self.order], dtype=np.float32)
+
+        # poziom po poziomie: dzielimy węzły z więcej niż leaf_size punktami; komórki poziomu level + 1 to
+        # zakresy punktów o tym samym prefiksie kodu, a dzieckiem węzła jest komórka leżąca w jego zakresie
+        level_starts = [np.zeros(1, dtype=np.int64)]
+        level_counts = [np.array([len(points)], dtype=np.int64)]
+        level_first_child = []
+        level_child_count = []
+        node_total = 1
+        for level in range(self.max_depth + 1):
+            starts, counts = level_starts[-1], level_counts[-1]
+            split = (counts > leaf_size) if level < self.max_depth else np.zeros(len(counts), dtype=bool)
+            first_child = np.zeros(len(counts), dtype=np.int64)
+            child_count = np.zeros(len(counts), dtype=np.int64)
+            level_first_child.append(first_child)
+            level_child_count.append(child_count)
+            if not np.any(split):
+                break
+
+            indices = concat_ranges(starts[split], counts[split])
+            prefix = codes[indices] >> np.uint64(3 * (self.max_depth - level - 1))
+            # różne węzły tego poziomu to różne komórki, więc prefiks zmienia się też na granicy zakresów
+            boundaries = np.concatenate([[0], np.flatnonzero(prefix[1:] != prefix[:-1]) + 1])
+            child_starts = indices[boundaries]
+            child_counts = np.diff(np.append(boundaries, len(indices)))
+
+            parents = np.searchsorted(starts, child_starts, side="right") - 1
+            parent_ids, parent_first, parent_children = np.unique(parents, return_index=True, return_counts=True)
+            first_child[parent_ids] = node_total + parent_first
+            child_count[parent_ids] = parent_children
+            node_total += len(child_starts)
+            level_starts.append(child_starts)
+            level_counts.append(child_counts)
+
+        self.starts = np.concatenate(level_starts)
+        self.counts = np.concatenate(level_counts)
+        self.first_child = np.concatenate(level_first_child)
+        self.child_count = np.concatenate(level_child_count)
+        self.levels = np.repeat(np.arange(len(level_starts)), [len(s) for s in level_starts])
+
+        # prostopadłościany węzłów: komórka siatki 2^level wyznaczona przez pierwszy punkt zakresu
+        cell_size = size / (1 << self.levels)
+        if len(points) == 0:
+            self.bounds_min = np.repeat(low[None, :], len(self.starts), axis=0)
+        else:
+            first_cells = cells[np.minimum(self.starts, len(points) - 1)] >> (self.max_depth - self.levels)[:, None]
+            self.bounds_min = low + first_cells * cell_size[:, None]
+        self.bounds_max = self.bounds_min + cell_size[:, None]
+
+        # próbki LOD: co (count / lod_size)-ty punkt zakresu - w kolejności Mortona to równomiernie po węźle
+        self.lod_counts = np.where(self.counts > lod_size, lod_size, 0)
+        self.lod_starts = np.zeros(len(self.counts), dtype=np.int64)
+        np.cumsum(self.lod_counts[:-1], out=self.lod_starts[1:])
+        sampled = self.lod_counts > 0
+        local = concat_ranges(np.zeros(np.count_nonzero(sampled), dtype=np.int64), self.lod_counts[sampled])
+        lod_indices = (np.repeat(self.starts[sampled], self.lod_counts[sampled])
+                       + local * np.repeat(self.counts[sampled], self.lod_counts[sampled]) // lod_size)
+        self.lod_points = np.ascontiguousarray(self.points[lod_indices])
+
+    @property
+    def node_count(self):
+        return len(self.starts)
+
+    def outside_frustum(self, frustum, nodes):
+        # jak FlatBSPTree.outside_frustum, tylko dla wybranych węzłów
+        return boxes_outside_frustum(frustum, self.bounds_min[nodes], self.bounds_max[nodes])
+
+    def select(self, camera_pos, frustum, fov, viewport_height, lod_pixels=64.0):
+        # zakresy do narysowania w tej klatce: (firsts, counts) w points i (lod_firsts, lod_counts) w lod_points.
+        # Od korzenia odrzucamy węzły poza ostrosłupem; węzeł, który na ekranie zajmuje najwyżej lod_pixels
+        # pikseli, rysujemy z próbki LOD, bliższe rozwijamy aż do liści - koszt rośnie z pokryciem ekranu
+        camera_pos = np.asarray(camera_pos, dtype=np.float64)
+        pixels_per_unit = viewport_height / (2 * math.tan(math.radians(fov) / 2))
+        full_nodes = []
+        lod_nodes = []
+        frontier = np.zeros(1 if len(self.points) else 0, dtype=np.int64)
+        while len(frontier):
+            frontier = frontier[~self.outside_frustum(frustum, frontier)]
+            # odległość od kamery do najbliższego punktu prostopadłościanu; 0, gdy kamera jest w środku
+            gap = np.maximum(np.maximum(self.bounds_min[frontier] - camera_pos, camera_pos - self.bounds_max[frontier]), 0)
+            distance = np.sqrt(np.einsum("ij,ij->i", gap, gap))
+            size = self.bounds_max[frontier, 0] - self.bounds_min[frontier, 0]
+            coarse = size * pixels_per_unit <= lod_pixels * distance
+            use_lod = coarse & (self.lod_counts[frontier] > 0)
+            full = ~use_lod & (coarse | (self.child_count[frontier] == 0))
+            lod_nodes.append(frontier[use_lod])
+            full_nodes.append(frontier[full])
+            descend = frontier[~use_lod & ~full]
+            frontier = concat_ranges(self.first_child[descend], self.child_count[descend])
+
+        full_nodes = np.concatenate(full_nodes) if full_nodes else np.zeros(0, dtype=np.int64)
+        lod_nodes = np.concatenate(lod_nodes) if lod_nodes else np.zeros(0, dtype=np.int64)
+        firsts, counts = merge_ranges(self.starts[full_nodes], self.counts[full_nodes])
+        return firsts, counts, self.lod_starts[lod_nodes].astype(np.int32), self.lod_counts[lod_nodes].astype(np.int32)
+
+
+def merge_ranges(firsts, counts):
+    # sąsiednie liście w kolejności Mortona często leżą jeden za drugim - łączymy je w jeden zakres
+    if len(firsts) == 0:
+        return firsts.astype(np.int32), counts.astype(np.int32)
+    order = np.argsort(firsts, kind="stable")
+    firsts, counts = firsts[order], counts[order]
+    new_range = np.ones(len(firsts), dtype=bool)
+    new_range[1:] = firsts[1:] != firsts[:-1] + counts[:-1]
+    range_ids = np.cumsum(new_range) - 1
+    merged_counts = np.bincount(range_ids, weights=counts).astype(np.int32)
+    return firsts[new_range].astype(np.int32), merged_counts
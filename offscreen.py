@@ -0,0 +1,50 @@
+import math
+import os
+import time
+
+# bez okna - SDL renderuje do pamięci
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import numpy as np
+
+import main
+
+
+def orbit_camera_path(center, radius, frame_count, height=1.0, turns=1.0):
+    # skryptowana ścieżka kamery: okrąg wokół środka sceny, kamera patrzy na środek
+    center = np.asarray(center, dtype=np.float64)
+    path = []
+    for i in range(frame_count):
+        angle = 2 * math.pi * turns * i / max(frame_count, 1)
+        position = center + np.array([radius * math.sin(angle), height, radius * math.cos(angle)])
+        path.append((position, center - position))
+    return path
+
+
+class OffscreenRenderer:
+    def __init__(self, polygons, bsp_tree=None, size=None):
+        pygame.init()
+        self.surface = pygame.Surface(size or (main.width, main.height))
+        self.scene_polygons = main.flatten_polygons(polygons)
+        if bsp_tree is None:
+            bsp_tree = main.FlatBSPTree.from_node(main.build_bsp_tree(polygons))
+        self.bsp_tree = bsp_tree
+
+    def render(self, camera_path, filled=False, backend="bsp"):
+        # zwraca czasy kolejnych klatek w sekundach; czasy etapów trafiają do main.profiler
+        frame_times = []
+        for position, front in camera_path:
+            start = time.perf_counter()
+            main.set_camera(position, front)
+            main.render_frame(self.surface, self.scene_polygons, self.bsp_tree, filled, backend)
+            frame_times.append(time.perf_counter() - start)
+            main.profiler.end_frame()
+        return frame_times
+
+    def framebuffer(self):
+        # kopia bufora klatki jako tablica (width, height, 3)
+        return pygame.surfarray.array3d(self.surface)
+
+    def save(self, file_path):
+        pygame.image.save(self.surface, file_path)
@@ -0,0 +1,122 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pygame
+from OpenGL.GL import *
+
+from point_buffer import PointBuffer, draw_points_immediate
+
+
+def create_context(width, height):
+    # kontekst OpenGL bez widocznego okna: OSMesa, gdy PYOPENGL_PLATFORM=osmesa, w przeciwnym razie ukryte okno
+    # pygame (na programowym Mesa llvmpipe z LIBGL_ALWAYS_SOFTWARE=1); zwracany obiekt trzeba trzymać do końca
+    if os.environ.get("PYOPENGL_PLATFORM") == "osmesa":
+        # moduł osmesa da się zaimportować tylko na tej platformie
+        from OpenGL import arrays, osmesa
+        context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        framebuffer = arrays.GLubyteArray.zeros((height, width, 4))
+        if not osmesa.OSMesaMakeCurrent(context, framebuffer, GL_UNSIGNED_BYTE, width, height):
+            raise RuntimeError("OSMesaMakeCurrent failed")
+        return context, framebuffer
+    pygame.init()
+    pygame.display.set_mode((width, height), pygame.OPENGL | pygame.DOUBLEBUF | pygame.HIDDEN)
+    return None
+
+
+def setup_view(width, height):
+    glViewport(0, 0, width, height)
+    glMatrixMode(GL_PROJECTION)
+    glLoadIdentity()
+    glOrtho(-2, 2, -2, 2, -2, 2)
+    glMatrixMode(GL_MODELVIEW)
+    glLoadIdentity()
+    glEnable(GL_DEPTH_TEST)
+
+
+def timed_frames(draw, frames, before_draw=None):
+    # czasy klatek w ms; glFinish czeka, aż karta (albo llvmpipe) naprawdę skończy rysować
+    times = []
+    for frame in range(frames):
+        start = time.perf_counter()
+        if before_draw is not None:
+            before_draw(frame)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        draw()
+        glFinish()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def point_benchmark(point_counts, modes=("vbo", "arrays", "immediate"), frames=10, update_fraction=0.01,
+                    immediate_limit=100000, seed=0):
+    rng = np.random.default_rng(seed)
+    results = []
+    for count in point_counts:
+        points = rng.uniform(-2, 2, (count, 3)).astype(np.float32)
+        for mode in modes:
+            result = {"points": count, "mode": mode, "upload_s": None, "draw_ms": None, "stream_ms": None,
+                      "scatter_ms": None}
+            results.append(result)
+            if mode == "immediate":
+                if count <= immediate_limit:
+                    draw_points_immediate(points)   # rozgrzewka
+                    result["draw_ms"] = float(np.median(timed_frames(lambda: draw_points_immediate(points), frames)))
+                continue
+
+            start = time.perf_counter()
+            buffer = PointBuffer(points, use_vbo=mode == "vbo", dynamic=True)
+            glFinish()
+            result["upload_s"] = time.perf_counter() - start
+            try:
+                buffer.draw()
+                result["draw_ms"] = float(np.median(timed_frames(buffer.draw, frames)))
+                if mode != "vbo":
+                    continue
+
+                # strumieniowanie: co klatkę zmienia się jeden ciągły fragment albo rozrzucone punkty
+                changed = max(1, int(count * update_fraction))
+                values = rng.uniform(-2, 2, (changed, 3)).astype(np.float32)
+
+                def update_slice(frame):
+                    buffer.update((frame * changed) % (count - changed + 1), values)
+
+                def update_scattered(frame):
+                    buffer.update_points(rng.integers(0, count, changed), values)
+
+                result["stream_ms"] = float(np.median(timed_frames(buffer.draw, frames, update_slice)))
+                result["scatter_ms"] = float(np.median(timed_frames(buffer.draw, frames, update_scattered)))
+            finally:
+                buffer.delete()
+    return results
+
+
+def print_point_benchmark(results):
+    def cell(value, fmt):
+        return f'{"-":>10}' if value is None else f'{value:>10{fmt}}'
+
+    print(f'{"points":>10} {"mode":>10} {"upload s":>10} {"draw ms":>10} {"stream ms":>10} {"scatter ms":>10}')
+    for r in results:
+        print(f'{r["points"]:>10} {r["mode"]:>10} {cell(r["upload_s"], ".3f")} {cell(r["draw_ms"], ".2f")} '
+              f'{cell(r["stream_ms"], ".2f")} {cell(r["scatter_ms"], ".2f")}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offscreen point cloud drawing benchmark "
+                                                 "(PYOPENGL_PLATFORM=osmesa or LIBGL_ALWAYS_SOFTWARE=1)")
+    parser.add_argument("--points", type=int, nargs="+", default=[1000000, 3000000, 10000000])
+    parser.add_argument("--modes", nargs="+", default=["vbo", "arrays", "immediate"],
+                        choices=["vbo", "arrays", "immediate"])
+    parser.add_argument("--frames", type=int, default=10)
+    parser.add_argument("--update-fraction", type=float, default=0.01, help="part of the points changed per frame")
+    parser.add_argument("--immediate-limit", type=int, default=100000,
+                        help="skip glBegin/glVertex drawing above this many points")
+    parser.add_argument("--size", type=int, nargs=2, default=[1000, 800])
+    args = parser.parse_args()
+
+    context = create_context(*args.size)
+    setup_view(*args.size)
+    print(f'{glGetString(GL_RENDERER).decode()}')
+    print_point_benchmark(point_benchmark(args.points, args.modes, args.frames, args.update_fraction,
+                                          args.immediate_limit))
@@ -0,0 +1,106 @@
+import numpy as np
+from OpenGL.GL import *
+
+
+class PointBuffer:
+    # chmura punktów rysowana jednym glDrawArrays: punkty są raz wysyłane do bufora wierzchołków (VBO) na karcie
+    # graficznej, a przy zmianie wysyłamy tylko zmienione fragmenty (glBufferSubData); bez VBO (use_vbo=False)
+    # rysujemy z tablicy wierzchołków w pamięci programu (client-side vertex arrays)
+    def __init__(self, points, use_vbo=True, dynamic=False, merge_gap=1024):
+        self.use_vbo = use_vbo
+        self.usage = GL_DYNAMIC_DRAW if dynamic else GL_STATIC_DRAW
+        self.merge_gap = merge_gap      # zmienione punkty odległe o mniej niż tyle wysyłamy jednym fragmentem
+        self.buffer = None
+        self.points = None
+        self.uploaded_bytes = 0         # licznik wysłanych danych - do pomiarów strumieniowania
+        self.upload(points)
+
+    def __len__(self):
+        return len(self.points)
+
+    def upload(self, points):
+        # cały bufor od nowa, np. gdy zmieniła się liczba punktów
+        self.points = np.ascontiguousarray(points, dtype=np.float32).reshape(-1, 3)
+        if not self.use_vbo:
+            return
+        if self.buffer is None:
+            self.buffer = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+        glBufferData(GL_ARRAY_BUFFER, self.points.nbytes, self.points if len(self.points) else None, self.usage)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.uploaded_bytes += self.points.nbytes
+
+    def update(self, start, values):
+        # nadpisuje punkty start:start+len(values) i wysyła tylko ten fragment
+        values = np.asarray(values, dtype=np.float32).reshape(-1, 3)
+        end = start + len(values)
+        if start < 0 or end > len(self.points):
+            raise IndexError(f'points {start}:{end} out of range 0:{len(self.points)}')
+        self.points[start:end] = values
+        self.upload_range(start, end)
+
+    def update_points(self, indices, values):
+        # zmienione pojedyncze punkty (np. tylko część chmury się rusza); bliskie indeksy łączymy we fragmenty,
+        # żeby nie wywoływać glBufferSubData dla każdego punktu osobno
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) == 0:
+            return
+        self.points[indices] = np.asarray(values, dtype=np.float32).reshape(-1, 3)
+        indices = np.unique(indices)
+        breaks = np.flatnonzero(np.diff(indices) > self.merge_gap) + 1
+        for run in np.split(indices, breaks):
+            self.upload_range(int(run[0]), int(run[-1]) + 1)
+
+    def upload_range(self, start, end):
+        if not self.use_vbo or end <= start:
+            return
+        item_bytes = self.points.itemsize * 3
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+        glBufferSubData(GL_ARRAY_BUFFER, start * item_bytes, (end - start) * item_bytes, self.points[start:end])
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.uploaded_bytes += (end - start) * item_bytes
+
+    def draw(self, first=0, count=None):
+        if count is None:
+            count = len(self.points) - first
+        if count <= 0:
+            return
+        glEnableClientState(GL_VERTEX_ARRAY)
+        if self.use_vbo:
+            glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+            glVertexPointer(3, GL_FLOAT, 0, None)
+        else:
+            glVertexPointer(3, GL_FLOAT, 0, self.points)
+        glDrawArrays(GL_POINTS, first, count)
+        if self.use_vbo:
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+    def draw_ranges(self, firsts, counts):
+        # wiele zakresów punktów jednym wywołaniem, np. widoczne węzły PointOctree
+        if len(firsts) == 0:
+            return
+        glEnableClientState(GL_VERTEX_ARRAY)
+        if self.use_vbo:
+            glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+            glVertexPointer(3, GL_FLOAT, 0, None)
+        else:
+            glVertexPointer(3, GL_FLOAT, 0, self.points)
+        glMultiDrawArrays(GL_POINTS, np.asarray(firsts, dtype=np.int32), np.asarray(counts, dtype=np.int32),
+                          len(firsts))
+        if self.use_vbo:
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+    def delete(self):
+        if self.buffer is not None:
+            glDeleteBuffers(1, [self.buffer])
+            self.buffer = None
+
+
+def draw_points_immediate(points):
+    # dawna ścieżka: każdy punkt osobnym wywołaniem - tylko do porównań na małych chmurach
+    glBegin(GL_POINTS)
+    for point in points:
+        glVertex3fv(point)
+    glEnd()
@@ -0,0 +1,99 @@
+import csv
+import json
+import time
+from contextlib import contextmanager
+
+
+class FrameProfiler:
+    # liczniki i czasy etapów: jednorazowych (wczytywanie, budowa BSP) i liczonych co klatkę
+    # (przejście drzewa, rzutowanie, rysowanie); próbki klatek można zapisać do CSV / JSON
+    def __init__(self, enabled=True, max_samples=100000):
+        self.enabled = enabled
+        self.max_samples = max_samples
+        self.stages = {}
+        self.samples = []
+        self.current = {}
+        self.frame = 0
+        self._frame_start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name + "_ms"] = (time.perf_counter() - start) * 1000
+
+    @contextmanager
+    def timer(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            key = name + "_ms"
+            self.current[key] = self.current.get(key, 0.0) + (time.perf_counter() - start) * 1000
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.current[name] = self.current.get(name, 0) + value
+
+    def start_frame(self):
+        # pomija czas, w którym pętla czekała na zdarzenia i nic nie rysowała
+        self._frame_start = time.perf_counter()
+
+    def end_frame(self):
+        now = time.perf_counter()
+        if self.enabled:
+            sample = {"frame": self.frame, "frame_ms": (now - self._frame_start) * 1000}
+            sample.update(self.current)
+            self.samples.append(sample)
+            if len(self.samples) > self.max_samples:
+                del self.samples[:len(self.samples) - self.max_samples]
+        self.current = {}
+        self.frame += 1
+        self._frame_start = now
+
+    def last_sample(self):
+        return self.samples[-1] if self.samples else {}
+
+    def columns(self):
+        names = []
+        for sample in self.samples:
+            for name in sample:
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def export_csv(self, file_path):
+        with open(file_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns(), restval="")
+            writer.writeheader()
+            writer.writerows(self.samples)
+
+    def export_json(self, file_path):
+        with open(file_path, "w") as f:
+            json.dump({"stages": self.stages, "frames": self.samples}, f, indent=1)
+
+    def export(self, file_path):
+        if file_path.endswith(".csv"):
+            self.export_csv(file_path)
+        else:
+            self.export_json(file_path)
+
+    def hud_lines(self):
+        sample = self.last_sample()
+        lines = []
+        for name, value in sample.items():
+            if name == "frame":
+                continue
+            lines.append(f'{name}: {value:.2f}' if isinstance(value, float) else f'{name}: {value}')
+        return lines
+
+    def draw_hud(self, screen, font, position=(10, 10), color=(255, 255, 0)):
+        x, y = position
+        for line in self.hud_lines():
+            screen.blit(font.render(line, True, color), (x, y))
+            y += font.get_linesize()
@@ -0,0 +1,168 @@
+import numpy as np
+import pygame
+
+from scene_loader import triangulate_polygons
+
+
+class ZBufferRasterizer:
+    # programowy rasteryzator z buforem głębokości; trójkąty są przydzielane do kafelków ekranu,
+    # a każdy kafelek jest przetwarzany paczkami trójkątów jednocześnie dla wszystkich pikseli
+    def __init__(self, width, height, tile_size=32, batch_size=128):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.batch_size = batch_size
+        self.depth = np.full((width, height), np.inf, dtype=np.float32)
+        self.polygon_ids = np.full((width, height), -1, dtype=np.int64)
+        self.region = (0, 0, 0, 0)  # prostokąt (x0, x1, y0, y1) zapisany w ostatniej klatce
+        self._offsets = None
+        self._triangles = None
+        self._triangle_polygons = None
+
+        # środki pikseli w obrębie kafelka, w kolejności (x, y) jak w surfarray
+        local_x, local_y = np.meshgrid(np.arange(tile_size), np.arange(tile_size), indexing="ij")
+        self._tile_x = (local_x.ravel() + 0.5).astype(np.float32)
+        self._tile_y = (local_y.ravel() + 0.5).astype(np.float32)
+        self._tile_index = np.arange(tile_size * tile_size)
+
+    def triangles_for(self, offsets):
+        if self._offsets is not offsets:
+            self._triangles, self._triangle_polygons = triangulate_polygons(offsets)
+            self._offsets = offsets
+        return self._triangles, self._triangle_polygons
+
+    def rasterize(self, vertices, offsets, transformation_matrix, vertex_visible):
+        # czyścimy tylko obszar zapisany w poprzedniej klatce
+        x0, x1, y0, y1 = self.region
+        self.depth[x0:x1, y0:y1] = np.inf
+        self.polygon_ids[x0:x1, y0:y1] = -1
+        self.region = (0, 0, 0, 0)
+
+        triangles, triangle_polygons = self.triangles_for(offsets)
+        if len(triangles) == 0:
+            return self.polygon_ids
+
+        vertices = np.asarray(vertices, dtype=np.float64)
+        homogeneous = np.empty((len(vertices), 4), dtype=np.float64)
+        homogeneous[:, :3] = vertices
+        homogeneous[:, 3] = 1
+        transformed = homogeneous @ transformation_matrix.T
+        w = transformed[:, 3]
+        w[w == 0] = 0.001
+        screen_x = (transformed[:, 0] / w + 1) * 0.5 * self.width
+        screen_y = (1 - transformed[:, 1] / w) * 0.5 * self.height
+        screen_z = transformed[:, 2] / w
+
+        # jak w trybie malarza: pomijamy wielokąty, których nie wszystkie wierzchołki są przed kamerą
+        polygon_visible = np.zeros(len(offsets) - 1, dtype=bool)
+        non_empty = offsets[1:] > offsets[:-1]
+        polygon_visible[non_empty] = np.logical_and.reduceat(vertex_visible, offsets[:-1][non_empty])
+        keep = polygon_visible[triangle_polygons]
+        triangles = triangles[keep]
+        triangle_polygons = triangle_polygons[keep]
+
+        x = screen_x[triangles]
+        y = screen_y[triangles]
+        z = screen_z[triangles]
+
+        # współczynniki funkcji krawędziowych: lambda_i(px, py) = a_i * px + b_i * py + c_i
+        x0, x1, x2 = x[:, 0], x[:, 1], x[:, 2]
+        y0, y1, y2 = y[:, 0], y[:, 1], y[:, 2]
+        area = (x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0)
+
+        min_x = np.floor(x.min(axis=1))
+        max_x = np.ceil(x.max(axis=1))
+        min_y = np.floor(y.min(axis=1))
+        max_y = np.ceil(y.max(axis=1))
+        on_screen = (area != 0) & (max_x >= 0) & (min_x < self.width) & (max_y >= 0) & (min_y < self.height)
+        if not np.any(on_screen):
+            return self.polygon_ids
+
+        x0, x1, x2, y0, y1, y2 = (c[on_screen] for c in (x0, x1, x2, y0, y1, y2))
+        z = z[on_screen]
+        area = area[on_screen]
+        triangle_polygons = triangle_polygons[on_screen]
+        # wystarczą dwie współrzędne barycentryczne, trzecia to 1 - l0 - l1; float32 jak typowy bufor głębokości
+        a = (np.stack([y1 - y2, y2 - y0], axis=1) / area[:, None]).astype(np.float32)
+        b = (np.stack([x2 - x1, x0 - x2], axis=1) / area[:, None]).astype(np.float32)
+        c = (np.stack([x1 * y2 - x2 * y1, x2 * y0 - x0 * y2], axis=1) / area[:, None]).astype(np.float32)
+        z = z.astype(np.float32)
+
+        # przydział trójkątów do kafelków na podstawie prostokątów otaczających
+        tile = self.tile_size
+        tiles_x = (self.width + tile - 1) // tile
+        tiles_y = (self.height + tile - 1) // tile
+        tile_min_x = np.clip(min_x[on_screen] // tile, 0, tiles_x - 1).astype(np.int64)
+        tile_max_x = np.clip(max_x[on_screen] // tile, 0, tiles_x - 1).astype(np.int64)
+        tile_min_y = np.clip(min_y[on_screen] // tile, 0, tiles_y - 1).astype(np.int64)
+        tile_max_y = np.clip(max_y[on_screen] // tile, 0, tiles_y - 1).astype(np.int64)
+        span_x = tile_max_x - tile_min_x + 1
+        span_y = tile_max_y - tile_min_y + 1
+
+        pair_triangles = np.repeat(np.arange(len(span_x)), span_x * span_y)
+        pair_start = np.zeros(len(span_x), dtype=np.int64)
+        np.cumsum((span_x * span_y)[:-1], out=pair_start[1:])
+        pair_local = np.arange(len(pair_triangles)) - pair_start[pair_triangles]
+        pair_tiles = ((tile_min_x[pair_triangles] + pair_local % span_x[pair_triangles]) * tiles_y
+                      + tile_min_y[pair_triangles] + pair_local // span_x[pair_triangles])
+        order = np.argsort(pair_tiles, kind="stable")
+        pair_tiles = pair_tiles[order]
+        pair_triangles = pair_triangles[order]
+        tile_ids, tile_starts = np.unique(pair_tiles, return_index=True)
+        tile_ends = np.append(tile_starts[1:], len(pair_tiles))
+        self.region = (int(tile_ids.min() // tiles_y) * tile, min((int(tile_ids.max() // tiles_y) + 1) * tile, self.width),
+                       int((tile_ids % tiles_y).min()) * tile, min((int((tile_ids % tiles_y).max()) + 1) * tile, self.height))
+
+        for tile_id, start, end in zip(tile_ids.tolist(), tile_starts.tolist(), tile_ends.tolist()):
+            origin_x = (tile_id // tiles_y) * tile
+            origin_y = (tile_id % tiles_y) * tile
+            size_x = min(tile, self.width - origin_x)
+            size_y = min(tile, self.height - origin_y)
+            px = self._tile_x + origin_x
+            py = self._tile_y + origin_y
+
+            tile_depth = np.full(tile * tile, np.inf, dtype=np.float32)
+            tile_polygons = np.full(tile * tile, -1, dtype=np.int64)
+            for batch_start in range(start, end, self.batch_size):
+                batch = pair_triangles[batch_start:min(batch_start + self.batch_size, end)]
+                a_batch, b_batch, c_batch, z_batch = a[batch], b[batch], c[batch], z[batch]
+                l0 = a_batch[:, 0, None] * px + b_batch[:, 0, None] * py + c_batch[:, 0, None]
+                l1 = a_batch[:, 1, None] * px + b_batch[:, 1, None] * py + c_batch[:, 1, None]
+                l2 = 1 - l0 - l1
+                depth = z_batch[:, 0, None] * l0 + z_batch[:, 1, None] * l1 + z_batch[:, 2, None] * l2
+                inside = (l0 >= 0) & (l1 >= 0) & (l2 >= 0) & (depth >= -1) & (depth <= 1)
+                depth = np.where(inside, depth, np.float32(np.inf))
+
+                nearest = np.argmin(depth, axis=0)
+                nearest_depth = depth[nearest, self._tile_index]
+                closer = nearest_depth < tile_depth
+                tile_depth[closer] = nearest_depth[closer]
+                tile_polygons[closer] = triangle_polygons[batch[nearest[closer]]]
+
+            tile_depth = tile_depth.reshape(tile, tile)[:size_x, :size_y]
+            tile_polygons = tile_polygons.reshape(tile, tile)[:size_x, :size_y]
+            self.depth[origin_x:origin_x + size_x, origin_y:origin_y + size_y] = tile_depth
+            self.polygon_ids[origin_x:origin_x + size_x, origin_y:origin_y + size_y] = tile_polygons
+
+        return self.polygon_ids
+
+    def draw(self, surface, vertices, offsets, transformation_matrix, vertex_visible,
+             fill_color=(50, 50, 50), edge_color=(255, 255, 255)):
+        self.rasterize(vertices, offsets, transformation_matrix, vertex_visible)
+        x0, x1, y0, y1 = self.region
+        if x1 <= x0 or y1 <= y0:
+            return
+        polygon_ids = self.polygon_ids[x0:x1, y0:y1]
+
+        covered = polygon_ids >= 0
+        # krawędź tam, gdzie sąsiedni piksel należy do innego wielokąta
+        edges = np.zeros_like(covered)
+        edges[:-1, :] |= polygon_ids[:-1, :] != polygon_ids[1:, :]
+        edges[:, :-1] |= polygon_ids[:, :-1] != polygon_ids[:, 1:]
+        edges &= covered
+
+        pixels = pygame.surfarray.pixels3d(surface)
+        region = pixels[x0:x1, y0:y1]
+        region[covered] = fill_color
+        region[edges] = edge_color
+        del region, pixels
@@ -0,0 +1,116 @@
+import argparse
+import math
+
+import numpy as np
+
+
+def cube_faces(x, y, z, size=1.0):
+    # ściany sześcianu w tej samej kolejności co w polygons.txt
+    x1, y1, z1 = x + size, y + size, z + size
+    return [
+        [(x, y, z), (x1, y, z), (x1, y, z1), (x, y, z1)],       # bottom
+        [(x, y1, z), (x1, y1, z), (x1, y1, z1), (x, y1, z1)],   # top
+        [(x, y, z), (x1, y, z), (x1, y1, z), (x, y1, z)],       # x wall
+        [(x, y, z), (x, y, z1), (x, y1, z1), (x, y1, z)],       # z wall
+        [(x, y, z1), (x1, y, z1), (x1, y1, z1), (x, y1, z1)],   # x wall far
+        [(x1, y, z), (x1, y, z1), (x1, y1, z1), (x1, y1, z)],   # z wall far
+    ]
+
+
+def generate_cube_grid(count_x, count_y, count_z, spacing=2.0, size=1.0):
+    polygons = []
+    for i in range(count_x):
+        for j in range(count_y):
+            for k in range(count_z):
+                polygons.extend(cube_faces(i * spacing, j * spacing, k * spacing, size))
+    return polygons
+
+
+def generate_cubes(polygon_count, spacing=2.0, size=1.0, seed=0):
+    # siatka sześcianów jak w polygons.txt, przycięta do polygon_count ścian; seed 0 zostawia kolejność siatki,
+    # inne ziarno tasuje kolejność sześcianów (ściany jednego sześcianu zostają razem) - od kolejności zależy
+    # drzewo budowane strategią "first"
+    side = max(1, math.ceil((polygon_count / 6) ** (1 / 3)))
+    polygons = generate_cube_grid(side, side, side, spacing, size)[:polygon_count]
+    if seed == 0:
+        return polygons
+    cube_order = np.random.default_rng(seed).permutation((len(polygons) + 5) // 6)
+    return [polygons[i] for cube in cube_order.tolist() for i in range(6 * cube, min(6 * cube + 6, len(polygons)))]
+
+
+def generate_triangle_soup(polygon_count, extent=None, size=1.0, seed=0):
+    # losowe trójkąty w sześcianie extent^3 - tablica (N, 3, 3), każdy wiersz to jeden wielokąt; domyślny
+    # extent rośnie z liczbą trójkątów, tak że gęstość zostaje taka jak dla 1000 trójkątów w sześcianie 20^3
+    rng = np.random.default_rng(seed)
+    if extent is None:
+        extent = 20.0 * max(polygon_count / 1000, 1) ** (1 / 3)
+    centers = rng.uniform(0, extent, (polygon_count, 1, 3))
+    return centers + rng.uniform(-size, size, (polygon_count, 3, 3))
+
+
+def generate_intersecting_walls(polygon_count, extent=20.0, length=None, height=4.0, seed=0):
+    # pionowe ściany o losowym położeniu i kierunku, dłuższe niż odstępy między nimi, więc przecinają się
+    # nawzajem i wymuszają podziały - tablica (N, 4, 3); domyślna długość daje średnio ok. 4 przecięcia
+    # na ścianę niezależnie od ich liczby
+    rng = np.random.default_rng(seed)
+    if length is None:
+        length = min(extent, extent * math.sqrt(2 * math.pi / max(polygon_count, 1)))
+    centers = rng.uniform(0, extent, (polygon_count, 2))
+    angles = rng.uniform(0, math.pi, polygon_count)
+    half = 0.5 * length * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    start, end = centers - half, centers + half
+    walls = np.zeros((polygon_count, 4, 3))
+    walls[:, [0, 3], 0] = start[:, 0, None]
+    walls[:, [0, 3], 2] = start[:, 1, None]
+    walls[:, [1, 2], 0] = end[:, 0, None]
+    walls[:, [1, 2], 2] = end[:, 1, None]
+    walls[:, [2, 3], 1] = height
+    return walls
+
+
+SCENE_KINDS = {
+    "cubes": generate_cubes,
+    "soup": generate_triangle_soup,
+    "walls": generate_intersecting_walls,
+}
+
+
+def generate_scene(kind, polygon_count, seed=0):
+    return SCENE_KINDS[kind](polygon_count, seed=seed)
+
+
+def scene_bounds(polygons):
+    if isinstance(polygons, np.ndarray):
+        vertices = polygons.reshape(-1, 3)
+    else:
+        vertices = np.array([point for points in polygons for point in points], dtype=np.float64)
+    return vertices.min(axis=0), vertices.max(axis=0)
+
+
+def format_point(point):
+    return "(" + ", ".join(f'{c:g}' for c in point) + ")"
+
+
+def write_scene(file_path, polygons, comment=None):
+    with open(file_path, "w") as f:
+        if comment:
+            f.write(f'# {comment}\n')
+        if isinstance(polygons, np.ndarray):
+            # wielokąty o tej samej liczbie wierzchołków - jeden wiersz formatowany naraz
+            count, corners = polygons.shape[:2]
+            np.savetxt(f, polygons.reshape(count, corners * 3), fmt=", ".join(["(%g, %g, %g)"] * corners))
+            return
+        for points in polygons:
+            f.write(", ".join(format_point(point) for point in points) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Procedural scenes in the polygons.txt format")
+    parser.add_argument("kind", choices=sorted(SCENE_KINDS))
+    parser.add_argument("polygons", type=int, help="number of polygons")
+    parser.add_argument("output", help="scene file, e.g. walls_10k.txt")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    write_scene(args.output, generate_scene(args.kind, args.polygons, args.seed),
+                comment=f'{args.kind}, {args.polygons} polygons, seed {args.seed}')
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from arrayfile import save_arrays, load_arrays, read_meta
+
+
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".cache"
+HASH_SUFFIX = ".sha256"
+BLOCK_BYTES = 1 << 22
+
+
+SEPARATORS = str.maketrans("(),", "   ")
+
+
+def _parse_block(lines, dtype):
+    # komentarze jak dawniej: pomijamy linie zaczynające się od '#', resztę ucinamy na pierwszym '#'
+    counts = []
+    parts = []
+    for line in lines:
+        if line[0] == "#":
+            continue
+        if "#" in line:
+            line = line.split("#", 1)[0]
+        point_count = line.count("(")
+        if point_count == 0:
+            continue
+        counts.append(point_count)
+        parts.append(line)
+
+    if not parts:
+        return np.zeros((0, 3), dtype=dtype), np.zeros(0, dtype=np.int64)
+
+    text = " ".join(parts).translate(SEPARATORS)
+    values = np.fromstring(text, dtype=np.float64, sep=" ").astype(dtype, copy=False)
+    counts = np.array(counts, dtype=np.int64)
+    if len(values) != 3 * counts.sum():
+        raise ValueError("Every point must have exactly three coordinates")
+    return values.reshape(-1, 3), counts
+
+
+def iter_scene_blocks(file_path, dtype=np.float64, block_bytes=BLOCK_BYTES):
+    # strumieniowe wczytywanie: kolejne bloki linii jako (vertices, counts) - liczby wierzchołków wielokątów
+    with open(file_path, "r") as f:
+        while True:
+            lines = f.readlines(block_bytes)
+            if not lines:
+                break
+            yield _parse_block(lines, dtype)
+
+
+def parse_scene(file_path, dtype=np.float64):
+    vertex_blocks = []
+    count_blocks = []
+    for vertices, counts in iter_scene_blocks(file_path, dtype):
+        vertex_blocks.append(vertices)
+        count_blocks.append(counts)
+
+    counts = np.concatenate(count_blocks) if count_blocks else np.zeros(0, dtype=np.int64)
+    vertices = np.concatenate(vertex_blocks) if vertex_blocks else np.zeros((0, 3), dtype=dtype)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return vertices, offsets
+
+
+def source_signature(file_path):
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def scene_hash(file_path, salt="", use_cache=True):
+    # skrót zawartości pliku sceny, do sprawdzania plików zbudowanych na jej podstawie (.bsp, .pvs); zapisywany
+    # obok sceny. Zapisany skrót jest używany, dopóki rozmiar i czas modyfikacji sceny są takie same, więc
+    # sprawdzenie tych plików opiera się w praktyce na rozmiarze i czasie modyfikacji, jak pamięć podręczna
+    # load_scene - zmiana treści bez zmiany obu nie zostanie zauważona; use_cache=False zawsze czyta całą scenę
+    signature = source_signature(file_path)
+    hash_file = file_path + HASH_SUFFIX
+    hashes = {}
+    if use_cache:
+        try:
+            with open(hash_file, encoding="utf-8") as f:
+                stored = json.load(f)
+            if stored["signature"] == signature:
+                hashes = stored["hashes"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        if salt in hashes:
+            return hashes[salt]
+
+    digest = hashlib.sha256(salt.encode("utf-8"))
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    hashes[salt] = digest.hexdigest()
+    if use_cache:
+        try:
+            with open(hash_file, "w", encoding="utf-8") as f:
+                json.dump({"signature": signature, "hashes": hashes}, f)
+        except OSError:
+            pass
+    return hashes[salt]
+
+
+def cache_path(file_path):
+    return file_path + CACHE_SUFFIX
+
+
+def load_scene(file_path, dtype=np.float64, use_cache=True, mmap=False):
+    # zwraca (vertices (N, 3), offsets (P + 1)); wielokąt i to vertices[offsets[i]:offsets[i + 1]]
+    if not use_cache:
+        return parse_scene(file_path, dtype)
+
+    expected = {"version": CACHE_VERSION, "dtype": np.dtype(dtype).str, **source_signature(file_path)}
+    cache_file = cache_path(file_path)
+    if os.path.exists(cache_file):
+        try:
+            if read_meta(cache_file)["meta"] == expected:
+                _, arrays = load_arrays(cache_file, mmap=mmap)
+                return arrays["vertices"], arrays["offsets"]
+        except (ValueError, KeyError, OSError):
+            pass
+
+    vertices, offsets = parse_scene(file_path, dtype)
+    try:
+        save_arrays(cache_file, {"vertices": vertices, "offsets": offsets}, expected)
+    except OSError:
+        pass
+    return vertices, offsets
+
+
+def split_polygons(vertices, offsets):
+    # lista widoków (k, 3) na wierzchołki kolejnych wielokątów - bez kopiowania
+    return [vertices[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def triangulate_polygons(offsets):
+    # wachlarz trójkątów dla każdego wielokąta: (v0, vi, vi+1)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    counts = offsets[1:] - offsets[:-1]
+    triangle_counts = np.maximum(counts - 2, 0)
+    polygon_ids = np.repeat(np.arange(len(counts)), triangle_counts)
+    first_triangle = np.zeros(len(counts), dtype=np.int64)
+    np.cumsum(triangle_counts[:-1], out=first_triangle[1:])
+    local = np.arange(len(polygon_ids)) - first_triangle[polygon_ids]
+    starts = offsets[:-1][polygon_ids]
+    triangles = np.stack([starts, starts + local + 1, starts + local + 2], axis=1)
+    return triangles, polygon_ids
@@ -0,0 +1,100 @@
+import time
+from contextlib import contextmanager
+
+import pygame
+
+
+# zdarzenia, po których okno trzeba narysować ponownie, nawet jeśli stan sceny się nie zmienił
+REDRAW_EVENTS = tuple(getattr(pygame, name) for name in ("VIDEOEXPOSE", "VIDEORESIZE", "WINDOWEXPOSED",
+                                                         "WINDOWRESIZED", "WINDOWRESTORED") if hasattr(pygame, name))
+
+
+class FrameScheduler:
+    # rysuje klatkę tylko wtedy, gdy zmienił się stan sceny (pozycja kamery, fov, tryb, światło, materiał...);
+    # gdy nic się nie zmienia, pętla czeka na zdarzenie zamiast rysować 60 razy na sekundę.
+    # W trybie adaptacyjnym (target_frame_ms) obniża poziom szczegółów, gdy klatki są za wolne, a po
+    # zatrzymaniu rysuje jeszcze jedną klatkę w pełnej jakości
+    def __init__(self, fps=60, target_frame_ms=None, max_detail_level=0, smoothing=0.2, wait_timeout_ms=0):
+        self.fps = fps
+        self.target_frame_ms = target_frame_ms
+        self.max_detail_level = max_detail_level
+        self.smoothing = smoothing
+        self.wait_timeout_ms = wait_timeout_ms   # > 0 - budzi pętlę co jakiś czas nawet bez zdarzeń
+        self.detail_level = 0                    # poziom bieżącej klatki: 0 - pełna jakość, większy - szybciej
+        self.adaptive_level = 0                  # poziom dobrany do obciążenia, używany w ruchu
+        self.frame_ms = None                     # średnia krocząca czasu rysowania klatki
+        self.rendered_frames = 0
+        self.skipped_frames = 0
+        self.idle = False
+        self._state = None
+        self._dirty = True
+        self._clock = pygame.time.Clock()
+
+    def mark_dirty(self):
+        self._dirty = True
+        self.idle = False
+
+    def wake(self):
+        # pętla nie zaśnie w events(), ale klatka zostanie narysowana tylko po zmianie stanu
+        # (np. gdy coś jest wczytywane w tle i za chwilę zmieni obraz)
+        self.idle = False
+
+    def events(self):
+        # w stanie bezczynności blokuje się do pierwszego zdarzenia, potem zwraca wszystkie oczekujące
+        if self.idle and not self._dirty:
+            if self.wait_timeout_ms > 0:
+                first = pygame.event.wait(self.wait_timeout_ms)
+            else:
+                first = pygame.event.wait()
+            events = [first] if first.type != pygame.NOEVENT else []
+            events.extend(pygame.event.get())
+        else:
+            events = pygame.event.get()
+        if any(event.type in REDRAW_EVENTS for event in events):
+            self.mark_dirty()
+        return events
+
+    def needs_redraw(self, state):
+        # state - krotka z wszystkim, od czego zależy obraz; porównujemy ją z ostatnio narysowaną
+        if self._dirty or state != self._state:
+            self._state = state
+            self._dirty = False
+            self.idle = False
+            self.detail_level = self.adaptive_level
+            return True
+        if self.detail_level > 0:
+            # scena stoi - dorysowujemy ją w pełnej jakości
+            self.detail_level = 0
+            return True
+        self.idle = True
+        self.skipped_frames += 1
+        return False
+
+    @contextmanager
+    def frame(self):
+        start = time.perf_counter()
+        yield
+        self.frame_rendered((time.perf_counter() - start) * 1000)
+
+    def frame_rendered(self, frame_ms):
+        self.rendered_frames += 1
+        if self.detail_level != self.adaptive_level:
+            # klatka dorysowana w pełnej jakości po zatrzymaniu nie zmienia poziomu używanego w ruchu
+            return
+        if self.frame_ms is None:
+            self.frame_ms = frame_ms
+        else:
+            self.frame_ms += self.smoothing * (frame_ms - self.frame_ms)
+        if self.target_frame_ms is None:
+            return
+        if self.frame_ms > self.target_frame_ms * 1.1 and self.adaptive_level < self.max_detail_level:
+            self.adaptive_level += 1
+            self.frame_ms = None
+        elif self.frame_ms < self.target_frame_ms * 0.5 and self.adaptive_level > 0:
+            self.adaptive_level -= 1
+            self.frame_ms = None
+
+    def tick(self):
+        # ogranicza liczbę klatek, gdy coś się dzieje; w bezczynności i tak czekamy w events()
+        if not self.idle:
+            self._clock.tick(self.fps)
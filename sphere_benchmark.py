@@ -0,0 +1,49 @@
+import argparse
+import time
+
+import numpy as np
+
+import main_sphere
+from sphere_offline import parse_size, render_sphere
+
+
+def tiled_scaling_report(size, worker_counts=(1, 2, 4, 8), tile_sizes=(128, 256, 512), executor="process"):
+    width, height = size
+    start = time.perf_counter()
+    reference = render_sphere(width, height, workers=1)
+    single_time = time.perf_counter() - start
+
+    results = []
+    for tile_size in tile_sizes:
+        for workers in worker_counts:
+            start = time.perf_counter()
+            image = render_sphere(width, height, tile_size=tile_size, workers=workers, executor=executor)
+            render_time = time.perf_counter() - start
+            results.append({
+                "size": f'{width}x{height}',
+                "tile": tile_size,
+                "workers": workers,
+                "render_s": render_time,
+                "speedup": single_time / render_time if render_time > 0 else float("inf"),
+                "matches_single": bool(np.array_equal(reference, image)),
+            })
+    return results
+
+
+def print_scaling_report(results):
+    print(f'{"size":>10} {"tile":>5} {"workers":>8} {"render s":>9} {"speedup":>8} {"same":>5}')
+    for r in results:
+        print(f'{r["size"]:>10} {r["tile"]:>5} {r["workers"]:>8} {r["render_s"]:>9.3f} {r["speedup"]:>8.2f} '
+              f'{str(r["matches_single"]):>5}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tiled Phong render scaling with worker count and tile size")
+    parser.add_argument("--size", type=parse_size, default=(3840, 2160), help="WIDTHxHEIGHT")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--tiles", type=int, nargs="+", default=[128, 256, 512])
+    parser.add_argument("--executor", default="process", choices=["process", "thread"])
+    args = parser.parse_args()
+
+    main_sphere.setup_material()
+    print_scaling_report(tiled_scaling_report(args.size, args.workers, args.tiles, args.executor))
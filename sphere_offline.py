@@ -0,0 +1,130 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pygame
+
+import main_sphere
+
+
+def default_light(center, radius):
+    # światło w tym samym położeniu względem kulki co w oknie main_sphere, przeskalowane do promienia
+    window_radius = main_sphere.ball_radius * main_sphere.ball_scale_factor
+    offset = main_sphere.light_pos - np.array([main_sphere.centerX, main_sphere.centerY, 0], dtype=np.float64)
+    return np.array([center[0], center[1], 0], dtype=np.float64) + offset * (radius / window_radius)
+
+
+def image_tiles(width, height, tile_size, center, radius):
+    # prostokąty (x0, x1, y0, y1) kafelków; te, które nie dotykają kulki, pomijamy - zostają czarne
+    tiles = []
+    for x0 in range(0, width, tile_size):
+        x1 = min(x0 + tile_size, width)
+        for y0 in range(0, height, tile_size):
+            y1 = min(y0 + tile_size, height)
+            nearest_x = min(max(center[0], x0), x1 - 1)
+            nearest_y = min(max(center[1], y0), y1 - 1)
+            if (nearest_x - center[0]) ** 2 + (nearest_y - center[1]) ** 2 <= radius ** 2:
+                tiles.append((x0, x1, y0, y1))
+    return tiles
+
+
+def shade_tile(framebuffer, tile, center, radius, lights, materials):
+    x0, x1, y0, y1 = tile
+    x, y = np.meshgrid(np.arange(x0, x1, dtype=np.float64), np.arange(y0, y1, dtype=np.float64), indexing="ij")
+    mask, points, normal = main_sphere.sphere_samples(x, y, radius, center)
+    framebuffer[x0:x1, y0:y1][mask] = main_sphere.shade_samples(points, normal, lights, materials)
+
+
+def _shade_tile_worker(framebuffer_name, shape, tile, center, radius, lights, materials):
+    # proces roboczy: kafelek zapisuje prosto do bufora ramki w pamięci współdzielonej
+    framebuffer_memory = shared_memory.SharedMemory(name=framebuffer_name)
+    try:
+        framebuffer = np.ndarray(shape, dtype=np.uint8, buffer=framebuffer_memory.buf)
+        shade_tile(framebuffer, tile, center, radius, lights, materials)
+    finally:
+        del framebuffer
+        framebuffer_memory.close()
+    return tile
+
+
+def render_sphere(width, height, radius=None, light=None, tile_size=256, workers=None, executor="process"):
+    # obraz (kolumny x, wiersze y jak w surfarray) kulki na środku obrazu z bieżącym materiałem i światłami
+    # main_sphere; kafelki liczy pula procesów ("process") albo wątków ("thread"), workers=1 liczy
+    # wszystko w bieżącym wątku
+    if workers is None:
+        workers = os.cpu_count() or 1
+    center = (width // 2, height // 2)
+    if radius is None:
+        radius = int(min(width, height) * 0.45)
+    if light is None:
+        light = default_light(center, radius)
+    lights = main_sphere.scene_lights(light, center, radius)
+    materials = main_sphere.current_material_set()
+    shape = (width, height, 3)
+    tiles = image_tiles(width, height, tile_size, center, radius)
+
+    if workers <= 1 or len(tiles) <= 1:
+        framebuffer = np.zeros(shape, dtype=np.uint8)
+        for tile in tiles:
+            shade_tile(framebuffer, tile, center, radius, lights, materials)
+        return framebuffer
+
+    if executor == "thread":
+        # numpy zwalnia GIL w większości operacji na dużych tablicach, więc wątki piszą do zwykłej tablicy
+        framebuffer = np.zeros(shape, dtype=np.uint8)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for _ in pool.map(lambda tile: shade_tile(framebuffer, tile, center, radius, lights, materials), tiles):
+                pass
+        return framebuffer
+
+    framebuffer_memory = shared_memory.SharedMemory(create=True, size=width * height * 3)
+    try:
+        framebuffer = np.ndarray(shape, dtype=np.uint8, buffer=framebuffer_memory.buf)
+        framebuffer[:] = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_shade_tile_worker, framebuffer_memory.name, shape, tile, center, radius, lights,
+                                   materials) for tile in tiles]
+            for future in futures:
+                future.result()
+        image = framebuffer.copy()
+        del framebuffer
+    finally:
+        framebuffer_memory.close()
+        framebuffer_memory.unlink()
+    return image
+
+
+def save_image(image, file_path):
+    # zapis bez otwierania okna - format wynika z rozszerzenia (png, jpg, bmp, tga)
+    pygame.image.save(pygame.surfarray.make_surface(image), file_path)
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline Phong sphere render, shaded in tiles by a worker pool")
+    parser.add_argument("output", help="image file, e.g. sphere.png")
+    parser.add_argument("--size", type=parse_size, default=(3840, 2160), help="WIDTHxHEIGHT")
+    parser.add_argument("--radius", type=int, default=None)
+    parser.add_argument("--material", type=int, default=main_sphere.current_material, choices=range(4))
+    parser.add_argument("--lights", type=int, default=main_sphere.extra_light_count,
+                        help="extra coloured lights around the sphere")
+    parser.add_argument("--tile", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--executor", default="process", choices=["process", "thread"])
+    args = parser.parse_args()
+
+    main_sphere.current_material = args.material
+    main_sphere.extra_light_count = args.lights
+    main_sphere.setup_material()
+    start = time.perf_counter()
+    image = render_sphere(*args.size, radius=args.radius, tile_size=args.tile, workers=args.workers,
+                          executor=args.executor)
+    print(f'{args.size[0]}x{args.size[1]}: {time.perf_counter() - start:.2f} s')
+    save_image(image, args.output)
@@ -0,0 +1,263 @@
+import argparse
+import json
+import logging
+import math
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from bsptree import BSPNode, BuildStats, FlatBSPTree, Polygon, concat_ranges, split_by_plane
+from scene_loader import iter_scene_blocks, scene_hash, split_polygons
+
+
+WORLD_FORMAT = "bsp-world"
+WORLD_FORMAT_VERSION = 1
+MANIFEST_NAME = "world.json"
+
+logger = logging.getLogger(__name__)
+
+
+def polygon_ranges(vertices, offsets, axis):
+    starts = offsets[:-1]
+    return (np.minimum.reduceat(vertices[:, axis], starts), np.maximum.reduceat(vertices[:, axis], starts))
+
+
+def split_at_grid(vertices, offsets, axis, chunk_size, epsilon=1e-9):
+    # dzieli wielokąty na liniach siatki axis = k * chunk_size, aż każdy mieści się w jednym pasie siatki;
+    # w każdym przebiegu wielokąt wystający z pasu swojego najmniejszego wierzchołka jest cięty na jego granicy
+    done_vertices, done_counts = [], []
+    while len(offsets) > 1:
+        low, high = polygon_ranges(vertices, offsets, axis)
+        boundary = (np.floor(low / chunk_size + epsilon) + 1) * chunk_size
+        spanning = high - boundary > epsilon
+        counts = np.diff(offsets)
+        keep = np.repeat(~spanning, counts)
+        done_vertices.append(vertices[keep])
+        done_counts.append(counts[~spanning])
+        if not np.any(spanning):
+            break
+
+        vertex_ids = np.repeat(spanning, counts)
+        vertices = vertices[vertex_ids]
+        offsets = np.zeros(np.count_nonzero(spanning) + 1, dtype=np.int64)
+        np.cumsum(counts[spanning], out=offsets[1:])
+        distances = np.repeat(boundary[spanning], counts[spanning]) - vertices[:, axis]
+        front_vertices, front_offsets, back_vertices, back_offsets = split_by_plane(vertices, offsets, distances)
+        # część przed płaszczyzną leży już w pasie, część za nią może wystawać dalej - wraca do pętli
+        front_counts = np.diff(front_offsets)
+        valid = np.repeat(front_counts >= 3, front_counts)
+        done_vertices.append(front_vertices[valid])
+        done_counts.append(front_counts[front_counts >= 3])
+        back_counts = np.diff(back_offsets)
+        vertices = back_vertices[np.repeat(back_counts >= 3, back_counts)]
+        offsets = np.zeros(np.count_nonzero(back_counts >= 3) + 1, dtype=np.int64)
+        np.cumsum(back_counts[back_counts >= 3], out=offsets[1:])
+
+    counts = np.concatenate(done_counts) if done_counts else np.zeros(0, dtype=np.int64)
+    result_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=result_offsets[1:])
+    result_vertices = np.concatenate(done_vertices) if done_vertices else np.zeros((0, 3), dtype=np.float64)
+    return result_vertices, result_offsets
+
+
+def chunk_keys(vertices, offsets, chunk_size):
+    # komórka siatki (x, z) środka każdego wielokąta
+    counts = np.diff(offsets)
+    centers = np.add.reduceat(vertices[:, [0, 2]], offsets[:-1], axis=0) / counts[:, None]
+    return np.floor(centers / chunk_size).astype(np.int64)
+
+
+def chunk_name(key):
+    return f'chunk_{key[0]}_{key[1]}.bsp'
+
+
+def build_world(scene_file, world_dir, chunk_size=32.0, strategy="strided", block_bytes=1 << 24, **options):
+    # dzieli scenę na kolumny chunk_size x chunk_size w płaszczyźnie xz i buduje osobne drzewo BSP dla każdej;
+    # plik sceny jest czytany blokami, a wielokąty kolumn trafiają najpierw do plików tymczasowych, więc w pamięci
+    # jest naraz tylko jeden blok albo jedna kolumna
+    os.makedirs(world_dir, exist_ok=True)
+    source_hash = scene_hash(scene_file, salt=strategy)
+    spill_dir = tempfile.mkdtemp(prefix="spill_", dir=world_dir)
+    try:
+        spilled = {}
+        for vertices, counts in iter_scene_blocks(scene_file, np.float64, block_bytes):
+            if len(counts) == 0:
+                continue
+            offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            vertices, offsets = split_at_grid(vertices, offsets, 0, chunk_size)
+            vertices, offsets = split_at_grid(vertices, offsets, 2, chunk_size)
+            keys = chunk_keys(vertices, offsets, chunk_size)
+            order = np.lexsort((keys[:, 1], keys[:, 0]))
+            keys = keys[order]
+            first = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+            counts = np.diff(offsets)
+            for start, group in zip(np.concatenate([[0], first]), np.split(order, first)):
+                key = tuple(keys[start].tolist())
+                polygon_vertices = vertices[concat_ranges(offsets[group], counts[group])]
+                base = os.path.join(spill_dir, f'{key[0]}_{key[1]}')
+                with open(base + ".vertices", "ab") as f:
+                    f.write(polygon_vertices.tobytes())
+                with open(base + ".counts", "ab") as f:
+                    f.write(counts[group].tobytes())
+                spilled[key] = base
+
+        chunks = []
+        for key, base in sorted(spilled.items()):
+            counts = np.fromfile(base + ".counts", dtype=np.int64)
+            vertices = np.fromfile(base + ".vertices", dtype=np.float64).reshape(-1, 3)
+            offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            stats = BuildStats()
+            root = BSPNode([Polygon(points) for points in split_polygons(vertices, offsets)])
+            root.build_tree(strategy=strategy, stats=stats, **options)
+            tree = FlatBSPTree.from_node(root)
+            file_name = chunk_name(key)
+            tree.save(os.path.join(world_dir, file_name), source_hash)
+            chunks.append({"key": list(key), "file": file_name, "polygons": int(len(counts)),
+                           "bytes": os.path.getsize(os.path.join(world_dir, file_name)),
+                           "bounds_min": vertices.min(axis=0).tolist(), "bounds_max": vertices.max(axis=0).tolist()})
+            logger.debug("chunk %s: %d polygons, %s", key, len(counts), stats)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    manifest = {"format": WORLD_FORMAT, "version": WORLD_FORMAT_VERSION, "scene_hash": source_hash,
+                "chunk_size": chunk_size, "chunks": chunks}
+    with open(os.path.join(world_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def load_manifest(world_dir):
+    with open(os.path.join(world_dir, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != WORLD_FORMAT or manifest.get("version") != WORLD_FORMAT_VERSION:
+        raise ValueError(f'{world_dir}: unsupported world version {manifest.get("version")}')
+    return manifest
+
+
+class WorldPager:
+    # trzyma w pamięci kolumny świata w promieniu load_radius od kamery: update() co klatkę tylko zleca brakujące
+    # kolumny wątkowi w tle i zwalnia najdawniej używane spoza promienia, gdy suma rozmiarów przekracza
+    # memory_budget - pętla główna nigdy nie czeka na dysk. Drzewa są czytane w całości (mmap=False), żeby
+    # odczyt odbył się w wątku, a nie przy pierwszym dostępie do stron podczas rysowania
+    def __init__(self, world_dir, load_radius=64.0, memory_budget=256 << 20, mmap=False):
+        self.world_dir = world_dir
+        self.manifest = load_manifest(world_dir)
+        self.chunk_size = self.manifest["chunk_size"]
+        self.chunks = {tuple(entry["key"]): entry for entry in self.manifest["chunks"]}
+        self.load_radius = load_radius
+        self.memory_budget = memory_budget
+        self.mmap = mmap
+        self.loaded = OrderedDict()     # klucz -> FlatBSPTree, od najdawniej używanej
+        self.memory_used = 0
+        self.version = 0                # rośnie przy każdej zmianie zbioru wczytanych kolumn
+        self.wanted = set()
+        self._pending = set()
+        self._lock = threading.Condition()
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._load_chunks, daemon=True)
+        self._thread.start()
+
+    def chunks_in_radius(self, camera_pos):
+        # klucze kolumn, których kwadrat leży bliżej niż load_radius od kamery (w xz), od najbliższej
+        position = np.array([camera_pos[0], camera_pos[2]], dtype=np.float64)
+        size = self.chunk_size
+        low = np.floor((position - self.load_radius) / size).astype(np.int64)
+        high = np.floor((position + self.load_radius) / size).astype(np.int64)
+        keys = []
+        for x in range(low[0], high[0] + 1):
+            for z in range(low[1], high[1] + 1):
+                if (x, z) not in self.chunks:
+                    continue
+                cell_min = np.array([x, z], dtype=np.float64) * size
+                gap = np.maximum(np.maximum(cell_min - position, position - cell_min - size), 0)
+                distance = math.hypot(gap[0], gap[1])
+                if distance <= self.load_radius:
+                    keys.append((distance, (x, z)))
+        return [key for _, key in sorted(keys)]
+
+    def update(self, camera_pos):
+        wanted = self.chunks_in_radius(camera_pos)
+        with self._lock:
+            self.wanted = set(wanted)
+            for key in wanted:
+                if key in self.loaded:
+                    self.loaded.move_to_end(key)
+                elif key not in self._pending:
+                    self._pending.add(key)
+                    self._requests.put(key)
+            self._evict()
+
+    def _evict(self):
+        # najpierw najdawniej używane; kolumn w promieniu nie zwalniamy, nawet gdy nie mieszczą się w budżecie
+        for key in list(self.loaded):
+            if self.memory_used <= self.memory_budget:
+                break
+            if key in self.wanted:
+                continue
+            del self.loaded[key]
+            self.memory_used -= self.chunks[key]["bytes"]
+            self.version += 1
+
+    def _load_chunks(self):
+        while True:
+            key = self._requests.get()
+            if key is None:
+                return
+            with self._lock:
+                stale = key not in self.wanted
+            tree = None
+            if not stale:
+                try:
+                    tree = FlatBSPTree.load(os.path.join(self.world_dir, self.chunks[key]["file"]),
+                                            self.manifest["scene_hash"], mmap=self.mmap)
+                except (OSError, ValueError) as error:
+                    logger.warning("chunk %s: %s", key, error)
+            with self._lock:
+                self._pending.discard(key)
+                if tree is not None and key in self.wanted and key not in self.loaded:
+                    self.loaded[key] = tree
+                    self.memory_used += self.chunks[key]["bytes"]
+                    self.version += 1
+                    self._evict()
+                self._lock.notify_all()
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def wait(self, timeout=None):
+        # do testów i benchmarków: czeka, aż wątek wczyta wszystkie zlecone kolumny
+        with self._lock:
+            return self._lock.wait_for(lambda: not self._pending, timeout)
+
+    def visible_chunks(self, camera_pos):
+        # wczytane kolumny w promieniu od najdalszej do najbliższej: najpierw kolumny dalsze w x, a w nich dalsze
+        # w z - taka kolejność to przejście drzewa BSP z płaszczyzn siatki, więc malarz działa też między nimi
+        camera_cell = np.floor(np.array([camera_pos[0], camera_pos[2]]) / self.chunk_size).astype(np.int64)
+        with self._lock:
+            items = [(key, tree) for key, tree in self.loaded.items() if key in self.wanted]
+        items.sort(key=lambda item: (-abs(item[0][0] - camera_cell[0]), -abs(item[0][1] - camera_cell[1])))
+        return items
+
+    def close(self):
+        self._requests.put(None)
+        self._thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split a scene into chunks with prebuilt BSP trees for paging")
+    parser.add_argument("scene", help="scene file in the polygons.txt format")
+    parser.add_argument("world_dir")
+    parser.add_argument("--chunk-size", type=float, default=32.0)
+    parser.add_argument("--strategy", default="strided")
+    args = parser.parse_args()
+
+    manifest = build_world(args.scene, args.world_dir, args.chunk_size, args.strategy)
+    print(f'{len(manifest["chunks"])} chunks, {sum(c["polygons"] for c in manifest["chunks"])} polygons')